@@ -1,13 +1,16 @@
 import os
-import time
-import random
 import re
-import cloudscraper
 import requests
-from requests.exceptions import ConnectionError, Timeout
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 
+from series_summary import refresh_series_summary
+from search_index import index_series
+from local_mirror import LocalMirror
+from page_archive import create_fetcher
+from batch_writer import BatchWriter
+from retry_policy import policy
+
 # --- CONFIGURATION ---
 load_dotenv('.env.local')
 
@@ -26,21 +29,14 @@ HEADERS = {
 }
 
 # --- SINGLE SESSION SETUP ---
-scraper = cloudscraper.create_scraper()
+scraper = create_fetcher()  # HTTP first, the browser for JS-rendered chapter lists
 db_session = requests.Session()
 db_session.headers.update(HEADERS)
+chapter_writer = BatchWriter("chapters", "return=minimal")  # Don't need huge response
 
 def safe_db_request(method, url, **kwargs):
-    """Retries DB requests on connection failure"""
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            res = db_session.request(method, url, **kwargs)
-            return res
-        except (ConnectionError, Timeout) as e:
-            print(f"   [DB Connection Lost] Waiting 30s... (Attempt {attempt+1}/{max_retries})")
-            time.sleep(30)
-    raise ConnectionError("Failed to connect to Supabase after retries")
+    """Retries DB requests on connection failure / 5xx (see retry_policy.py)"""
+    return policy.request(db_session, method, url, **kwargs)
 
 print("Starting Asura-Specific Deep Repair V5 (HARD RESET MODE)...")
 print("1. Wipes chapters explicitly.")
@@ -50,11 +46,11 @@ print("3. Pauses for confirmation.")
 # Priority Input
 target_title_input = input("Enter specific title (or Enter for ALL): ").strip().lower()
 
-# 1. Get all series
-url = f"{SUPABASE_URL}/rest/v1/series?select=id,description,title"
+# 1. Get all series (local replica, synced incrementally)
+mirror = LocalMirror()
 try:
-    res = safe_db_request('GET', url)
-    series_list = res.json()
+    mirror.sync()
+    series_list = mirror.all_series()
 except Exception as e:
     print(f"Error fetching series: {e}")
     exit(1)
@@ -139,15 +135,20 @@ for item in series_list:
             continue
         else:
             print("   [Verified] 0 Chapters remain. Clean slate confirmed.")
+            mirror.forget_chapters(s_id)
 
         # --- PHASE 2: UPDATE SERIES ---
         patch_url = f"{SUPABASE_URL}/rest/v1/series?id=eq.{s_id}"
         patch_payload = {"title": real_title, "description": real_desc}
-        patch_res = safe_db_request('PATCH', patch_url, json=patch_payload)
+        patch_res = safe_db_request('PATCH', patch_url, json=patch_payload, idempotent=True)
         
         print(f"   [Series Update] Status: {patch_res.status_code}")
         if patch_res.status_code >= 300:
              print(f"   Response: {patch_res.text}")
+        else:
+             mirror.record_series({**patch_payload, "id": s_id})
+             # Old description still carries the source URL, whose slug is kept as an alternate title
+             index_series([{"id": s_id, "title": real_title, "description": desc}])
 
         # --- PHASE 3: ADD CHAPTERS ---
         chapter_data = []
@@ -180,19 +181,12 @@ for item in series_list:
                     })
         
         if chapter_data:
-             batch_url = f"{SUPABASE_URL}/rest/v1/chapters"
-             # Use merge-duplicates just in case, but we wiped so it should be insert.
-             upsert_headers = HEADERS.copy()
-             upsert_headers["Prefer"] = "return=minimal" # Don't need huge response
-             
-             # Batch 100
-             for i in range(0, len(chapter_data), 100):
-                 batch = chapter_data[i:i+100]
-                 res = safe_db_request('POST', batch_url, headers=upsert_headers, json=batch)
-                 if res.status_code >= 300:
-                     print(f"   [Error] Insert batch failed: {res.text}")
-             
-             print(f"   [SUCCESS] Added {len(chapter_data)} Clean Chapters.")
+             # Written right away (not buffered): the pause below is for checking the site
+             written = chapter_writer.write(chapter_data)
+             mirror.record_chapters(written)
+             print(f"   [SUCCESS] Added {len(written)}/{len(chapter_data)} Clean Chapters.")
+
+        refresh_series_summary([s_id])
         
         # --- PAUSE FOR USER ---
         input("   >> Press Enter to confirm check on website & continue...")
@@ -200,4 +194,6 @@ for item in series_list:
     except Exception as e:
         print(f"   [Error] {e}")
 
+print(scraper.summary())
+scraper.close()
 print("V5 Hard Reset Complete.")
@@ -1,12 +1,20 @@
 import os
 import time
 import random
-import re
+import argparse
+import asyncio
+from collections import defaultdict
 import cloudscraper
-import requests
-from bs4 import BeautifulSoup
+import httpx
 from dotenv import load_dotenv
-from urllib.parse import urljoin
+from urllib.parse import urlparse
+
+from series_summary import refresh_series_summary, refresh_series_summary_async
+from local_mirror import LocalMirror
+from page_parsers import ParsePool, PARSE_WORKERS, parse_universal
+from run_metrics import metrics
+from batch_writer import BatchWriter
+from tiered_fetch import TieredFetcher, BlockingFetcher, SERIES_MARKERS, SERIES_WAIT
 
 # Load environment variables
 load_dotenv('.env.local')
@@ -25,46 +33,76 @@ HEADERS = {
     "Prefer": "return=representation"
 }
 
+# Reads come from the local replica (one incremental sync per run); only inserts go to Supabase
+mirror = LocalMirror()
+
 def get_all_series():
-    url = f"{SUPABASE_URL}/rest/v1/series?select=id,title,description&status=eq.ongoing"
-    try:
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code == 200:
-            return response.json()
-        print(f"Error fetching series: {response.text}")
-        return []
-    except Exception as e:
-        print(f"Error fetching series: {e}")
-        return []
+    return mirror.all_series(status='ongoing')
 
 def get_existing_chapters(series_id):
-    url = f"{SUPABASE_URL}/rest/v1/chapters?series_id=eq.{series_id}&select=chapter_number"
-    try:
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code == 200:
-            return {c['chapter_number'] for c in response.json()}
-        return set()
-    except Exception as e:
-        # If it's a 404/empty, just return empty set
-        return set()
-
-def backfill_chapters():
+    return mirror.chapter_numbers(series_id)
+
+def get_source_url(series):
+    description = series.get('description', '') or ''
+    source_url = description.replace('Imported from ', '').strip()
+    return source_url if source_url.startswith('http') else None
+
+def extract_chapters(pool, html, source_url):
+    """Returns [(chapter_number, full_url)] for every distinct chapter link on a series page."""
+    with metrics.timer("parse", page="series"):
+        return pool.parse(parse_universal, html, source_url)["chapters"]
+
+def build_rows(series_id, chapters, existing_chapters):
+    # Dedupe against database; clean title "Chapter X" (:g removes trailing zeros if integer)
+    return [{
+        "series_id": series_id,
+        "title": f"Chapter {chap_num:g}",
+        "chapter_number": chap_num,
+        "source_url": full_url
+    } for chap_num, full_url in chapters if chap_num not in existing_chapters]
+
+def record_written(written):
+    # Rows only reach the mirror/summaries once their batch has actually landed
+    if not written:
+        return
+    mirror.record_chapters(written)
+    with metrics.timer("db.refresh"):
+        refresh_series_summary({row['series_id'] for row in written})
+
+def report(chapters, rows):
+    if rows:
+        return
+    if chapters:
+        print(f"  [INFO] Found {len(chapters)} chapters (all already exist).")
+        metrics.count("series", outcome="unchanged")
+    else:
+        print(f"  [WARNING] Found 0 chapters. Check selectors/regex.")
+        metrics.count("series", outcome="empty")
+
+def backfill_chapters(parse_workers=PARSE_WORKERS):
     print("=== Supabase Chapter Backfiller (Universal Discovery) ===")
-    
+    metrics.start("backfill_chapters")
+
+    with metrics.timer("mirror.sync"):
+        mirror.sync()
     series_list = get_all_series()
     print(f"Found {len(series_list)} series to check.")
-    
-    scraper = cloudscraper.create_scraper()
-    
+
+    # Same fetch path as the async pipeline: cloudscraper first, the browser for JS-rendered chapter lists
+    scraper = BlockingFetcher(cloudscraper.create_scraper(), SERIES_MARKERS, SERIES_WAIT)
+    # Same parse stage as the async pipeline (see page_parsers.py)
+    pool = ParsePool(parse_workers)
+    # New chapters from many series share batches (see batch_writer.py)
+    writer = BatchWriter("chapters")
+
     for i, series in enumerate(series_list):
         series_id = series['id']
         title = series['title']
-        description = series.get('description', '') or ''
-        
+
         # 1. Extract URL
-        source_url = description.replace('Imported from ', '').strip()
-        
-        if not source_url.startswith('http'):
+        source_url = get_source_url(series)
+
+        if not source_url:
             # print(f"[{i+1}/{len(series_list)}] Skipping '{title}': No valid URL.")
             continue
 
@@ -73,94 +111,172 @@ def backfill_chapters():
 
         # Fetch existing chapters to avoid duplicates
         existing_chapters = get_existing_chapters(series_id)
-        
+
         try:
-            # 2. Universal Scrape
+            # 2. Universal Scrape (fetch metrics are recorded per tier by the fetcher)
             response = scraper.get(source_url)
             if response.status_code != 200:
                 print(f"  [ERROR] Failed to fetch. Status: {response.status_code}")
+                metrics.count("series", outcome="failed")
                 continue
 
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # 3. Find ALL Links
-            all_links = soup.find_all('a', href=True)
-            
-            chapters_to_insert = []
-            seen_nums = set()
-            
-            for link in all_links:
-                href = link['href']
-                text = link.get_text(strip=True)
-                
-                # 4. Filter: Link or text must match 'chapter' (case-insensitive)
-                if 'chapter' not in href.lower() and 'chapter' not in text.lower():
-                    continue
-                
-                # 5. Data Extraction
-                chap_num = None
-                
-                # Try regex on text (Handle "Chapter 14", "Chapter14", "Ch. 14")
-                # now allows 0 spaces
-                match_text = re.search(r'(?:Chapter|Ch\.?|Ep\.?)\s*(\d+(\.\d+)?)', text, re.IGNORECASE)
-                if match_text:
-                    chap_num = float(match_text.group(1))
-                else:
-                    # Fallback: Try regex on HREF "chapter/14"
-                    match_href = re.search(r'chapter/(\d+(\.\d+)?)', href, re.IGNORECASE)
-                    if match_href:
-                        chap_num = float(match_href.group(1))
+            chapters = extract_chapters(pool, response.content, source_url)
+            chapters_to_insert = build_rows(series_id, chapters, existing_chapters)
 
-                if chap_num is None:
-                    continue
-                
-                # Dedupe within this run
-                if chap_num in seen_nums:
-                    continue
-                
-                # Dedupe against database
-                if chap_num in existing_chapters:
-                    continue
-                    
-                seen_nums.add(chap_num)
-                
-                # Clean title: "Chapter X"
-                chap_title = f"Chapter {chap_num:g}" # :g removes trailing zeros if integer
-                
-                # Handle relative URL
-                full_url = urljoin(source_url, href)
-                
-                chapters_to_insert.append({
-                    "series_id": series_id,
-                    "title": chap_title,
-                    "chapter_number": chap_num,
-                    "source_url": full_url
-                })
-            
             found_count = len(chapters_to_insert)
-            
+
             if found_count > 0:
-                # Batch Insert
-                url = f"{SUPABASE_URL}/rest/v1/chapters"
-                res = requests.post(url, headers=HEADERS, json=chapters_to_insert)
-                if res.status_code < 300:
-                    print(f"  [SUCCESS] Found {found_count} new chapters.")
-                else:
-                    print(f"  [ERROR] Insert failed: {res.text}")
+                print(f"  [SUCCESS] Found {found_count} new chapters.")
+                metrics.count("series", outcome="inserted")
+                record_written(writer.add(chapters_to_insert))
             else:
-                total_found = len(seen_nums) # Includes existing ones we skipped
-                if total_found > 0:
-                     print(f"  [INFO] Found {total_found} chapters (all already exist).")
-                else:
-                     print(f"  [WARNING] Found 0 chapters. Check selectors/regex.")
+                report(chapters, chapters_to_insert)
 
         except Exception as e:
             print(f"  [CRITICAL] Error: {e}")
+            metrics.count("series", outcome="failed")
 
         # Safety Sleep
         sleep_time = random.uniform(3, 6)
         # print(f"  Sleeping {sleep_time:.2f}s...")
         time.sleep(sleep_time)
 
+    record_written(writer.close())
+    print(writer.summary())
+    print(scraper.summary())
+    scraper.close()
+    pool.close()
+    metrics.finish()
+
+# --- Async Pipeline Mode ---
+# series -> [fetch queue] -> fetchers (per source host limit) -> [insert queue] -> batch writer (Supabase limit)
+# Both queues are bounded, so a slow stage stalls the one before it instead of piling up pages in memory.
+
+DONE = object()
+
+async def backfill_chapters_async(source_concurrency=4, db_concurrency=4, queue_size=16, delay=(1, 3),
+                                  parse_workers=PARSE_WORKERS):
+    print("=== Supabase Chapter Backfiller (Async Pipeline) ===")
+    metrics.start("backfill_chapters")
+
+    with metrics.timer("mirror.sync"):
+        mirror.sync()
+    series_list = get_all_series()
+    print(f"Found {len(series_list)} series to check. "
+          f"Source limit {source_concurrency}/host, DB limit {db_concurrency}, {parse_workers} parse workers.")
+
+    fetch_queue = asyncio.Queue(maxsize=queue_size)
+    insert_queue = asyncio.Queue(maxsize=queue_size)
+    host_limits = defaultdict(lambda: asyncio.Semaphore(source_concurrency))
+    # Raw page bytes go to the pool, only (number, url) tuples come back
+    pool = ParsePool(parse_workers)
+    stats = {"checked": 0, "inserted": 0, "failed": 0}
+    fetchers = max(source_concurrency * 2, 1)
+    # Rows from all series are re-cut into byte-sized batches; db_concurrency of them in flight at once
+    writer = BatchWriter("chapters", workers=max(db_concurrency, 1))
+
+    async def produce():
+        for series in series_list:
+            source_url = get_source_url(series)
+            if source_url:
+                await fetch_queue.put((series, source_url))
+        for _ in range(fetchers):
+            await fetch_queue.put(DONE)
+
+    async def fetch_worker(fetcher):
+        while True:
+            item = await fetch_queue.get()
+            if item is DONE:
+                return
+            series, source_url = item
+            try:
+                async with host_limits[urlparse(source_url).netloc]:
+                    # cloudscraper first; pages whose chapter list is JS-rendered escalate to the browser
+                    response = await fetcher.fetch(source_url, SERIES_MARKERS, SERIES_WAIT)
+                    # Hold the host slot through the pause so the per-host rate stays polite
+                    await asyncio.sleep(random.uniform(*delay))
+                if response.status != 200:
+                    print(f"  [ERROR] {series['title']}: Failed to fetch. Status: {response.status}")
+                    stats["failed"] += 1
+                    metrics.count("series", outcome="failed")
+                    continue
+                with metrics.timer("parse", page="series"):
+                    chapters = (await pool.parse_async(parse_universal, response.content, source_url))["chapters"]
+                rows = build_rows(series['id'], chapters, get_existing_chapters(series['id']))
+                stats["checked"] += 1
+                if rows:
+                    await insert_queue.put((series, rows))
+                else:
+                    report(chapters, rows)
+            except Exception as e:
+                print(f"  [CRITICAL] {series['title']}: {e}")
+                stats["failed"] += 1
+                metrics.count("series", outcome="failed")
+
+    async def record(client, written):
+        if not written:
+            return
+        mirror.record_chapters(written)
+        stats["inserted"] += len(written)
+        with metrics.timer("db.refresh"):
+            await refresh_series_summary_async(client, list({row['series_id'] for row in written}))
+
+    async def write_stage(client):
+        # Single consumer; the writer's own threads do the parallel POSTs
+        while True:
+            item = await insert_queue.get()
+            if item is DONE:
+                break
+            series, rows = item
+            print(f"  [SUCCESS] {series['title']}: Found {len(rows)} new chapters.")
+            metrics.count("series", outcome="inserted")
+            await record(client, await asyncio.to_thread(writer.add, rows))
+        await record(client, await asyncio.to_thread(writer.close))
+
+    started = time.perf_counter()
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        fetcher = TieredFetcher(client, session=cloudscraper.create_scraper())
+        feed_tasks = [asyncio.create_task(produce())] + [asyncio.create_task(fetch_worker(fetcher)) for _ in range(fetchers)]
+
+        async def feed():
+            await asyncio.gather(*feed_tasks)
+            await insert_queue.put(DONE)
+
+        stages = [asyncio.create_task(feed()), asyncio.create_task(write_stage(client))]
+        try:
+            # A stage that dies must not leave the others blocked on a full queue: stop at the first error
+            done, _ = await asyncio.wait(stages, return_when=asyncio.FIRST_EXCEPTION)
+            for stage in done:
+                stage.result()
+        except Exception:
+            metrics.finish("error")
+            raise
+        finally:
+            for task in feed_tasks + stages:
+                task.cancel()
+            await asyncio.gather(*feed_tasks, *stages, return_exceptions=True)
+            await fetcher.close()
+            pool.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"\nChecked {stats['checked']} series, inserted {stats['inserted']} chapters, "
+          f"{stats['failed']} failures in {elapsed:.0f}s.")
+    print(fetcher.summary())
+    print(writer.summary())
+    metrics.finish()
+
 if __name__ == "__main__":
-    backfill_chapters()
+    parser = argparse.ArgumentParser(description="Backfill missing chapters for ongoing series.")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Run the concurrent pipeline")
+    parser.add_argument("--source-concurrency", type=int, default=4, help="Parallel fetches per source host")
+    parser.add_argument("--db-concurrency", type=int, default=4, help="Parallel Supabase writes")
+    parser.add_argument("--queue-size", type=int, default=16, help="Bound on pages/rows waiting between stages")
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS, help="Processes parsing series pages")
+    args = parser.parse_args()
+
+    if args.use_async:
+        asyncio.run(backfill_chapters_async(args.source_concurrency, args.db_concurrency, args.queue_size,
+                                            parse_workers=args.parse_workers))
+    else:
+        backfill_chapters(args.parse_workers)
@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+from dotenv import load_dotenv
+
+from retry_policy import policy
+from run_metrics import metrics
+
+load_dotenv('.env.local')
+
+SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+SUPABASE_KEY = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+
+HEADERS = {
+    "apikey": SUPABASE_KEY,
+    "Authorization": f"Bearer {SUPABASE_KEY}",
+    "Content-Type": "application/json",
+    "Prefer": "return=representation"
+}
+
+# Rows are buffered across series and cut into batches by request-body bytes. The byte budget
+# follows the observed latency: fast full batches grow it, slow or failed ones shrink it. A batch
+# that PostgREST rejects is split in halves until the bad row(s) are isolated; everything else lands.
+# Transient errors are retried by the shared policy first (retry_policy.py); for plain inserts that
+# only covers failures where the batch provably didn't land, since a resend would duplicate rows.
+
+WRITE_WORKERS = int(os.getenv("WRITE_WORKERS", "4"))
+START_BYTES = 256 * 1024
+MIN_BYTES = 8 * 1024
+MAX_BYTES = 2 * 1024 * 1024
+TARGET_SECONDS = 2.0
+
+def row_bytes(row):
+    return len(json.dumps(row)) + 1
+
+class BatchWriter:
+    """
+    path:   REST path, e.g. "chapters" or "chapters?on_conflict=series_id,chapter_number"
+    prefer: Prefer header; with return=minimal the sent rows are handed back instead
+
+    add(rows) / flush() return the rows whose batches have landed since the last call, so the
+    caller can record them (mirror, summaries) on its own thread.
+    """
+
+    def __init__(self, path="chapters", prefer="return=representation", workers=WRITE_WORKERS):
+        self.url = f"{SUPABASE_URL}/rest/v1/{path}"
+        self.table = path.split('?')[0]
+        self.headers = HEADERS.copy()
+        self.headers['Prefer'] = prefer
+        self.returns_rows = "return=representation" in prefer
+        self.idempotent = "on_conflict=" in path  # Plain inserts must not be resent after an unclear failure
+        self.session = requests.Session()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.max_in_flight = workers * 2
+        self.budget = START_BYTES
+        self.lock = threading.Lock()
+        self.buffer, self.buffer_bytes = deque(), 0  # (row, encoded size)
+        self.in_flight = set()
+        self.stats = {"rows": 0, "batches": 0, "splits": 0}
+        self.rejected = []  # (row, error) that failed even on their own
+
+    # --- Tuning ---
+
+    def _tune(self, size, seconds, ok):
+        with self.lock:
+            if not ok:
+                # A small split-retry batch failing says nothing about the batch size
+                if size >= self.budget // 2:
+                    self.budget = max(MIN_BYTES, self.budget // 2)
+            elif seconds > TARGET_SECONDS:
+                self.budget = max(MIN_BYTES, int(self.budget * TARGET_SECONDS / seconds))
+            elif seconds < TARGET_SECONDS / 2 and size >= self.budget * 0.8:
+                # Only full batches say anything about whether a bigger one would be fine
+                self.budget = min(MAX_BYTES, int(self.budget * 1.5))
+
+    # --- Sending (worker threads) ---
+
+    def _post(self, batch):
+        size = sum(row_bytes(row) for row in batch)
+        started = time.perf_counter()
+        try:
+            with metrics.timer("db.write", table=self.table):
+                response = policy.request(self.session, "POST", self.url, headers=self.headers, json=batch, timeout=60,
+                                          idempotent=self.idempotent)
+        except requests.RequestException as e:
+            self._tune(size, time.perf_counter() - started, False)
+            return None, str(e)
+        seconds = time.perf_counter() - started
+        if response.status_code < 300:
+            self._tune(size, seconds, True)
+            return response, None
+        # 413 and timeouts mean "too big/slow"; a 400/409 is about the rows, not the size
+        self._tune(size, seconds, response.status_code not in policy.retry_status | {413})
+        return response, f"{response.status_code} {response.text[:200]}"
+
+    def _send(self, batch):
+        response, error = self._post(batch)
+        if error is None:
+            with self.lock:
+                self.stats["batches"] += 1
+            rows = response.json() if self.returns_rows and response.content else batch
+            metrics.count("rows_written", len(rows), table=self.table)
+            return rows
+
+        if response is None or response.status_code in policy.retry_status:
+            # Still failing after the policy's retries (or unclear whether it landed): not the rows' fault
+            print(f"  [WRITER] Gave up on {len(batch)} {self.table} rows: {error}")
+            with self.lock:
+                self.rejected.extend((row, error) for row in batch)
+            metrics.count("rows_rejected", len(batch), table=self.table)
+            return []
+
+        if len(batch) == 1:
+            print(f"  [WRITER] Rejected {self.table} row {batch[0].get('series_id', '')} "
+                  f"#{batch[0].get('chapter_number', '')}: {error}")
+            with self.lock:
+                self.rejected.append((batch[0], error))
+            metrics.count("rows_rejected", table=self.table)
+            return []
+
+        # Halve until the bad row(s) are on their own; the good halves still land
+        with self.lock:
+            self.stats["splits"] += 1
+        middle = len(batch) // 2
+        return self._send(batch[:middle]) + self._send(batch[middle:])
+
+    # --- Public (caller thread) ---
+
+    def _cut(self):
+        batch, size = [], 0
+        while self.buffer and (not batch or size + self.buffer[0][1] <= self.budget):
+            row, row_size = self.buffer.popleft()
+            batch.append(row)
+            size += row_size
+        self.buffer_bytes -= size
+        return batch
+
+    def _submit(self, batch):
+        # Bounded in-flight work: a slow database stalls the producer instead of growing memory
+        written = []
+        if len(self.in_flight) >= self.max_in_flight:
+            written += self._harvest(block=True)
+        self.in_flight.add(self.executor.submit(self._send, batch))
+        return written
+
+    def _harvest(self, block=False):
+        if block:
+            done, _ = wait(self.in_flight, return_when=FIRST_COMPLETED)
+        else:
+            done = {f for f in self.in_flight if f.done()}
+        written = []
+        for future in done:
+            self.in_flight.discard(future)
+            written += future.result()
+        with self.lock:
+            self.stats["rows"] += len(written)
+        return written
+
+    def add(self, rows):
+        written = []
+        for row in rows:
+            row_size = row_bytes(row)
+            self.buffer.append((row, row_size))
+            self.buffer_bytes += row_size
+        while self.buffer_bytes >= self.budget:
+            written += self._submit(self._cut())
+        return written + self._harvest()
+
+    def flush(self):
+        written = []
+        while self.buffer:
+            written += self._submit(self._cut())
+        while self.in_flight:
+            written += self._harvest(block=True)
+        return written
+
+    def write(self, rows):
+        """Unbuffered: everything in `rows` is sent (in parallel batches) before this returns."""
+        return self.add(rows) + self.flush()
+
+    def close(self):
+        written = self.flush()
+        self.executor.shutdown()
+        return written
+
+    def summary(self):
+        return (f"[WRITER] {self.stats['rows']} {self.table} rows in {self.stats['batches']} batches "
+                f"({self.stats['splits']} splits, {len(self.rejected)} rejected), "
+                f"batch budget now {self.budget // 1024}KB.")
@@ -0,0 +1,298 @@
+import asyncio
+import os
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from run_metrics import metrics
+
+# One Chromium per process, handing out pages from a few reusable contexts:
+#   - a context is retired after PAGES_PER_CONTEXT pages (its in-flight pages finish first)
+#   - the whole browser is restarted once its process tree passes MAX_RSS_MB: new pages wait
+#     while the current ones drain, then Chromium is relaunched
+#   - the same happens when Chromium dies (disconnected event, or new_page failing on a dead browser)
+# Cookies (Cloudflare clearance) survive both through a storage-state file that every retired
+# context writes and every new one starts from.
+
+STATE_PATH = os.getenv("BROWSER_STATE_PATH", os.path.join(os.getcwd(), 'browser_state.json'))
+MAX_CONTEXTS = int(os.getenv("BROWSER_CONTEXTS", "2"))
+TABS_PER_CONTEXT = int(os.getenv("BROWSER_TABS_PER_CONTEXT", "4"))
+PAGES_PER_CONTEXT = int(os.getenv("BROWSER_PAGES_PER_CONTEXT", "50"))
+MAX_RSS_MB = int(os.getenv("BROWSER_MAX_RSS_MB", "1200"))
+RSS_CHECK_EVERY = 10  # pages
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+BROWSER_ARGS = [
+    "--disable-blink-features=AutomationControlled",
+    "--no-sandbox",
+    "--disable-setuid-sandbox",
+    "--disable-infobars",
+    "--window-position=0,0",
+    "--ignore-certificate-errors",
+    "--ignore-certificate-errors-spki-list",
+    f"--user-agent={USER_AGENT}"
+]
+
+# STEALTH: Remove webdriver property (applies to every page of the context)
+STEALTH_SCRIPT = """
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => undefined
+    });
+"""
+
+# --- Memory ---
+
+# Both branches below measure PSS where the platform has it and fall back to RSS, so the limit
+# means the same thing with or without psutil. PSS splits shared pages between Chromium's
+# processes; summing RSS would count them once per process.
+
+def _proc_memory_kb(pid):
+    for path, key in ((f"/proc/{pid}/smaps_rollup", "Pss:"), (f"/proc/{pid}/status", "VmRSS:")):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(key):
+                        return int(line.split()[1])
+        except OSError:
+            continue
+    return 0
+
+def _psutil_memory_bytes(proc):
+    try:
+        return proc.memory_full_info().pss  # Linux only
+    except (AttributeError, psutil.AccessDenied):
+        return proc.memory_info().rss
+
+def chromium_rss_mb():
+    """Memory of the Chromium processes started by this process (0 when it can't be measured)."""
+    if psutil is not None:
+        total = 0
+        for child in psutil.Process().children(recursive=True):
+            try:
+                if "chrom" in child.name() or "headless_shell" in child.name():
+                    total += _psutil_memory_bytes(child)
+            except psutil.Error:
+                continue
+        return total / 1024 / 1024
+
+    if not os.path.isdir("/proc"):
+        return 0
+    children = defaultdict(list)
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                children[int(f.read().rsplit(")", 1)[1].split()[1])].append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+
+    total, stack = 0, list(children[os.getpid()])
+    while stack:
+        pid = stack.pop()
+        stack.extend(children[pid])
+        try:
+            with open(f"/proc/{pid}/comm") as f:
+                name = f.read()
+        except OSError:
+            continue
+        if "chrom" in name or "headless_shell" in name:
+            total += _proc_memory_kb(pid)
+    return total / 1024
+
+# --- Manager ---
+
+class _Slot:
+    def __init__(self, context):
+        self.context = context
+        self.active = 0
+        self.served = 0
+        self.retiring = False
+
+class BrowserManager:
+    """
+    async with manager.page() as page:
+        await page.goto(url)
+    """
+
+    def __init__(self, headless=True, max_contexts=MAX_CONTEXTS, pages_per_context=PAGES_PER_CONTEXT,
+                 max_rss_mb=MAX_RSS_MB, state_path=STATE_PATH):
+        self.headless = headless
+        self.max_contexts = max_contexts
+        self.pages_per_context = pages_per_context
+        self.max_rss_mb = max_rss_mb
+        self.state_path = state_path
+        self._playwright = None
+        self.browser = None
+        self.slots = []
+        self.restarting = False
+        self.crashed = False
+        self.released = 0
+        self.last_rss = 0.0
+        self.stats = Counter()
+        self._cond = None
+
+    @property
+    def cond(self):
+        # Created on first use so it binds to the running loop
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    # --- Lifecycle (called with the condition held) ---
+
+    async def _launch(self):
+        if self._playwright is None:
+            # Only scripts that actually hit a JS-rendered page pay for Chromium
+            from playwright.async_api import async_playwright
+            self._playwright = await async_playwright().start()
+        with metrics.timer("browser_launch"):
+            self.browser = await self._playwright.chromium.launch(headless=self.headless, args=BROWSER_ARGS)
+        self.browser.on("disconnected", self._on_disconnected)
+        self.stats["launches"] += 1
+
+    def _on_disconnected(self, browser):
+        # Also fires for our own close(), but _shutdown_browser lets go of the browser first
+        if browser is self.browser:
+            self.crashed = True
+
+    async def _open_context(self):
+        state = self.state_path if os.path.exists(self.state_path) else None
+        context = await self.browser.new_context(viewport={'width': 1920, 'height': 1080}, user_agent=USER_AGENT,
+                                                 storage_state=state)
+        await context.add_init_script(STEALTH_SCRIPT)
+        slot = _Slot(context)
+        self.slots.append(slot)
+        return slot
+
+    async def _close_slot(self, slot):
+        self.slots.remove(slot)
+        if self.crashed:
+            # Nothing left to close, and the last saved cookies are better than none
+            self.stats["contexts_closed"] += 1
+            return
+        try:
+            # Hand the cookies on to the next context
+            await slot.context.storage_state(path=self.state_path)
+            await slot.context.close()
+        except Exception as e:
+            print(f"  [BROWSER] Closing context failed: {e}")
+        self.stats["contexts_closed"] += 1
+
+    async def _shutdown_browser(self):
+        for slot in list(self.slots):
+            await self._close_slot(slot)
+        browser, self.browser = self.browser, None
+        if browser is not None:
+            try:
+                await browser.close()
+            except Exception as e:
+                if not self.crashed:
+                    print(f"  [BROWSER] Closing browser failed: {e}")
+
+    def _begin_restart(self, reason):
+        # New pages wait; the last in-flight page to be released shuts Chromium down
+        self.restarting = True
+        metrics.count("browser_recycles", reason=reason)
+
+    async def _restart_if_idle(self):
+        if self.restarting and not any(s.active for s in self.slots):
+            await self._shutdown_browser()
+            self.restarting = False
+            self.crashed = False
+            self.stats["restarts"] += 1
+
+    def _check_crash(self):
+        if self.browser is not None and not self.browser.is_connected():
+            self.crashed = True
+        if self.crashed and not self.restarting:
+            print("  [BROWSER] Chromium disconnected; relaunching once in-flight pages are released.")
+            self.stats["crashes"] += 1
+            self._begin_restart("crash")
+
+    # --- Pages ---
+
+    async def _acquire(self):
+        async with self.cond:
+            while True:
+                self._check_crash()
+                await self._restart_if_idle()
+                if not self.restarting:
+                    if self.browser is None:
+                        await self._launch()
+                    open_slots = [s for s in self.slots if not s.retiring]
+                    free = [s for s in open_slots if s.active < TABS_PER_CONTEXT]
+                    slot = None
+                    if free:
+                        slot = min(free, key=lambda s: s.active)
+                    elif len(self.slots) < self.max_contexts:
+                        # Retiring contexts count until they have drained, so memory stays bounded
+                        slot = await self._open_context()
+                    if slot is not None:
+                        slot.active += 1
+                        slot.served += 1
+                        if slot.served >= self.pages_per_context:
+                            slot.retiring = True  # No new pages; closed once this one is released
+                        return slot
+                await self.cond.wait()
+
+    async def _release(self, slot, failed=False):
+        async with self.cond:
+            slot.active -= 1
+            if failed:
+                # new_page failed: this context is no good even if the browser survived
+                slot.retiring = True
+            else:
+                self.released += 1
+                self.stats["pages"] += 1
+            self._check_crash()
+            if slot.retiring and slot.active == 0 and not self.restarting:
+                await self._close_slot(slot)
+                metrics.count("browser_recycles", reason="failed" if failed else "pages")
+
+            if not self.restarting and not failed and self.released % RSS_CHECK_EVERY == 0:
+                self.last_rss = chromium_rss_mb()
+                if self.last_rss > self.max_rss_mb:
+                    print(f"  [BROWSER] Chromium at {self.last_rss:.0f}MB (limit {self.max_rss_mb}MB); restarting once idle.")
+                    self._begin_restart("rss")
+
+            await self._restart_if_idle()
+            self.cond.notify_all()
+
+    @asynccontextmanager
+    async def page(self):
+        # One retry: a page that can't be opened retires its context (or relaunches a dead browser)
+        for attempt in range(2):
+            slot = await self._acquire()
+            try:
+                page = await slot.context.new_page()
+                break
+            except Exception:
+                await self._release(slot, failed=True)
+                if attempt:
+                    raise
+        try:
+            yield page
+        finally:
+            try:
+                await page.close()
+            except Exception:
+                pass
+            await self._release(slot)
+
+    async def close(self):
+        async with self.cond:
+            await self._shutdown_browser()
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def summary(self):
+        return (f"[BROWSER] {self.stats['pages']} pages, {self.stats['launches']} launches "
+                f"({self.stats['restarts']} restarts, {self.stats['crashes']} after crashes), {self.stats['contexts_closed']} contexts recycled, "
+                f"last Chromium RSS {self.last_rss:.0f}MB.")
@@ -3,10 +3,15 @@ import time
 import random
 import cloudscraper
 import requests
-from bs4 import BeautifulSoup
 from dotenv import load_dotenv
-from urllib.parse import urljoin
 from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+from search_index import index_series
+from local_mirror import LocalMirror
+from page_parsers import parse_listing
+from run_metrics import metrics
+from retry_policy import policy, RetryingSession
 
 # Load environment variables
 load_dotenv('.env.local')
@@ -25,19 +30,13 @@ HEADERS = {
     "Prefer": "return=representation"
 }
 
+MAX_FAILED_PAGES = 3  # Consecutive pages that still fail after retries before giving up
+
+# Existence checks answer from the local replica; only the upserts go to Supabase
+mirror = LocalMirror()
+
 def get_series_by_title(title):
-    # Sanitize title for URL param
-    safe_title = title.replace("'", "''") 
-    url = f"{SUPABASE_URL}/rest/v1/series?title=eq.{safe_title}&select=id"
-    try:
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code == 200:
-            data = response.json()
-            return data[0] if data else None
-        return None
-    except Exception as e:
-        print(f"Error checking series: {e}")
-        return None
+    return mirror.series_by_title(title)
 
 def upsert_series(title, description, cover_url, source_url):
     try:
@@ -54,90 +53,61 @@ def upsert_series(title, description, cover_url, source_url):
         if existing:
             # Update
             url = f"{SUPABASE_URL}/rest/v1/series?id=eq.{existing['id']}"
-            requests.patch(url, headers=HEADERS, json=payload)
+            with metrics.timer("db.write", table="series"):
+                res = policy.request(requests, "PATCH", url, headers=HEADERS, json=payload, idempotent=True)
+            if res.status_code < 300:
+                mirror.record_series({**payload, "id": existing['id']})
+                metrics.count("series", outcome="updated")
+            else:
+                metrics.count("series", outcome="failed")
+            index_series([{"id": existing['id'], "title": title, "description": description}])
         else:
             # Insert
             url = f"{SUPABASE_URL}/rest/v1/series"
-            res = requests.post(url, headers=HEADERS, json=payload)
+            with metrics.timer("db.write", table="series"):
+                res = policy.request(requests, "POST", url, headers=HEADERS, json=payload)
             if res.status_code < 300:
                 print(f"  [INSERTED] {title}")
+                metrics.count("series", outcome="inserted")
+                mirror.record_series(res.json()[0])
+                index_series([{"id": res.json()[0]['id'], "title": title, "description": description}])
             else:
                 print(f"  [ERROR] Insert failed: {res.text}")
+                metrics.count("series", outcome="failed")
             
     except Exception as e:
         print(f"  [ERROR] Upsert failed for {title}: {e}")
+        metrics.count("series", outcome="failed")
 
 def scrape_page(scraper, url):
+    """Series found on one listing page; None when the page itself could not be fetched."""
     try:
-        response = scraper.get(url)
+        host = urlparse(url).netloc
+        with metrics.timer("fetch", tier="http", host=host):
+            response = scraper.get(url)
+        metrics.count("fetch_bytes", len(response.content), tier="http", host=host)
+        metrics.count("fetch_status", tier="http", host=host, status=response.status_code)
         if response.status_code != 200:
             print(f"  [ERROR] Failed to fetch {url} (Status: {response.status_code})")
-            return 0
+            return None
 
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # --- Universal Selector Strategy ---
-        # 1. Find all links
-        links = soup.find_all('a', href=True)
-        
-        # 2. Filter for 'series/' (Asura uses relative paths like "series/name")
-        series_links = [l for l in links if l.get('href') and ('series/' in l['href'] or 'manga/' in l['href'])]
-        
-        # 3. Deduplicate
-        seen_urls = set()
-        unique_entries = []
-        
-        for link in series_links:
-            href = link['href']
-            # Handle relative URL correctly
-            full_url = urljoin(url, href)
-            
-            if full_url in seen_urls:
-                continue
-            seen_urls.add(full_url)
-            unique_entries.append(link)
+        # --- Universal Selector Strategy (see page_parsers.py) ---
+        with metrics.timer("parse", page="listing"):
+            entries = parse_listing(response.content, url)["series"]
 
         count = 0
-        for link in unique_entries:
-            try:
-                # Extract Data
-                # Title: X-Ray found it in <span class="block text-[13.3px] font-bold">
-                title_span = link.find('span', class_=lambda x: x and 'font-bold' in x and 'block' in x)
-                
-                if title_span:
-                    title = title_span.get_text(strip=True)
-                else:
-                    # Fallback: strict strip
-                    title = link.get_text(strip=True)
-
-                # Filter out "Chapter" or empty titles
-                if not title or (title.startswith("Chapter") and len(title) < 20):
-                    continue
-
-                full_url = urljoin(url, link['href'])
-
-                # Image
-                img_tag = link.find('img')
-                if not img_tag:
-                    # Try finding previous sibling?
-                    pass
-                
-                cover_url = img_tag['src'] if img_tag and 'src' in img_tag.attrs else ""
-                
-                print(f"  [FOUND] {title[:30]}... - {full_url}")
-
-                upsert_series(title, f"Imported from {full_url}", cover_url, full_url)
-                count += 1
-                
-            except Exception as e:
-                # print(f"Error parsing link: {e}")
-                continue
+        for entry in entries:
+            title, full_url = entry['title'], entry['source_url']
+            print(f"  [FOUND] {title[:30]}... - {full_url}")
+
+            upsert_series(title, f"Imported from {full_url}", entry['cover_image_url'], full_url)
+            count += 1
 
         return count
 
     except Exception as e:
         print(f"  [CRITICAL] Error scraping page: {e}")
-        return 0
+        return None
 
 def main():
     print("=== Supabase Bulk Manga Importer (GOD MODE) ===")
@@ -152,19 +122,34 @@ def main():
         base_url = "https://asuracomic.net/series?page="
 
     print(f"\nStarting GOD MODE scrape on {base_url}...")
-    scraper = cloudscraper.create_scraper()
+    metrics.start("bulk_import")
+    with metrics.timer("mirror.sync"):
+        mirror.sync()
+    scraper = RetryingSession(cloudscraper.create_scraper())
 
     total_series = 0
     page = 1
+    failed_pages = 0
     
     while True:
         target_url = f"{base_url}{page}"
         print(f"[PAGE {page}] Scraping {target_url}...")
         
         found = scrape_page(scraper, target_url)
+
+        if found is None:
+            # Transient errors were already retried; skip the page rather than end the import
+            failed_pages += 1
+            if failed_pages >= MAX_FAILED_PAGES:
+                print(f"  -> {failed_pages} pages in a row failed. Stopping; re-run to continue.")
+                break
+            print(f"  -> Skipping page {page} ({failed_pages}/{MAX_FAILED_PAGES} failures in a row).")
+            page += 1
+            continue
+        failed_pages = 0
         
         if found == 0:
-            print(f"  -> Found 0 series. Assuming end of library (or IP block).")
+            print(f"  -> Found 0 series. Assuming end of library.")
             print("  Library Import Complete.")
             break
             
@@ -178,6 +163,7 @@ def main():
         page += 1
 
     print(f"\nJob Complete! Total Series Processed: {total_series}")
+    metrics.finish()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,114 @@
+import asyncio
+import argparse
+import os
+from datetime import datetime, timezone
+
+import httpx
+from dotenv import load_dotenv
+
+from page_parsers import parse_chapter_images
+from probe_images import probe_images
+from retry_policy import policy
+from tiered_fetch import TieredFetcher, READER_MARKERS, READER_WAIT
+
+load_dotenv('.env.local')
+
+SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+SUPABASE_KEY = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+
+if not SUPABASE_URL or not SUPABASE_KEY:
+    print("Error: Missing Supabase credentials in .env.local")
+    exit(1)
+
+HEADERS = {
+    "apikey": SUPABASE_KEY,
+    "Authorization": f"Bearer {SUPABASE_KEY}",
+    "Content-Type": "application/json",
+    "Prefer": "return=representation"
+}
+
+PAGE_SIZE = 1000
+
+# --- Database Helpers ---
+
+async def get_pending_chapters(client, limit=None):
+    # Anti-join: chapters that have no chapter_pages row yet
+    pending = []
+    offset = 0
+    while True:
+        url = (f"{SUPABASE_URL}/rest/v1/chapters?select=id,source_url,chapter_pages(chapter_id)"
+               f"&chapter_pages=is.null&source_url=not.is.null&order=id&limit={PAGE_SIZE}&offset={offset}")
+        response = await policy.arequest(client, "GET", url, headers=HEADERS)
+        response.raise_for_status()
+        rows = response.json()
+        pending.extend({"id": r["id"], "source_url": r["source_url"]} for r in rows)
+        if len(rows) < PAGE_SIZE or (limit and len(pending) >= limit):
+            break
+        offset += PAGE_SIZE
+    return pending[:limit] if limit else pending
+
+async def save_manifest(client, chapter_id, image_urls, dimensions=None):
+    url = f"{SUPABASE_URL}/rest/v1/chapter_pages"
+    headers = HEADERS.copy()
+    headers['Prefer'] = 'resolution=merge-duplicates,return=minimal'
+    payload = {
+        "chapter_id": chapter_id,
+        "image_urls": image_urls,
+        "page_count": len(image_urls),
+        "dimensions": dimensions,
+        "resolved_at": datetime.now(timezone.utc).isoformat()
+    }
+    response = await policy.arequest(client, "POST", url, headers=headers, json=payload, idempotent=True)
+    response.raise_for_status()
+
+# --- Worker Logic ---
+
+async def resolve_chapters(client, fetcher, chapters, workers=3):
+    """Resolves and stores the ordered image list for each chapter. Returns how many were stored."""
+    semaphore = asyncio.Semaphore(workers)
+    stored = 0
+
+    async def resolve(chapter):
+        nonlocal stored
+        async with semaphore:
+            try:
+                result = await fetcher.fetch(chapter['source_url'], READER_MARKERS, READER_WAIT)
+                images = parse_chapter_images(result.content)["images"]
+                if not images:
+                    # Leave it pending so the next backfill retries it
+                    print(f"  [MANIFEST] No images for chapter {chapter['id']}")
+                    return
+                # Header-only probe so the reader can reserve each page's height up front
+                dimensions = await probe_images(client, images)
+                await save_manifest(client, chapter['id'], images, dimensions)
+                stored += 1
+                print(f"  [MANIFEST] {len(images)} pages for chapter {chapter['id']} (via {result.tier})")
+            except Exception as e:
+                print(f"  [MANIFEST] Failed chapter {chapter['id']}: {e}")
+
+    await asyncio.gather(*(resolve(ch) for ch in chapters if ch.get('source_url')))
+    return stored
+
+async def main():
+    parser = argparse.ArgumentParser(description="Resolve chapter image manifests into chapter_pages.")
+    parser.add_argument("--limit", type=int, default=None, help="Only resolve this many pending chapters")
+    parser.add_argument("--workers", type=int, default=3, help="Concurrent chapter fetches")
+    args = parser.parse_args()
+
+    print("=== Chapter Manifest Backfill ===")
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        pending = await get_pending_chapters(client, args.limit)
+        print(f"Found {len(pending)} chapters without a manifest.")
+        if not pending:
+            return
+
+        fetcher = TieredFetcher(client)
+        stored = await resolve_chapters(client, fetcher, pending, args.workers)
+        await fetcher.close()
+        print(fetcher.summary())
+
+    print(f"Manifest backfill complete. Stored {stored}/{len(pending)}.")
+
+if __name__ == "__main__":
+    asyncio.run(main())
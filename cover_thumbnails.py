@@ -0,0 +1,119 @@
+import argparse
+import base64
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import requests
+from PIL import Image
+from dotenv import load_dotenv
+
+import object_storage
+from retry_policy import policy
+
+load_dotenv('.env.local')
+
+SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+SUPABASE_KEY = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+
+if not SUPABASE_URL or not SUPABASE_KEY:
+    print("Error: Missing Supabase credentials in .env.local")
+    exit(1)
+
+HEADERS = {
+    "apikey": SUPABASE_KEY,
+    "Authorization": f"Bearer {SUPABASE_KEY}",
+    "Content-Type": "application/json",
+    "Prefer": "return=representation"
+}
+
+ORIGIN_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0.0.0',
+    'Referer': 'https://asuracomic.net/',
+}
+
+# Uploaded to a public storage bucket; the rows store absolute URLs that work on any deployment
+COVERS_BUCKET = os.getenv("COVER_THUMBS_BUCKET", "covers")
+
+THUMB_WIDTHS = [160, 320]  # Card sizes on the grid (1x and 2x)
+PLACEHOLDER_SIZE = (8, 12)  # 2:3 like the card, inlined as a data URI
+PAGE_SIZE = 1000
+
+# --- Worker (runs in the process pool) ---
+
+def process_cover(series_id, cover_url):
+    response = policy.request(requests, 'GET', cover_url, headers=ORIGIN_HEADERS, timeout=20)
+    response.raise_for_status()
+
+    with Image.open(io.BytesIO(response.content)) as img:
+        img = img.convert('RGB')
+
+    # Names carry a hash of the source URL: a changed cover gets new URLs instead of
+    # overwriting objects that browsers and the CDN have cached as immutable
+    version = hashlib.sha1(cover_url.encode('utf-8')).hexdigest()[:12]
+
+    thumbs = {}
+    for width in THUMB_WIDTHS:
+        width = min(width, img.width)
+        height = round(img.height * width / img.width)
+        out = io.BytesIO()
+        img.resize((width, height), Image.LANCZOS).save(out, 'WEBP', quality=80)
+        thumbs[str(width)] = object_storage.upload(COVERS_BUCKET, f"{series_id}/{version}-w{width}.webp", out.getvalue())
+
+    # A few hundred bytes the card can paint (blurred) before the thumbnail arrives
+    tiny = io.BytesIO()
+    img.resize(PLACEHOLDER_SIZE, Image.BOX).save(tiny, 'WEBP', quality=50)
+    placeholder = "data:image/webp;base64," + base64.b64encode(tiny.getvalue()).decode('ascii')
+
+    return {"cover_thumbs": thumbs, "cover_placeholder": placeholder, "cover_source_url": cover_url}
+
+# --- Database Helpers ---
+
+def get_stale_covers():
+    # Needs work when there are no thumbs yet or the cover URL changed since they were made
+    stale = []
+    offset = 0
+    while True:
+        url = (f"{SUPABASE_URL}/rest/v1/series?select=id,cover_image_url,cover_source_url"
+               f"&cover_image_url=neq.&order=id&limit={PAGE_SIZE}&offset={offset}")
+        response = policy.request(requests, 'GET', url, headers=HEADERS)
+        response.raise_for_status()
+        rows = response.json()
+        stale.extend(r for r in rows if r['cover_image_url'] and r['cover_image_url'] != r['cover_source_url'])
+        if len(rows) < PAGE_SIZE:
+            return stale
+        offset += PAGE_SIZE
+
+def save_cover(series_id, fields):
+    url = f"{SUPABASE_URL}/rest/v1/series?id=eq.{series_id}"
+    headers = HEADERS.copy()
+    headers['Prefer'] = 'return=minimal'
+    response = policy.request(requests, 'PATCH', url, headers=headers, json=fields, idempotent=True)
+    response.raise_for_status()
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate cover thumbnails and placeholders for series cards.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes downloading/resizing covers")
+    args = parser.parse_args()
+    object_storage.require_service_key()
+
+    print("=== Cover Thumbnail Job ===")
+    stale = get_stale_covers()
+    print(f"Found {len(stale)} series with new or changed covers.")
+
+    done = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        jobs = {pool.submit(process_cover, s['id'], s['cover_image_url']): s for s in stale}
+        for job in as_completed(jobs):
+            series = jobs[job]
+            try:
+                save_cover(series['id'], job.result())
+                done += 1
+            except Exception as e:
+                print(f"  [ERROR] {series['id']} ({series['cover_image_url']}): {e}")
+
+    print(f"Cover job complete. Processed {done}/{len(stale)}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+import argparse
+import json
+import os
+import random
+import re
+import zlib
+from collections import defaultdict
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import requests
+from dotenv import load_dotenv
+
+from local_mirror import LocalMirror, fetch_all
+from retry_policy import policy
+from run_metrics import metrics
+from search_index import normalize, slug_title
+
+load_dotenv('.env.local')
+
+SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+SUPABASE_KEY = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+
+if not SUPABASE_URL or not SUPABASE_KEY:
+    print("Error: Missing Supabase credentials in .env.local")
+    exit(1)
+
+HEADERS = {
+    "apikey": SUPABASE_KEY,
+    "Authorization": f"Bearer {SUPABASE_KEY}",
+    "Content-Type": "application/json",
+    "Prefer": "return=representation"
+}
+
+# The same series gets stored more than once: scraper.py matches on the exact title, bulk_import
+# takes link text (other casing/punctuation), and the repair scripts rename titles.
+#   plan:  normalized title + source slug -> word trigram MinHash signatures -> LSH buckets
+#          (plus exact slug / cover-file buckets) -> verified pairs -> clusters -> dedupe_plan.json
+#   apply: merge_series() (production_upgrade.sql) moves chapters, history and bookmarks onto the
+#          series being kept and deletes the others, a few hundred merges per call
+# Only pairs that share a bucket are compared, so the cost grows with the catalogue, not its square.
+
+PLAN_PATH = os.getenv("DEDUPE_PLAN_PATH", os.path.join(os.getcwd(), 'dedupe_plan.json'))
+NUM_HASHES = 64
+BANDS = 16  # 4 hashes per band: ~0.5 similar titles already have a fair chance to share a bucket
+ROWS = NUM_HASHES // BANDS
+THRESHOLD = 0.75  # Estimated Jaccard similarity of the title trigrams to call two series the same
+COVER_THRESHOLD = 0.4  # Lower bar when both use the same cover file
+MAX_BUCKET = 50  # A bucket this full is a placeholder cover or a generic word, not a duplicate
+MAX_CLUSTER = 8  # Larger clusters are chained matches; written to the plan for review, not applied
+MERGES_PER_CALL = 200
+MERGE_URL = f"{SUPABASE_URL}/rest/v1/rpc/merge_series"
+# merge_series() is only executable by the service role (see production_upgrade.sql)
+SERVICE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+PRIME = (1 << 61) - 1
+_rng = random.Random(1)  # Fixed seed: the same catalogue always gives the same plan
+PERMUTATIONS = [(_rng.randrange(1, PRIME), _rng.randrange(0, PRIME)) for _ in range(NUM_HASHES)]
+
+# --- Normalization ---
+
+def title_key(title):
+    # "Solo Leveling (Manhwa)" / "SOLO LEVELING" / "Solo-Leveling" -> "solo leveling"
+    return normalize(re.sub(r'\([^)]*\)|\[[^\]]*\]', ' ', title or '')) or normalize(title)
+
+def numbers_of(title):
+    # "Tower of God" vs "Tower of God Season 2": shared words, different series
+    return set(re.findall(r'\d+', normalize(title)))
+
+def cover_key(url):
+    """Cover file name without size suffix/extension, so resized copies of one image match."""
+    if not url:
+        return None
+    name = urlparse(url).path.rstrip('/').rsplit('/', 1)[-1].lower()
+    name = re.sub(r'\.(jpe?g|png|webp|avif|gif)$', '', name)
+    name = re.sub(r'-\d+x\d+$', '', name)  # WordPress thumbnails: cover-350x476.jpg
+    return name if len(name) >= 6 else None
+
+def words_of(*texts):
+    return {word for text in texts if text for word in text.split()}
+
+# --- MinHash / LSH ---
+
+class MinHasher:
+    """
+    Shingles are pg_trgm-style trigrams of each word ("  so", " so", "sol", "olo", "lo "), so a
+    title's signature is the column-wise min of its words' signatures, and those are cached:
+    a catalogue reuses the same few thousand words over and over.
+    """
+
+    def __init__(self):
+        self.vectors = {}  # trigram -> its NUM_HASHES permuted hashes
+        self.words = {}  # word -> signature
+
+    def vector(self, trigram):
+        vector = self.vectors.get(trigram)
+        if vector is None:
+            x = zlib.crc32(trigram.encode('utf-8'))
+            vector = self.vectors[trigram] = [(a * x + b) % PRIME for a, b in PERMUTATIONS]
+        return vector
+
+    def word_signature(self, word):
+        signature = self.words.get(word)
+        if signature is None:
+            padded = f"  {word} "
+            trigrams = {padded[i:i + 3] for i in range(len(padded) - 2)}
+            signature = self.words[word] = [min(column) for column in zip(*map(self.vector, trigrams))]
+        return signature
+
+    def signature(self, words):
+        return [min(column) for column in zip(*map(self.word_signature, words))]
+
+def similarity(a, b):
+    return sum(x == y for x, y in zip(a, b)) / NUM_HASHES
+
+def load_catalogue(mirror):
+    covers = {r['id']: r['cover_image_url'] for r in fetch_all("series", {"select": "id,cover_image_url", "order": "id"})}
+    hasher = MinHasher()
+    series = []
+    for row in mirror.catalogue():
+        if not row['title']:
+            continue
+        slug = slug_title(row['source_url']) if row['source_url'] else None
+        key = title_key(row['title'])
+        words = words_of(key, slug)
+        if not words:
+            continue
+        series.append({**row, "key": key, "slug_key": slug or None, "cover": cover_key(covers.get(row['id'])),
+                       "numbers": numbers_of(row['title']), "signature": hasher.signature(words)})
+
+    # A cover file shared by many series is a site placeholder, not evidence
+    cover_uses = defaultdict(int)
+    for s in series:
+        cover_uses[s['cover']] += 1
+    for s in series:
+        if cover_uses[s['cover']] > MAX_CLUSTER:
+            s['cover'] = None
+    return series
+
+def candidate_pairs(series):
+    buckets = defaultdict(list)
+    for i, s in enumerate(series):
+        signature = s['signature']
+        for band in range(BANDS):
+            buckets[(band, *signature[band * ROWS:(band + 1) * ROWS])].append(i)
+        if s['slug_key']:
+            buckets[("slug", s['slug_key'])].append(i)
+        if s['cover']:
+            buckets[("cover", s['cover'])].append(i)
+
+    pairs = set()
+    for members in buckets.values():
+        if 1 < len(members) <= MAX_BUCKET:
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    pairs.add((members[x], members[y]))
+    return pairs
+
+def match(a, b):
+    """(score, reason) when a and b are the same series, else None."""
+    if a['slug_key'] and a['slug_key'] == b['slug_key']:
+        return 1.0, "slug"
+    if a['numbers'] != b['numbers']:
+        return None
+    score = similarity(a['signature'], b['signature'])
+    if score >= THRESHOLD:
+        return score, "title"
+    if a['cover'] and a['cover'] == b['cover'] and score >= COVER_THRESHOLD:
+        return score, "cover"
+    return None
+
+# --- Plan ---
+
+def cluster(series, matches):
+    parent = list(range(len(series)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in matches:
+        parent[find(i)] = find(j)
+    groups = defaultdict(list)
+    for i, j in matches:
+        groups[find(i)].extend((i, j))
+    return [sorted(set(members)) for members in groups.values()]
+
+def build_plan(series):
+    with metrics.timer("dedupe.candidates"):
+        pairs = candidate_pairs(series)
+    with metrics.timer("dedupe.verify"):
+        matches, best = [], {}  # best: strongest match each series took part in
+        for i, j in pairs:
+            found = match(series[i], series[j])
+            if found:
+                matches.append((i, j))
+                for k in (i, j):
+                    best[k] = max(best.get(k, found), found)
+
+    clusters = []
+    for members in cluster(series, matches):
+        # Keep the series with the most chapters (then the one with a known source, then the newest)
+        keep = max(members, key=lambda i: (series[i]['chapter_count'] or 0, bool(series[i]['source_url']),
+                                           series[i]['updated_at'] or ''))
+        drops = []
+        for i in members:
+            if i == keep:
+                continue
+            score, reason = best[i]
+            drops.append({"id": series[i]['id'], "title": series[i]['title'],
+                          "chapters": series[i]['chapter_count'] or 0, "score": round(score, 3), "reason": reason})
+        clusters.append({
+            "keep": {"id": series[keep]['id'], "title": series[keep]['title'], "chapters": series[keep]['chapter_count'] or 0},
+            "drop": sorted(drops, key=lambda d: -d['score']),
+            "review": len(members) > MAX_CLUSTER,
+        })
+    clusters.sort(key=lambda c: (c['review'], -len(c['drop']), c['keep']['title']))
+    metrics.count("dedupe_clusters", len(clusters))
+    return {"created_at": datetime.now(timezone.utc).isoformat(), "series": len(series), "candidates": len(pairs),
+            "matches": len(matches), "clusters": clusters}
+
+def plan(path, threshold=None):
+    global THRESHOLD
+    if threshold is not None:
+        THRESHOLD = threshold
+
+    print("=== Near-Duplicate Series Finder ===")
+    metrics.start("dedupe_series")
+    mirror = LocalMirror()
+    with metrics.timer("mirror.sync"):
+        mirror.sync()
+    with metrics.timer("dedupe.signatures"):
+        series = load_catalogue(mirror)
+    result = build_plan(series)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    for c in result['clusters'][:20]:
+        flag = " [REVIEW]" if c['review'] else ""
+        print(f"  KEEP {c['keep']['title']} ({c['keep']['chapters']} ch){flag}")
+        for d in c['drop']:
+            print(f"    <- {d['title']} ({d['chapters']} ch, {d['reason']} {d['score']:.2f})")
+    dropped = sum(len(c['drop']) for c in result['clusters'] if not c['review'])
+    print(f"{result['series']} series, {result['candidates']} candidate pairs, {result['matches']} matches: "
+          f"{len(result['clusters'])} clusters, {dropped} series to merge away. Plan written to {path}")
+    metrics.finish()
+
+# --- Apply ---
+
+def apply(path, include_review=False):
+    if not SERVICE_KEY:
+        print("Error: Set SUPABASE_SERVICE_ROLE_KEY to apply merges")
+        exit(1)
+    merge_headers = {**HEADERS, "apikey": SERVICE_KEY, "Authorization": f"Bearer {SERVICE_KEY}"}
+
+    with open(path, encoding='utf-8') as f:
+        result = json.load(f)
+
+    print(f"=== Applying {path} ({result['created_at']}) ===")
+    metrics.start("dedupe_apply")
+    mirror = LocalMirror()
+    mirror.sync()
+    known = {row['id'] for row in mirror.catalogue()}
+
+    merges = []
+    for c in result['clusters']:
+        if c['review'] and not include_review:
+            continue
+        ids = [c['keep']['id']] + [d['id'] for d in c['drop']]
+        if not all(series_id in known for series_id in ids):
+            # Renamed/deleted since the plan was made; plan again rather than guess
+            print(f"  [SKIP] {c['keep']['title']}: series changed since the plan was written")
+            continue
+        merges.extend({"keep": c['keep']['id'], "drop": d['id']} for d in c['drop'])
+
+    moved, merged = 0, []
+    for i in range(0, len(merges), MERGES_PER_CALL):
+        batch = merges[i:i + MERGES_PER_CALL]
+        with metrics.timer("db.write", table="series"):
+            response = policy.request(requests, "POST", MERGE_URL, headers=merge_headers, json={"merges": batch}, timeout=300)
+        if response.status_code >= 300:
+            print(f"  [ERROR] Merge batch failed: {response.text[:300]}")
+            metrics.count("series", len(batch), outcome="failed")
+            continue
+        moved += response.json()
+        merged.extend(m['drop'] for m in batch)
+        metrics.count("series", len(batch), outcome="merged")
+
+    mirror.forget_series(merged)
+    mirror.sync()
+    print(f"Merged {len(merged)} duplicate series, moved {moved} chapters.")
+    metrics.finish()
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate series and merge them.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    plan_parser = sub.add_parser("plan", help="Write a merge plan (changes nothing)")
+    plan_parser.add_argument("--out", default=PLAN_PATH)
+    plan_parser.add_argument("--threshold", type=float, help=f"Title similarity to count as duplicate (default {THRESHOLD})")
+
+    apply_parser = sub.add_parser("apply", help="Merge the clusters of a plan")
+    apply_parser.add_argument("plan", nargs="?", default=PLAN_PATH)
+    apply_parser.add_argument("--include-review", action="store_true", help=f"Also merge clusters above {MAX_CLUSTER} series")
+
+    args = parser.parse_args()
+    if args.command == "plan":
+        plan(args.out, args.threshold)
+    else:
+        apply(args.plan, args.include_review)
+
+if __name__ == "__main__":
+    main()
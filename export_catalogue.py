@@ -0,0 +1,198 @@
+import argparse
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+import requests
+from dotenv import load_dotenv
+
+from retry_policy import policy
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+load_dotenv('.env.local')
+
+SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+SUPABASE_KEY = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+
+if not SUPABASE_URL or not SUPABASE_KEY:
+    print("Error: Missing Supabase credentials in .env.local")
+    exit(1)
+
+HEADERS = {
+    "apikey": SUPABASE_KEY,
+    "Authorization": f"Bearer {SUPABASE_KEY}",
+    "Content-Type": "application/json",
+    "Prefer": "return=representation"
+}
+
+# Written under public/ so Next (or any CDN in front of it) serves them as static files
+EXPORT_DIR = os.getenv("CATALOGUE_DIR", os.path.join(os.getcwd(), 'public', 'catalogue'))
+
+CARD_FIELDS = "id,title,cover_image_url,cover_thumbs,cover_placeholder,rating,status,updated_at,latest_chapter_number,latest_chapter_at,chapter_count"
+SERIES_SHARDS = 16
+LISTING_PAGE_SIZE = 24  # Same page size as the library page
+PAGE_SIZE = 1000
+IN_FILTER_SIZE = 50
+
+# --- Database Helpers ---
+
+def fetch_all(path):
+    rows = []
+    offset = 0
+    while True:
+        response = policy.request(requests, "GET", f"{SUPABASE_URL}/rest/v1/{path}&limit={PAGE_SIZE}&offset={offset}",
+                                  headers=HEADERS)
+        response.raise_for_status()
+        page = response.json()
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        offset += PAGE_SIZE
+
+def fetch_chapters(series_ids):
+    by_series = {sid: [] for sid in series_ids}
+    for i in range(0, len(series_ids), IN_FILTER_SIZE):
+        group = ",".join(series_ids[i:i + IN_FILTER_SIZE])
+        rows = fetch_all(f"chapters?select=id,series_id,chapter_number,title,release_date"
+                         f"&series_id=in.({group})&order=series_id,chapter_number.desc")
+        for row in rows:
+            by_series[row.pop('series_id')].append(row)
+    return by_series
+
+# --- Shard Writing ---
+
+def encode(obj, fmt):
+    if fmt == 'msgpack':
+        return msgpack.packb(obj, use_bin_type=True)
+    return json.dumps(obj, separators=(',', ':'), sort_keys=True, ensure_ascii=False).encode('utf-8')
+
+def write_shard(name, obj, fmt, written):
+    """Writes `name` as a content-hashed immutable file, skipping it if that exact content already exists."""
+    data = encode(obj, fmt)
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    filename = f"{name}.{digest}.{fmt}"
+    path = os.path.join(EXPORT_DIR, filename)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        written.append(filename)
+    return {"file": filename, "hash": digest, "bytes": len(data)}
+
+def load_previous_manifest():
+    try:
+        with open(os.path.join(EXPORT_DIR, 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def summary_key(card):
+    # A series' chapter list only changes when one of these does (see refresh_series_summary)
+    return f"{card.get('chapter_count')}|{card.get('latest_chapter_number')}|{card.get('latest_chapter_at')}"
+
+def shard_of(series_id):
+    return int(hashlib.md5(series_id.encode()).hexdigest(), 16) % SERIES_SHARDS
+
+def export(fmt):
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    previous = load_previous_manifest()
+    if previous.get('format') != fmt:
+        previous = {}
+    if not previous:
+        # In CI the workflow restores the last snapshot into EXPORT_DIR first; without it every
+        # chapter list is fetched again
+        print(f"[WARN] No previous {fmt} manifest in {EXPORT_DIR}, doing a full export.")
+    previous_chapters = previous.get('chapters', {})
+
+    cards = fetch_all(f"series?select={CARD_FIELDS}&order=updated_at.desc.nullslast,id")
+    print(f"Exporting {len(cards)} series cards...")
+
+    written = []
+    shards = {}
+
+    # Series cards, spread over fixed shards by id
+    buckets = [[] for _ in range(SERIES_SHARDS)]
+    for card in cards:
+        buckets[shard_of(card['id'])].append(card)
+    for index, bucket in enumerate(buckets):
+        shards[f"series/{index:02d}"] = write_shard(f"series/{index:02d}", sorted(bucket, key=lambda c: c['id']), fmt, written)
+
+    # Listing pages in the same order as the home/library pages
+    for start in range(0, len(cards), LISTING_PAGE_SIZE):
+        page_number = start // LISTING_PAGE_SIZE + 1
+        shards[f"listing/{page_number}"] = write_shard(f"listing/{page_number}", cards[start:start + LISTING_PAGE_SIZE], fmt, written)
+
+    # Per-series chapter lists, re-fetched only for series whose summary moved
+    chapters = {}
+    changed = []
+    for card in cards:
+        entry = previous_chapters.get(card['id'])
+        if entry and entry.get('key') == summary_key(card) and os.path.exists(os.path.join(EXPORT_DIR, entry['file'])):
+            chapters[card['id']] = entry
+        else:
+            changed.append(card['id'])
+
+    print(f"Fetching chapter lists for {len(changed)} changed series...")
+    cards_by_id = {card['id']: card for card in cards}
+    for series_id, rows in fetch_chapters(changed).items():
+        key = summary_key(cards_by_id[series_id])
+        chapters[series_id] = {**write_shard(f"chapters/{series_id}", rows, fmt, written), "key": key}
+
+    manifest = {
+        "format": fmt,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "series_count": len(cards),
+        "listing_page_size": LISTING_PAGE_SIZE,
+        "shards": shards,
+        "chapters": chapters,
+    }
+    manifest["version"] = hashlib.sha256(encode({**manifest, "generated_at": None}, 'json')).hexdigest()[:16]
+
+    # Manifest last, so readers never see it point at a file that isn't there yet
+    tmp_path = os.path.join(EXPORT_DIR, 'manifest.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, separators=(',', ':'))
+    os.replace(tmp_path, os.path.join(EXPORT_DIR, 'manifest.json'))
+
+    removed = prune(manifest, previous)
+    print(f"Catalogue {manifest['version']}: wrote {len(written)} shards, kept "
+          f"{len(shards) + len(chapters) - len(written)}, removed {removed}.")
+
+def manifest_files(manifest):
+    return {e['file'] for e in manifest.get('shards', {}).values()} | {e['file'] for e in manifest.get('chapters', {}).values()}
+
+def prune(manifest, previous):
+    # The previous generation stays one more run for clients still holding the old manifest
+    live = manifest_files(manifest) | manifest_files(previous)
+    removed = 0
+    for folder in ('series', 'listing', 'chapters'):
+        root = os.path.join(EXPORT_DIR, folder)
+        if not os.path.isdir(root):
+            continue
+        for filename in os.listdir(root):
+            if f"{folder}/{filename}" not in live:
+                os.remove(os.path.join(root, filename))
+                removed += 1
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the catalogue as sharded, content-hashed static files.")
+    parser.add_argument("--format", choices=["json", "msgpack"], default="json")
+    args = parser.parse_args()
+
+    if args.format == 'msgpack' and msgpack is None:
+        print("Error: msgpack is not installed (pip install msgpack)")
+        exit(1)
+
+    print("=== Catalogue Snapshot Export ===")
+    export(args.format)
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,15 @@
 import os
-import time
-import random
 import re
-import cloudscraper
 import requests
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 from urllib.parse import urljoin
 
+from series_summary import refresh_series_summary
+from local_mirror import LocalMirror
+from page_archive import create_fetcher
+from retry_policy import policy
+
 # Load environment variables
 load_dotenv('.env.local')
 
@@ -25,44 +27,34 @@ HEADERS = {
     "Prefer": "return=representation"
 }
 
+# Reads come from the local replica; only the repairs themselves go to Supabase
+mirror = LocalMirror()
+
 def get_all_series():
     # Fetch series even if status is not ongoing, just in case
-    url = f"{SUPABASE_URL}/rest/v1/series?select=id,title,description&order=updated_at.desc"
-    try:
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code == 200:
-            return response.json()
-        print(f"Error fetching series: {response.text}")
-        return []
-    except Exception as e:
-        print(f"Error fetching series: {e}")
-        return []
+    return mirror.all_series(order_by_updated=True)
 
 def get_existing_chapters(series_id):
-    url = f"{SUPABASE_URL}/rest/v1/chapters?series_id=eq.{series_id}&select=chapter_number"
-    try:
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code == 200:
-            return {c['chapter_number'] for c in response.json()}
-        return set()
-    except Exception as e:
-        return set()
+    return mirror.chapter_numbers(series_id)
 
 def update_series_description(series_id, description):
     url = f"{SUPABASE_URL}/rest/v1/series?id=eq.{series_id}"
     payload = {"description": description.strip()}
     try:
-        requests.patch(url, headers=HEADERS, json=payload)
+        res = policy.request(requests, 'PATCH', url, headers=HEADERS, json=payload, idempotent=True)
+        if res.status_code < 300:
+            mirror.record_series({**payload, "id": series_id})
     except Exception as e:
         print(f"Error updating description: {e}")
 
 def fix_metadata_and_backfill():
     print("=== Fix Metadata & Fast Backfill ===")
     
+    mirror.sync()
     series_list = get_all_series()
     print(f"Found {len(series_list)} series.")
     
-    scraper = cloudscraper.create_scraper()
+    scraper = create_fetcher()  # HTTP first, the browser for JS-rendered chapter lists
     
     for i, series in enumerate(series_list):
         series_id = series['id']
@@ -166,9 +158,11 @@ def fix_metadata_and_backfill():
             count = 0
             if chapters_to_insert:
                 url = f"{SUPABASE_URL}/rest/v1/chapters"
-                res = requests.post(url, headers=HEADERS, json=chapters_to_insert)
+                res = policy.request(requests, 'POST', url, headers=HEADERS, json=chapters_to_insert)
                 if res.status_code < 300:
                     count = len(chapters_to_insert)
+                    mirror.record_chapters(res.json())
+                    refresh_series_summary([series_id])
                 else:
                     print(f"  [ERROR] Chapter insert failed: {res.text}")
             
@@ -177,7 +171,10 @@ def fix_metadata_and_backfill():
         except Exception as e:
             print(f"  [CRITICAL] Error: {e}")
             
-        time.sleep(3)
+        scraper.pause(3)
+
+    print(scraper.summary())
+    scraper.close()
 
 if __name__ == "__main__":
     fix_metadata_and_backfill()
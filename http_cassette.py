@@ -0,0 +1,316 @@
+import argparse
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import os
+import re
+import resource
+import runpy
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Record a real run of any sync script (source pages, Supabase REST, browser-tier pages) into a
+# cassette, then replay it offline with the original or scaled latencies:
+#
+#   python http_cassette.py record cassettes/backfill.jsonl.gz -- backfill_chapters.py --async
+#   python http_cassette.py replay cassettes/backfill.jsonl.gz --latency-scale 0.5 -- backfill_chapters.py --async
+#   python http_cassette.py bench cassettes/backfill.jsonl.gz --run "backfill_chapters.py" --run "backfill_chapters.py --async"
+#
+# Recording is a real run (it writes to Supabase). Request headers are never stored, so the
+# cassette has no keys in it, but response bodies are catalogue data -- keep cassettes out of git.
+# Each run gets a fresh mirror/tier-memory/report dir so record and replay start from the same state.
+
+LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", "1"))
+
+# Dropped when recording: the stored body is already decoded
+SKIP_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'set-cookie'}
+
+# Timestamps differ between the recorded run and the replay (updated_at, created_at ...)
+VOLATILE = re.compile(rb'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?(\+00:00|Z)?')
+
+class CassetteMiss(Exception):
+    pass
+
+def body_digest(body):
+    if body is None:
+        return None
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return hashlib.sha1(VOLATILE.sub(b'', body)).hexdigest()
+
+class Cassette:
+    def __init__(self, path, mode, latency_scale=LATENCY_SCALE):
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.lock = threading.Lock()
+        self.interactions = []
+        self.stats = defaultdict(int)  # served / recorded / misses / reused
+        self.queues = defaultdict(list)
+        self.last = {}
+        if mode == "replay":
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.queues[(entry['method'], entry['url'])].append(entry)
+
+    # --- Record ---
+
+    def record(self, method, url, request_body, status, headers, content, elapsed):
+        entry = {
+            "method": method, "url": url, "body_digest": body_digest(request_body),
+            "status": status, "elapsed": round(elapsed, 4),
+            "headers": {k: v for k, v in headers.items() if k.lower() not in SKIP_HEADERS},
+            "content": base64.b64encode(content).decode('ascii'),
+        }
+        with self.lock:
+            self.interactions.append(entry)
+            self.stats["recorded"] += 1
+
+    def save(self):
+        if self.mode != "record":
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with gzip.open(self.path + ".tmp", 'wt', encoding='utf-8') as f:
+            for entry in self.interactions:
+                f.write(json.dumps(entry) + "\n")
+        os.replace(self.path + ".tmp", self.path)
+
+    # --- Replay ---
+
+    def lookup(self, method, url, request_body):
+        """Same body first (writes), then recording order; the last answer is reused once a URL runs out."""
+        key = (method, url)
+        digest = body_digest(request_body)
+        with self.lock:
+            queue = self.queues.get(key)
+            if queue:
+                index = next((i for i, e in enumerate(queue) if e['body_digest'] == digest), 0)
+                entry = queue.pop(index)
+                self.last[key] = entry
+            elif key in self.last:
+                entry = self.last[key]
+                self.stats["reused"] += 1
+            else:
+                self.stats["misses"] += 1
+                raise CassetteMiss(f"Not in cassette: {method} {url}")
+            self.stats["served"] += 1
+        return entry, base64.b64decode(entry['content'])
+
+    def delay(self, entry):
+        return entry['elapsed'] * self.latency_scale
+
+# --- Transport hooks ---
+
+def install(cassette):
+    """Routes requests/cloudscraper, httpx (sync + async) and the browser tier through the cassette."""
+    import tiered_fetch
+    from tiered_fetch import FetchResult
+
+    original_requests_send = requests.adapters.HTTPAdapter.send
+    original_async_handle = httpx.AsyncHTTPTransport.handle_async_request
+    original_sync_handle = httpx.HTTPTransport.handle_request
+    original_browser = tiered_fetch.TieredFetcher._browser
+
+    def requests_send(adapter, request, **kwargs):
+        if cassette.mode == "record":
+            started = time.perf_counter()
+            response = original_requests_send(adapter, request, **kwargs)
+            cassette.record(request.method, request.url, request.body, response.status_code,
+                            response.headers, response.content, time.perf_counter() - started)
+            return response
+        try:
+            entry, content = cassette.lookup(request.method, request.url, request.body)
+        except CassetteMiss as e:
+            raise requests.ConnectionError(str(e), request=request)
+        time.sleep(cassette.delay(entry))
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response._content = content
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = adapter
+        return response
+
+    def httpx_response(entry, content, request):
+        return httpx.Response(entry['status'], headers=entry['headers'], content=content, request=request)
+
+    async def async_handle(transport, request):
+        if cassette.mode == "record":
+            started = time.perf_counter()
+            response = await original_async_handle(transport, request)
+            await response.aread()
+            cassette.record(request.method, str(request.url), await request.aread(), response.status_code,
+                            response.headers, response.content, time.perf_counter() - started)
+            return response
+        try:
+            entry, content = cassette.lookup(request.method, str(request.url), await request.aread())
+        except CassetteMiss as e:
+            raise httpx.ConnectError(str(e), request=request)
+        await asyncio.sleep(cassette.delay(entry))
+        return httpx_response(entry, content, request)
+
+    def sync_handle(transport, request):
+        if cassette.mode == "record":
+            started = time.perf_counter()
+            response = original_sync_handle(transport, request)
+            response.read()
+            cassette.record(request.method, str(request.url), request.read(), response.status_code,
+                            response.headers, response.content, time.perf_counter() - started)
+            return response
+        try:
+            entry, content = cassette.lookup(request.method, str(request.url), request.read())
+        except CassetteMiss as e:
+            raise httpx.ConnectError(str(e), request=request)
+        time.sleep(cassette.delay(entry))
+        return httpx_response(entry, content, request)
+
+    async def browser(fetcher, url, wait_for, capture=False):
+        # Rendered DOM (plus captured JSON bodies) only; Chromium's other subrequests are not part of the workload
+        if cassette.mode == "record":
+            started = time.perf_counter()
+            result = await original_browser(fetcher, url, wait_for, capture)
+            headers = {"x-captured": json.dumps(result.captured)} if result.captured else {}
+            cassette.record("BROWSER", url, None, result.status, headers, result.content, time.perf_counter() - started)
+            return result
+        entry, content = cassette.lookup("BROWSER", url, None)
+        await asyncio.sleep(cassette.delay(entry))
+        captured = json.loads(entry['headers'].get("x-captured", "[]"))
+        return FetchResult(url, entry['status'], content, "browser", captured)
+
+    requests.adapters.HTTPAdapter.send = requests_send
+    httpx.AsyncHTTPTransport.handle_async_request = async_handle
+    httpx.HTTPTransport.handle_request = sync_handle
+    tiered_fetch.TieredFetcher._browser = browser
+
+# --- Running a script under a cassette ---
+
+def isolate_state(workdir):
+    # Fresh local state, so the replay sees the same sequence of requests as the recording
+    os.environ["MIRROR_PATH"] = os.path.join(workdir, 'mirror.sqlite3')
+    os.environ["FETCH_TIERS_PATH"] = os.path.join(workdir, 'fetch_tiers.json')
+    os.environ["RUN_REPORT_DIR"] = os.path.join(workdir, 'reports')
+    os.environ["PAGE_ARCHIVE_DIR"] = os.path.join(workdir, 'page_archive')
+
+def series_processed():
+    # Every pipeline counts one "series" outcome per series it handled (run_metrics)
+    module = sys.modules.get("run_metrics")
+    if module is None:
+        return 0
+    return int(sum(value for (name, _), value in module.metrics.counters.items() if name == "series"))
+
+def run_script(cassette, command, keep_state=False):
+    workdir = tempfile.mkdtemp(prefix="cassette-")
+    if not keep_state:
+        isolate_state(workdir)
+    install(cassette)
+
+    script = command[0]
+    sys.argv = list(command)
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            status = f"exit {e.code}"
+    except Exception as e:
+        print(f"[CASSETTE] {script} raised: {e}")
+        status = "error"
+    finally:
+        cassette.save()
+    elapsed = time.perf_counter() - started
+
+    series = series_processed()
+    requests_made = cassette.stats["recorded"] if cassette.mode == "record" else cassette.stats["served"]
+    return {
+        "command": " ".join(command), "mode": cassette.mode, "status": status,
+        "latency_scale": cassette.latency_scale, "seconds": round(elapsed, 3),
+        "series": series, "series_per_min": round(series / elapsed * 60, 1) if elapsed else 0,
+        "requests": requests_made, "requests_per_series": round(requests_made / series, 2) if series else None,
+        "misses": cassette.stats["misses"], "reused": cassette.stats["reused"],
+        # ru_maxrss is KB on Linux; children are the parse pool workers
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_child_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+def bench(cassette_path, runs, latency_scale, repeat):
+    """Each pipeline replays in its own process so peak memory is its own."""
+    print(f"=== Replay Benchmark: {cassette_path} (latency x{latency_scale}) ===")
+    results = []
+    for command in runs:
+        for _ in range(repeat):
+            with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+                stats_path = f.name
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "replay", cassette_path,
+                 "--latency-scale", str(latency_scale), "--stats", stats_path, "--", *command.split()],
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            )
+            try:
+                with open(stats_path, encoding='utf-8') as f:
+                    results.append(json.load(f))
+            except json.JSONDecodeError:
+                print(f"  [ERROR] {command}: replay crashed (exit {proc.returncode})")
+            os.remove(stats_path)
+
+    print(f"{'pipeline':<40} {'status':<8} {'secs':>8} {'series/min':>11} {'req/series':>11} {'rss MB':>8} {'misses':>7}")
+    for r in results:
+        rss = max(r['peak_rss_mb'], r['peak_child_rss_mb'])
+        print(f"{r['command'][:40]:<40} {r['status']:<8} {r['seconds']:>8.1f} {r['series_per_min']:>11.1f} "
+              f"{str(r['requests_per_series']):>11} {rss:>8.1f} {r['misses']:>7}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Record/replay HTTP traffic of the sync scripts.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("record", "replay"):
+        p = sub.add_parser(name)
+        p.add_argument("cassette")
+        p.add_argument("--latency-scale", type=float, default=LATENCY_SCALE, help="Replay only; 0 = no waiting")
+        p.add_argument("--keep-state", action="store_true", help="Use the real mirror/tier memory instead of fresh ones")
+        p.add_argument("--stats", help="Write the run's stats JSON here")
+    b = sub.add_parser("bench", help="Replay one cassette through several pipelines")
+    b.add_argument("cassette")
+    b.add_argument("--run", action="append", required=True, help='Pipeline command, e.g. "backfill_chapters.py --async"')
+    b.add_argument("--latency-scale", type=float, default=LATENCY_SCALE)
+    b.add_argument("--repeat", type=int, default=1)
+    b.add_argument("--json", help="Also write all results to this file")
+    # Everything after "--" is the script and its own arguments
+    argv = sys.argv[1:]
+    command = []
+    if "--" in argv:
+        command = argv[argv.index("--") + 1:]
+        argv = argv[:argv.index("--")]
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        results = bench(args.cassette, args.run, args.latency_scale, args.repeat)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        return
+
+    if not command:
+        parser.error("missing script to run (after --)")
+    cassette = Cassette(args.cassette, args.command, args.latency_scale)
+    stats = run_script(cassette, command, args.keep_state)
+    print(f"[CASSETTE] {json.dumps(stats)}")
+    if args.stats:
+        with open(args.stats, 'w', encoding='utf-8') as f:
+            json.dump(stats, f)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import requests
+from dotenv import load_dotenv
+
+from retry_policy import policy
+
+load_dotenv('.env.local')
+
+SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+SUPABASE_KEY = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+
+if not SUPABASE_URL or not SUPABASE_KEY:
+    print("Error: Missing Supabase credentials in .env.local")
+    exit(1)
+
+HEADERS = {
+    "apikey": SUPABASE_KEY,
+    "Authorization": f"Bearer {SUPABASE_KEY}",
+    "Content-Type": "application/json",
+    "Prefer": "return=representation"
+}
+
+CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(os.getcwd(), 'image_cache'))
+CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", 20 * 1024 ** 3))
+
+# Same headers /api/proxy sends, so the origin treats us like the proxy
+ORIGIN_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0.0.0',
+    'Referer': 'https://asuracomic.net/',
+}
+
+CHUNK_SIZE = 64 * 1024
+
+# --- Content-Addressed Store ---
+
+class ImageCache:
+    """Stores image bodies once per sha256 under objects/ab/cd/<digest>, with an LRU size cap."""
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+
+        self.db = sqlite3.connect(os.path.join(root, 'index.sqlite3'), check_same_thread=False)
+        self.db.execute("pragma journal_mode=wal")
+        self.db.execute("create table if not exists blobs (digest text primary key, size integer, content_type text, last_access real)")
+        self.db.execute("create table if not exists urls (url text primary key, digest text)")
+        self.db.execute("create index if not exists blobs_lru on blobs (last_access)")
+        self.db.commit()
+        self.total_bytes = self.db.execute("select coalesce(sum(size), 0) from blobs").fetchone()[0]
+
+    def path_for(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest[2:4], digest)
+
+    def get(self, url):
+        """Returns (path, digest, content_type, size) for a cached URL, or None."""
+        with self.lock:
+            row = self.db.execute(
+                "select b.digest, b.content_type, b.size from urls u join blobs b on b.digest = u.digest where u.url = ?",
+                (url,)
+            ).fetchone()
+            if not row:
+                return None
+            digest, content_type, size = row
+            path = self.path_for(digest)
+            if not os.path.exists(path):
+                # Blob vanished underneath us, forget it so it gets refetched
+                self._drop(digest, size)
+                self.db.commit()
+                return None
+            self.db.execute("update blobs set last_access = ? where digest = ?", (time.time(), digest))
+            self.db.commit()
+        return path, digest, content_type, size
+
+    def put(self, url, data, content_type):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest)
+
+        with self.lock:
+            known = self.db.execute("select 1 from blobs where digest = ?", (digest,)).fetchone()
+            if not known:
+                # Repeated banners/credits pages land on the same digest and are stored once
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                self.db.execute("insert into blobs values (?, ?, ?, ?)", (digest, len(data), content_type, time.time()))
+                self.total_bytes += len(data)
+            self.db.execute("insert or replace into urls values (?, ?)", (url, digest))
+            self._evict()
+            self.db.commit()
+        return digest
+
+    def _drop(self, digest, size):
+        try:
+            os.remove(self.path_for(digest))
+        except FileNotFoundError:
+            pass
+        self.db.execute("delete from blobs where digest = ?", (digest,))
+        self.db.execute("delete from urls where digest = ?", (digest,))
+        self.total_bytes -= size
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            oldest = self.db.execute("select digest, size from blobs order by last_access limit 64").fetchall()
+            if not oldest:
+                break
+            for digest, size in oldest:
+                self._drop(digest, size)
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+# --- Origin Fetching ---
+
+session = requests.Session()
+session.headers.update(ORIGIN_HEADERS)
+
+def fetch_into_cache(cache, url):
+    cached = cache.get(url)
+    if cached:
+        return cached
+    response = policy.request(session, 'GET', url, timeout=15)
+    response.raise_for_status()
+    cache.put(url, response.content, response.headers.get('Content-Type', 'image/jpeg'))
+    return cache.get(url)
+
+def get_recent_manifests(limit):
+    url = f"{SUPABASE_URL}/rest/v1/chapter_pages?select=image_urls&order=resolved_at.desc&limit={limit}"
+    response = policy.request(requests, 'GET', url, headers=HEADERS)
+    response.raise_for_status()
+    return [row['image_urls'] for row in response.json()]
+
+def prefetch(cache, chapters, workers):
+    urls = list(dict.fromkeys(u for images in get_recent_manifests(chapters) for u in images))
+    print(f"Prefetching {len(urls)} images from the {chapters} newest manifests...")
+
+    def fetch(url):
+        try:
+            fetch_into_cache(cache, url)
+            return True
+        except Exception as e:
+            print(f"  [ERROR] {url}: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        ok = sum(pool.map(fetch, urls))
+    print(f"Prefetch complete. {ok}/{len(urls)} cached, store at {cache.total_bytes / 1024 ** 2:.1f} MB.")
+
+# --- HTTP Service (behind /api/proxy) ---
+
+RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+def parse_range(header, size):
+    """Returns (start, end) inclusive for a single byte range, None for no/ignored range, or False if unsatisfiable."""
+    match = RANGE_RE.match(header or '')
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffix range: last N bytes
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+def make_handler(cache):
+    class CacheHandler(BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            self.handle_image(send_body=False)
+
+        def do_GET(self):
+            self.handle_image(send_body=True)
+
+        def handle_image(self, send_body):
+            query = parse_qs(urlparse(self.path).query)
+            url = query.get('url', [None])[0]
+            if not url:
+                return self.send_error(400, 'No URL')
+
+            try:
+                path, digest, content_type, size = fetch_into_cache(cache, url)
+            except Exception as e:
+                return self.send_error(502, f'Origin Error: {e}')
+
+            # Content-addressed, so the digest is a strong validator
+            etag = f'"{digest}"'
+            if etag in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+
+            byte_range = parse_range(self.headers.get('Range'), size)
+            if byte_range is False:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.end_headers()
+                return
+
+            start, end = byte_range or (0, size - 1)
+            self.send_response(206 if byte_range else 200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'public, max-age=31536000, immutable')
+            if byte_range:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.end_headers()
+
+            if not send_body:
+                return
+            with open(path, 'rb') as f:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+
+        def log_message(self, format, *args):
+            pass
+
+    return CacheHandler
+
+def serve(cache, host, port):
+    server = ThreadingHTTPServer((host, port), make_handler(cache))
+    print(f"Image cache serving {cache.root} on http://{host}:{port}/image?url=...")
+    server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-addressed chapter image cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_cmd = sub.add_parser("serve", help="Serve cached images for /api/proxy")
+    serve_cmd.add_argument("--host", default="127.0.0.1")
+    serve_cmd.add_argument("--port", type=int, default=8787)
+
+    prefetch_cmd = sub.add_parser("prefetch", help="Download images of the newest chapter manifests")
+    prefetch_cmd.add_argument("--chapters", type=int, default=200)
+    prefetch_cmd.add_argument("--workers", type=int, default=8)
+
+    args = parser.parse_args()
+    cache = ImageCache()
+
+    if args.command == "serve":
+        serve(cache, args.host, args.port)
+    else:
+        prefetch(cache, args.chapters, args.workers)
+
+if __name__ == "__main__":
+    main()
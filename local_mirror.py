@@ -0,0 +1,254 @@
+import argparse
+import os
+import re
+import sqlite3
+import time
+from urllib.parse import urlparse
+
+import requests
+from dotenv import load_dotenv
+
+from retry_policy import policy
+
+load_dotenv('.env.local')
+
+SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+SUPABASE_KEY = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+
+if not SUPABASE_URL or not SUPABASE_KEY:
+    print("Error: Missing Supabase credentials in .env.local")
+    exit(1)
+
+HEADERS = {
+    "apikey": SUPABASE_KEY,
+    "Authorization": f"Bearer {SUPABASE_KEY}",
+    "Content-Type": "application/json",
+    "Prefer": "return=representation"
+}
+
+MIRROR_PATH = os.getenv("MIRROR_PATH", os.path.join(os.getcwd(), 'mirror.sqlite3'))
+PAGE_SIZE = 1000
+IN_FILTER_SIZE = 50
+# Deleted series are only noticed by comparing id sets; done on --full and at most this often otherwise
+RECONCILE_EVERY = float(os.getenv("MIRROR_RECONCILE_HOURS", "24")) * 3600
+
+SERIES_COLUMNS = ['id', 'title', 'description', 'status', 'source_url', 'slug', 'latest_chapter_number', 'chapter_count', 'updated_at']
+CHAPTER_COLUMNS = ['series_id', 'chapter_number', 'id', 'title', 'source_url']
+
+def source_url_of(description):
+    # The importers keep the source page in the description ("Imported from https://...")
+    match = re.search(r'https?://[^\s]+', description or '')
+    return match.group(0) if match else None
+
+def slug_of(url):
+    return urlparse(url).path.rstrip('/').rsplit('/', 1)[-1] if url else None
+
+def fetch_all(path, params):
+    rows = []
+    offset = 0
+    while True:
+        response = policy.request(requests, "GET", f"{SUPABASE_URL}/rest/v1/{path}", headers=HEADERS,
+                                  params={**params, "limit": PAGE_SIZE, "offset": offset})
+        response.raise_for_status()
+        page = response.json()
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        offset += PAGE_SIZE
+
+def fetch_changed(path, params, since=None):
+    """
+    Rows with modified_at >= since, paged by keyset on (modified_at, id). Offset pages shift when
+    rows are modified mid-sync (they move to the end), which skipped rows; a keyset never does.
+    """
+    params = {**params, "order": "modified_at,id", "limit": PAGE_SIZE}
+    if since:
+        # gte + upsert: rows sharing the watermark timestamp are re-read, never skipped
+        params["modified_at"] = f"gte.{since}"
+    rows = []
+    while True:
+        response = policy.request(requests, "GET", f"{SUPABASE_URL}/rest/v1/{path}", headers=HEADERS, params=params)
+        response.raise_for_status()
+        page = response.json()
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        last = page[-1]
+        params.pop("modified_at", None)
+        params["or"] = (f'(modified_at.gt."{last["modified_at"]}",'
+                        f'and(modified_at.eq."{last["modified_at"]}",id.gt.{last["id"]}))')
+
+def fetch_ids(path):
+    """Every id in the table, paged by keyset on id (a delete mid-read can't shift later pages)."""
+    ids = []
+    params = {"select": "id", "order": "id", "limit": PAGE_SIZE}
+    while True:
+        response = policy.request(requests, "GET", f"{SUPABASE_URL}/rest/v1/{path}", headers=HEADERS, params=params)
+        response.raise_for_status()
+        page = response.json()
+        ids.extend(r['id'] for r in page)
+        if len(page) < PAGE_SIZE:
+            return ids
+        params["id"] = f"gt.{page[-1]['id']}"
+
+class LocalMirror:
+    """SQLite replica of series/chapters. Reads answer locally; scripts record their own writes into it."""
+
+    def __init__(self, path=MIRROR_PATH):
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript("""
+            create table if not exists series (
+                id text primary key, title text, description text, status text, source_url text, slug text,
+                latest_chapter_number real, chapter_count integer, updated_at text
+            );
+            create index if not exists series_title on series (title);
+            create index if not exists series_slug on series (slug);
+            create table if not exists chapters (
+                series_id text not null, chapter_number real not null, id text, title text, source_url text,
+                primary key (series_id, chapter_number)
+            );
+            create table if not exists meta (key text primary key, value text);
+        """)
+        # The (series_id, chapter_number) key folds duplicate DB chapters into one row; how many were
+        # folded is kept so drift checks against chapter_count don't flag those series every sync
+        columns = {r[1] for r in self.db.execute("pragma table_info(series)")}
+        if 'duplicate_chapters' not in columns:
+            self.db.execute("alter table series add column duplicate_chapters integer not null default 0")
+        self.db.commit()
+
+    # --- Sync ---
+
+    def _watermark(self, name):
+        row = self.db.execute("select value from meta where key = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_watermark(self, name, rows):
+        if rows:
+            self.db.execute("insert or replace into meta values (?, ?)", (name, max(r['modified_at'] for r in rows)))
+
+    def sync(self, full=False):
+        """Pulls rows modified since the last sync (see modified_at in production_upgrade.sql)."""
+        series_mark = None if full else self._watermark('series_modified_at')
+        chapter_mark = None if full else self._watermark('chapters_modified_at')
+
+        series_rows = fetch_changed("series", {"select": "id,title,description,status,latest_chapter_number,"
+                                                          "chapter_count,updated_at,modified_at"}, series_mark)
+        self.record_series(*series_rows)
+        self._set_watermark('series_modified_at', series_rows)
+
+        chapter_rows = fetch_changed("chapters", {"select": "id,series_id,chapter_number,title,source_url,modified_at"},
+                                     chapter_mark)
+        self.record_chapters(chapter_rows)
+        self._set_watermark('chapters_modified_at', chapter_rows)
+        self.db.commit()
+
+        # Deleted series don't move a watermark either (dedupe_series drops its own merges)
+        removed = 0
+        last_reconcile = float(self._watermark('series_reconciled_at') or 0)
+        if full or time.time() - last_reconcile > RECONCILE_EVERY:
+            live = {r['id'] for r in series_rows} if full else set(fetch_ids("series"))
+            gone = [r[0] for r in self.db.execute("select id from series") if r[0] not in live]
+            self.forget_series(gone)
+            removed = len(gone)
+            self.db.execute("insert or replace into meta values ('series_reconciled_at', ?)", (str(time.time()),))
+
+        # Deleted chapters: chapter_count (refresh_series_summary) exposes them
+        drifted = [r[0] for r in self.db.execute("""
+            select s.id from series s
+            left join (select series_id, count(*) as n from chapters group by series_id) c on c.series_id = s.id
+            where s.chapter_count is not null and coalesce(c.n, 0) + s.duplicate_chapters != s.chapter_count
+        """)]
+        for i in range(0, len(drifted), IN_FILTER_SIZE):
+            group = drifted[i:i + IN_FILTER_SIZE]
+            rows = fetch_all("chapters", {"select": "id,series_id,chapter_number,title,source_url",
+                                          "series_id": f"in.({','.join(group)})", "order": "id"})
+            for series_id in group:
+                self.forget_chapters(series_id)
+            self.record_chapters(rows)
+            for series_id in group:
+                numbers = [r['chapter_number'] for r in rows if r['series_id'] == series_id]
+                self.db.execute("update series set duplicate_chapters = ? where id = ?",
+                                (len(numbers) - len(set(numbers)), series_id))
+        self.db.commit()
+
+        print(f"[MIRROR] Synced {len(series_rows)} series, {len(chapter_rows)} chapters, "
+              f"repaired {len(drifted)}, removed {removed} deleted series.")
+
+    # --- Reads ---
+
+    def all_series(self, status=None, order_by_updated=False):
+        query = "select id, title, description, status, updated_at from series"
+        params = ()
+        if status:
+            query += " where status = ?"
+            params = (status,)
+        if order_by_updated:
+            query += " order by updated_at desc"
+        return [dict(r) for r in self.db.execute(query, params)]
+
+    def series_by_title(self, title):
+        # Duplicate titles resolve like pg_loader's merge: newest updated_at, then lowest id
+        row = self.db.execute("select id, title from series where title = ? order by updated_at desc, id",
+                              (title,)).fetchone()
+        return dict(row) if row else None
+
+    def series_by_slug(self, slug):
+        row = self.db.execute("select id, title from series where slug = ?", (slug,)).fetchone()
+        return dict(row) if row else None
+
+    def catalogue(self):
+        """Every series with what identifies it (title, source slug) and its size."""
+        return [dict(r) for r in self.db.execute(
+            "select id, title, source_url, slug, chapter_count, updated_at from series")]
+
+    def chapter_numbers(self, series_id):
+        return {r[0] for r in self.db.execute("select chapter_number from chapters where series_id = ?", (series_id,))}
+
+    def latest_chapter(self, series_id):
+        row = self.db.execute("select max(chapter_number) from chapters where series_id = ?", (series_id,)).fetchone()
+        return row[0] or 0
+
+    # --- Write-through (call after the real Supabase write succeeded) ---
+
+    def record_series(self, *rows):
+        for row in rows:
+            row = dict(row)
+            # Repairs replace the URL with real text; keep the source we already learned then
+            url = source_url_of(row.get('description'))
+            if url:
+                row['source_url'] = url
+                row['slug'] = slug_of(url)
+            columns = [c for c in SERIES_COLUMNS if c in row]
+            updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != 'id')
+            self.db.execute(
+                f"insert into series ({', '.join(columns)}) values ({', '.join('?' * len(columns))})"
+                + (f" on conflict (id) do update set {updates}" if updates else " on conflict (id) do nothing"),
+                [row[c] for c in columns]
+            )
+        self.db.commit()
+
+    def record_chapters(self, rows):
+        self.db.executemany(
+            "insert or replace into chapters values (?, ?, ?, ?, ?)",
+            [[r.get(c) for c in CHAPTER_COLUMNS] for r in rows]
+        )
+        self.db.commit()
+
+    def forget_chapters(self, series_id):
+        self.db.execute("delete from chapters where series_id = ?", (series_id,))
+        self.db.execute("update series set duplicate_chapters = 0 where id = ?", (series_id,))
+        self.db.commit()
+
+    def forget_series(self, series_ids):
+        # Deletes never move a watermark, so merged-away series have to be dropped here
+        for series_id in series_ids:
+            self.db.execute("delete from chapters where series_id = ?", (series_id,))
+            self.db.execute("delete from series where id = ?", (series_id,))
+        self.db.commit()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync the local series/chapters mirror.")
+    parser.add_argument("--full", action="store_true", help="Ignore watermarks and pull everything")
+    args = parser.parse_args()
+    LocalMirror().sync(full=args.full)
@@ -2,6 +2,8 @@ import os
 import requests
 from dotenv import load_dotenv
 
+from series_summary import refresh_series_summary
+
 load_dotenv('.env.local')
 
 SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
@@ -44,6 +46,9 @@ try:
         print(f"[SUCCESS] 'Ghost' Chapters Deleted.")
         print(f"Status: {res.status_code}")
         print(f"Items Removed: {count}")
+
+        # Any series could have lost its newest chapters
+        print(f"Refreshed summaries for {refresh_series_summary()} series.")
     else:
         print(f"[FAIL] Status {res.status_code}: {res.text}")
 
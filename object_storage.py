@@ -0,0 +1,52 @@
+import os
+
+import requests
+from dotenv import load_dotenv
+
+from retry_policy import policy
+
+load_dotenv('.env.local')
+
+SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+# Storage writes need the service key; the anon key can only read public buckets
+SERVICE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+# Public base the stored URLs point at. Defaults to Supabase's public object endpoint;
+# set it to a CDN origin that fronts the buckets to serve through that instead.
+PUBLIC_BASE_URL = (os.getenv("STORAGE_PUBLIC_URL") or f"{SUPABASE_URL}/storage/v1/object/public").rstrip('/')
+
+CONTENT_TYPES = {'webp': 'image/webp', 'avif': 'image/avif', 'jpg': 'image/jpeg', 'png': 'image/png'}
+
+# Object names are content-addressed or versioned by the callers, so a stored object never changes
+CACHE_CONTROL = "max-age=31536000"
+
+_session = requests.Session()
+
+def require_service_key():
+    if not SUPABASE_URL or not SERVICE_KEY:
+        print("Error: Set SUPABASE_SERVICE_ROLE_KEY to upload to storage")
+        exit(1)
+
+def public_url(bucket, key):
+    return f"{PUBLIC_BASE_URL}/{bucket}/{key}"
+
+def upload(bucket, key, body, content_type=None):
+    """Uploads (or overwrites) one object and returns its public URL."""
+    if content_type is None:
+        content_type = CONTENT_TYPES.get(key.rsplit('.', 1)[-1], 'application/octet-stream')
+    headers = {
+        "apikey": SERVICE_KEY,
+        "Authorization": f"Bearer {SERVICE_KEY}",
+        "Content-Type": content_type,
+        "Cache-Control": CACHE_CONTROL,
+        "x-upsert": "true",
+    }
+    # Same key, same bytes: resending after an unclear failure is harmless
+    response = policy.request(_session, 'POST', f"{SUPABASE_URL}/storage/v1/object/{bucket}/{key}",
+                              headers=headers, data=body, idempotent=True)
+    response.raise_for_status()
+    return public_url(bucket, key)
+
+def upload_file(bucket, key, path):
+    with open(path, 'rb') as f:
+        return upload(bucket, key, f.read())
@@ -0,0 +1,275 @@
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import cloudscraper
+
+from retry_policy import RetryingSession
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Append-only archive of every page the repair scripts fetch, so a selector/regex fix can be
+# re-run over the whole catalogue from disk instead of re-crawling the origin.
+#
+#   page_archive/segments/<started>-<pid>.warc.zst  one zstd frame per record (WARC-style header + body)
+#   page_archive/index.sqlite3                      url, fetch time -> segment, offset, length
+#
+# Each process appends to its own segment, so several scripts can archive at once.
+
+ARCHIVE_DIR = os.getenv("PAGE_ARCHIVE_DIR", os.path.join(os.getcwd(), 'page_archive'))
+SEGMENT_BYTES = 512 * 1024 * 1024
+COMPRESSION_LEVEL = 10
+
+class ArchivedResponse:
+    """The parts of a requests.Response the scripts use, rebuilt from an archive record."""
+
+    def __init__(self, url, status_code, content, content_type, fetched_at):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = {"Content-Type": content_type or ""}
+        self.fetched_at = fetched_at
+        self.ok = status_code < 400
+
+    @property
+    def text(self):
+        charset = "utf-8"
+        if "charset=" in self.headers["Content-Type"]:
+            charset = self.headers["Content-Type"].split("charset=")[-1].split(";")[0].strip()
+        return self.content.decode(charset, errors="replace")
+
+class PageArchive:
+    def __init__(self, root=ARCHIVE_DIR):
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed (pip install zstandard)")
+        self.root = root
+        self.segments_dir = os.path.join(root, 'segments')
+        os.makedirs(self.segments_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(root, 'index.sqlite3'), check_same_thread=False, timeout=30)
+        self.db.executescript("""
+            create table if not exists records (
+                id integer primary key, url text not null, fetched_at text not null, status integer,
+                content_type text, segment text not null, offset integer not null, length integer not null
+            );
+            create index if not exists records_url on records (url, fetched_at);
+        """)
+        self.db.commit()
+        self.segment = None
+        self.file = None
+
+    # --- Writing ---
+
+    def _open_segment(self):
+        if self.file is not None and self.file.tell() < SEGMENT_BYTES:
+            return
+        if self.file is not None:
+            self.file.close()
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self.segment = f"{stamp}-{os.getpid()}.warc.zst"
+        self.file = open(os.path.join(self.segments_dir, self.segment), 'ab')
+
+    def put(self, url, status, content, content_type=None, fetched_at=None):
+        fetched_at = fetched_at or datetime.now(timezone.utc).isoformat()
+        header = (
+            "WARC/1.1\r\n"
+            "WARC-Type: response\r\n"
+            f"WARC-Target-URI: {url}\r\n"
+            f"WARC-Date: {fetched_at}\r\n"
+            f"HTTP-Status: {status}\r\n"
+            f"Content-Type: {content_type or ''}\r\n"
+            f"Content-Length: {len(content)}\r\n\r\n"
+        ).encode('utf-8')
+        frame = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compress(header + content)
+
+        with self.lock:
+            self._open_segment()
+            offset = self.file.tell()
+            self.file.write(frame)
+            self.file.flush()
+            self.db.execute(
+                "insert into records (url, fetched_at, status, content_type, segment, offset, length) values (?, ?, ?, ?, ?, ?, ?)",
+                (url, fetched_at, status, content_type, self.segment, offset, len(frame))
+            )
+            self.db.commit()
+
+    # --- Reading ---
+
+    def _read(self, row):
+        with open(os.path.join(self.segments_dir, row[5]), 'rb') as f:
+            f.seek(row[6])
+            frame = f.read(row[7])
+        record = zstandard.ZstdDecompressor().decompress(frame)
+        _, body = record.split(b"\r\n\r\n", 1)
+        return ArchivedResponse(row[1], row[3], body, row[4], row[2])
+
+    def latest(self, url, before=None):
+        """Newest capture of `url` (optionally the newest fetched before an ISO timestamp)."""
+        query = "select id, url, fetched_at, status, content_type, segment, offset, length from records where url = ?"
+        params = [url]
+        if before:
+            query += " and fetched_at < ?"
+            params.append(before)
+        row = self.db.execute(query + " order by fetched_at desc limit 1", params).fetchone()
+        return self._read(row) if row else None
+
+    def captures(self, url):
+        return self.db.execute("select fetched_at, status, length from records where url = ? order by fetched_at", (url,)).fetchall()
+
+    def stats(self):
+        records, urls, compressed = self.db.execute(
+            "select count(*), count(distinct url), coalesce(sum(length), 0) from records"
+        ).fetchone()
+        return {"records": records, "urls": urls, "compressed_bytes": compressed}
+
+    def reindex(self):
+        """Rebuilds index.sqlite3 from the segments (the segments are the source of truth)."""
+        with self.lock:
+            self.db.execute("delete from records")
+            for segment in sorted(os.listdir(self.segments_dir)):
+                with open(os.path.join(self.segments_dir, segment), 'rb') as f:
+                    data = f.read()
+                offset = 0
+                while offset < len(data):
+                    decompressor = zstandard.ZstdDecompressor().decompressobj()
+                    record = decompressor.decompress(data[offset:])
+                    length = len(data) - offset - len(decompressor.unused_data)
+                    head = dict(
+                        line.split(": ", 1) for line in record.split(b"\r\n\r\n", 1)[0].decode('utf-8').split("\r\n")[1:]
+                    )
+                    self.db.execute(
+                        "insert into records (url, fetched_at, status, content_type, segment, offset, length) values (?, ?, ?, ?, ?, ?, ?)",
+                        (head["WARC-Target-URI"], head["WARC-Date"], int(head["HTTP-Status"]),
+                         head["Content-Type"] or None, segment, offset, length)
+                    )
+                    offset += length
+            self.db.commit()
+
+# --- Sessions (drop-in for cloudscraper.create_scraper()) ---
+
+class ArchivingSession:
+    """Fetches live and archives every response (archive=None just fetches)."""
+
+    def __init__(self, session, archive):
+        self.session = session
+        self.archive = archive
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        response = self.session.request(method, url, **kwargs)
+        if self.archive is None or method.upper() != "GET":
+            return response
+        try:
+            self.archive.put(url, response.status_code, response.content, response.headers.get('Content-Type'))
+        except Exception as e:
+            print(f"  [WARN] Archive write failed for {url}: {e}")
+        return response
+
+    def pause(self, seconds):
+        time.sleep(seconds)
+
+class ReplaySession:
+    """Answers from the archive only; never touches the origin."""
+
+    def __init__(self, archive, before=None):
+        self.archive = archive
+        self.before = before
+
+    def get(self, url, **kwargs):
+        response = self.archive.latest(url, self.before)
+        if response is None:
+            raise KeyError(f"Not in page archive: {url}")
+        return response
+
+    def pause(self, seconds):
+        pass  # No origin to be polite to
+
+    def summary(self):
+        return "[ARCHIVE] Replayed pages only."
+
+    def close(self):
+        pass
+
+def _archive_args(argv):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--from-archive", action="store_true")
+    parser.add_argument("--archive-before", help="Replay captures fetched before this ISO timestamp")
+    args, _ = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+    return args
+
+def _archiving(session):
+    if zstandard is None:
+        print("[ARCHIVE] zstandard not installed; fetching without archiving.")
+        return ArchivingSession(session, None)
+    return ArchivingSession(session, PageArchive())
+
+def create_scraper(argv=None):
+    """cloudscraper session (with retries) that archives each fetch, or replays the archive when run with --from-archive."""
+    args = _archive_args(argv)
+    if args.from_archive:
+        print(f"[ARCHIVE] Replaying pages from {ARCHIVE_DIR}")
+        return ReplaySession(PageArchive(), args.archive_before)
+    return _archiving(RetryingSession(cloudscraper.create_scraper()))
+
+def create_fetcher(argv=None, markers=None, wait_for=None):
+    """
+    Same, but live pages go through TieredFetcher: cloudscraper first (retried by the fetcher), the
+    shared browser when the page lacks the markers (SERIES_MARKERS by default). The fetcher archives
+    the page that had the markers, browser-rendered or not; an HTTP page that escalated is never
+    archived, so a replay can't hand back its empty chapter list.
+    Replays never escalate, the archive is the only source then. Call close() when done.
+    """
+    args = _archive_args(argv)
+    if args.from_archive:
+        print(f"[ARCHIVE] Replaying pages from {ARCHIVE_DIR}")
+        return ReplaySession(PageArchive(), args.archive_before)
+
+    from tiered_fetch import BlockingFetcher, SERIES_MARKERS, SERIES_WAIT
+    archive = None
+    if zstandard is None:
+        print("[ARCHIVE] zstandard not installed; fetching without archiving.")
+    else:
+        archive = PageArchive()
+    return BlockingFetcher(cloudscraper.create_scraper(), markers or SERIES_MARKERS, wait_for or SERIES_WAIT, archive)
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the raw page archive.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Record/URL counts and size on disk")
+    show = sub.add_parser("show", help="Print the newest capture of a URL")
+    show.add_argument("url")
+    show.add_argument("--before")
+    history = sub.add_parser("history", help="List every capture of a URL")
+    history.add_argument("url")
+    sub.add_parser("reindex", help="Rebuild the index from the segment files")
+    args = parser.parse_args()
+
+    archive = PageArchive()
+    if args.command == "stats":
+        stats = archive.stats()
+        print(f"{stats['records']} captures of {stats['urls']} URLs, {stats['compressed_bytes'] / 1024 / 1024:.1f} MB compressed.")
+    elif args.command == "show":
+        response = archive.latest(args.url, args.before)
+        if response is None:
+            print("Not archived.")
+            exit(1)
+        print(f"# {response.fetched_at} status {response.status_code}")
+        print(response.text)
+    elif args.command == "history":
+        for fetched_at, status, length in archive.captures(args.url):
+            print(f"{fetched_at}  {status}  {length} bytes")
+    elif args.command == "reindex":
+        archive.reindex()
+        print(f"Reindexed {archive.stats()['records']} captures.")
+
+if __name__ == "__main__":
+    main()
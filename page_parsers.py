@@ -0,0 +1,479 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+# Series-page extraction used by the backfill and repair scripts.
+# This module has no side effects on import, so pool workers can load it cheaply;
+# every parser takes raw HTML bytes and returns only a small dict.
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", os.cpu_count() or 1))
+
+# Same selectors the reader page uses, in priority order
+READER_IMAGE_SELECTORS = ['.reading-content img', '.wp-manga-chapter-img', '#readerarea img']
+
+# --- Parsers ---
+
+def parse_universal(html, source_url):
+    """backfill_chapters: every distinct link whose text or href looks like a chapter."""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    chapters = []
+    seen_nums = set()
+
+    for link in soup.find_all('a', href=True):
+        href = link['href']
+        text = link.get_text(strip=True)
+
+        # Filter: Link or text must match 'chapter' (case-insensitive)
+        if 'chapter' not in href.lower() and 'chapter' not in text.lower():
+            continue
+
+        # Try regex on text (Handle "Chapter 14", "Chapter14", "Ch. 14")
+        chap_num = None
+        match_text = re.search(r'(?:Chapter|Ch\.?|Ep\.?)\s*(\d+(\.\d+)?)', text, re.IGNORECASE)
+        if match_text:
+            chap_num = float(match_text.group(1))
+        else:
+            # Fallback: Try regex on HREF "chapter/14"
+            match_href = re.search(r'chapter/(\d+(\.\d+)?)', href, re.IGNORECASE)
+            if match_href:
+                chap_num = float(match_href.group(1))
+
+        if chap_num is None or chap_num in seen_nums:
+            continue
+        seen_nums.add(chap_num)
+        chapters.append((chap_num, urljoin(source_url, href)))
+
+    return {"chapters": chapters}
+
+def parse_brute(html, source_url):
+    """fix_metadata_v2: longest plausible text block as the description, loose chapter regex."""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    best_desc = None
+    max_len = 0
+    for c in soup.find_all(['p', 'div', 'span']):
+        # fast ignore
+        classes = c.get('class', [])
+        if classes and any(x in ['copyright', 'footer', 'menu', 'nav', 'header'] for x in classes):
+            continue
+
+        text = c.get_text(strip=True)
+        if len(text) > 50 and len(text) > max_len and "Copyright" not in text and "All rights reserved" not in text:
+            if len(text) < 5000:
+                best_desc = text
+                max_len = len(text)
+
+    chapters = []
+    seen_nums = set()
+    for link in soup.find_all('a', href=True):
+        href = link['href']
+        text = link.get_text(strip=True)
+
+        if "chapter" in href.lower() or "chapter" in text.lower() or re.search(r'\b\d+\b', text):
+            num_match = re.search(r'(?:Chapter|Ch\.?|Ep\.?|^)\s*(\d+(\.\d+)?)', text, re.IGNORECASE)
+            if not num_match:
+                num_match = re.search(r'chapter/(\d+(\.\d+)?)', href, re.IGNORECASE)
+
+            if num_match:
+                num = float(num_match.group(1))
+                if num in seen_nums:
+                    continue
+                seen_nums.add(num)
+
+                if href.startswith("http"):
+                    full_url = href
+                elif href.startswith("/"):
+                    full_url = "https://asuracomic.net" + href
+                else:
+                    full_url = urljoin(source_url, href)
+                chapters.append((num, full_url))
+
+    return {"description": best_desc, "chapters": chapters}
+
+def parse_strict(html, source_url):
+    """final_repair: refined synopsis selectors, whole-number chapters from the chapter list only."""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Strict synopsis: 'desc' class (common in WordPress themes), then entry-content / itemprop
+    description = ""
+    desc_div = soup.find('div', class_='desc') or soup.find('div', class_='entry-content') or soup.find('div', itemprop='description')
+    if desc_div:
+        description = desc_div.get_text(strip=True)
+    if not description:
+        paras = soup.select('.entry-content p, .synopsis p')
+        if paras:
+            description = " ".join([p.get_text(strip=True) for p in paras])
+
+    # '#chapterlist' is standard; rows are .py-2 divs or plain li tags
+    chapter_area = soup.select_one('#chapterlist')
+    if chapter_area:
+        items = chapter_area.select('.py-2') or chapter_area.find_all('li')
+    else:
+        items = soup.select('.py-2')
+
+    chapters = []
+    seen_nums = set()
+    for item in items:
+        link = item.find('a', href=True)
+        if not link:
+            continue
+
+        text = link.get_text(strip=True)
+        href = link['href']
+
+        match = re.search(r'Chapter\s+(\d+)(?!\.)', text, re.IGNORECASE)
+        if not match:
+            continue
+        chap_num = int(match.group(1))
+
+        # Only whole numbers: "Chapter 20.5" (or version noise like 629.3) is skipped
+        full_num_match = re.search(r'Chapter\s+(\d+(\.\d+)?)', text, re.IGNORECASE)
+        if full_num_match and '.' in full_num_match.group(1):
+            continue
+
+        if chap_num in seen_nums:
+            continue
+        seen_nums.add(chap_num)
+        chapters.append((chap_num, href if href.startswith("http") else f"https://asuracomic.net{href}"))
+
+    return {"description": description or None, "chapters": chapters}
+
+def parse_listing(html, page_url):
+    """bulk_import: one entry per distinct series/manga link on a library listing page."""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    entries = []
+    seen_urls = set()
+    for link in soup.find_all('a', href=True):
+        href = link['href']
+        # Asura uses relative paths like "series/name"
+        if 'series/' not in href and 'manga/' not in href:
+            continue
+        full_url = urljoin(page_url, href)
+        if full_url in seen_urls:
+            continue
+        seen_urls.add(full_url)
+
+        # Title: X-Ray found it in <span class="block text-[13.3px] font-bold">
+        title_span = link.find('span', class_=lambda x: x and 'font-bold' in x and 'block' in x)
+        title = title_span.get_text(strip=True) if title_span else link.get_text(strip=True)
+
+        # Filter out "Chapter" or empty titles
+        if not title or (title.startswith("Chapter") and len(title) < 20):
+            continue
+
+        img_tag = link.find('img')
+        cover_url = img_tag['src'] if img_tag and 'src' in img_tag.attrs else ""
+        entries.append({"title": title, "source_url": full_url, "cover_image_url": cover_url})
+
+    return {"series": entries}
+
+# --- Asura layout (scraper.py / chapter_manifest.py) ---
+
+def _with_classes(root, name, classes):
+    # Tailwind classes like text-[#A2A2A2] are awkward as CSS selectors, so match the class list
+    return root.find(lambda tag: tag.name == name and set(classes) <= set(tag.get('class', [])))
+
+def _first_number(text):
+    match = re.search(r'(\d+(\.\d+)?)', text or '')
+    return float(match.group(1)) if match else 0.0
+
+def parse_homepage(html, page_url):
+    """Homepage "Latest Updates" cards: title, series URL and the newest chapter number shown."""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    cards = soup.find_all(lambda tag: tag.name == 'div' and
+                          {'w-full', 'p-1', 'border-b-[1px]', 'border-b-[#312f40]'} <= set(tag.get('class', [])))
+    entries = []
+    for card in cards:
+        title_span = _with_classes(card, 'span', ['text-[15px]', 'font-medium'])
+        title_link = title_span.find('a', href=True) if title_span else None
+        if not title_link:
+            continue
+        chapter_box = _with_classes(card, 'div', ['flex', 'flex-col', 'gap-y-1.5'])
+        chapter_link = chapter_box.find('a') if chapter_box else None
+        entries.append({
+            "title": title_link.get_text(strip=True),
+            "url": urljoin(page_url, title_link['href']),
+            "latest_chapter": _first_number(chapter_link.get_text(" ", strip=True) if chapter_link else "0")
+        })
+    return {"cards": len(cards), "series": entries}
+
+def parse_series_details(html, series_url, title_hint=None):
+    """Series page: metadata plus every /chapter/ link (hrefs kept as the page has them)."""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    title_el = _with_classes(soup, 'span', ['text-xl', 'font-bold'])
+    title = title_el.get_text(strip=True) if title_el else (title_hint or "Unknown")
+
+    desc_el = _with_classes(soup, 'span', ['font-medium', 'text-sm', 'text-[#A2A2A2]'])
+    description = desc_el.get_text("\n", strip=True) if desc_el else ""
+
+    cover_el = _with_classes(soup, 'img', ['rounded', 'mx-auto']) or soup.find('img', alt=title)
+    cover_url = cover_el.get('src', '') if cover_el else ""
+    if not cover_url:
+        cover_el = soup.select_one('.grid img')
+        cover_url = cover_el.get('src', '') if cover_el else ""
+
+    chapters = []
+    seen_nums = set()
+    for link in soup.select('a[href*="/chapter/"]'):
+        href = link['href']
+        text = link.get_text("\n", strip=True)
+        num = _first_number(text)
+        if num == 0 and "prologue" not in text.lower():
+            num = _first_number(href)
+        if num not in seen_nums:
+            seen_nums.add(num)
+            chapters.append({"number": num, "url": href, "title": text})
+
+    return {"title": title, "description": description, "cover_url": cover_url, "status": "ongoing", "chapters": chapters}
+
+# --- Embedded / captured JSON (scraper.py payload mode) ---
+# The Next.js frontend ships the data it renders: RSC rows pushed through self.__next_f, plus
+# __NEXT_DATA__ / JSON-LD on older layouts, plus whatever JSON the page fetches while loading
+# (captured by the browser tier). Reading that directly skips building a soup of the whole page.
+
+RSC_CHUNK_RE = re.compile(r'self\.__next_f\.push\(\[1,("(?:[^"\\]|\\.)*")\]\)')
+RSC_ROW_RE = re.compile(rb'([0-9a-f]+):(?:T([0-9a-f]+),)?')
+SCRIPT_JSON_RE = re.compile(r'<script[^>]*(?:id="__NEXT_DATA__"|type="application/ld\+json")[^>]*>(.*?)</script>', re.S)
+
+CHAPTER_NUMBER_KEYS = ('chapter_number', 'chapterNumber', 'number', 'chapter', 'name')
+# A number alone (`number`, `name`) is too generic: a chapter item also has to link somewhere
+CHAPTER_LINK_KEYS = ('url', 'href', 'link')
+CHAPTER_NUMBER_RE = re.compile(r'(?:Chapter|Ch\.?)?\s*\d+(\.\d+)?', re.IGNORECASE)
+TITLE_KEYS = ('title', 'name')
+DESCRIPTION_KEYS = ('description', 'summary', 'synopsis')
+COVER_KEYS = ('cover_url', 'cover_image_url', 'cover', 'coverImage', 'thumbnail', 'image')
+STATUSES = {'ongoing', 'completed', 'hiatus', 'dropped'}
+
+def _rsc_rows(payload):
+    """Decoded RSC rows by id. Text rows (`id:T<hex length>,...`) may span lines, so walk them by length."""
+    data = payload.encode('utf-8')
+    rows = {}
+    pos = 0
+    while pos < len(data):
+        end = data.find(b'\n', pos)
+        end = len(data) if end == -1 else end
+        match = RSC_ROW_RE.match(data, pos)
+        if match and match.group(2):
+            text_end = match.end() + int(match.group(2), 16)
+            rows[match.group(1).decode()] = data[match.end():text_end].decode('utf-8', errors='replace')
+            pos = text_end
+            continue
+        if match and data[match.end():match.end() + 1] in (b'[', b'{', b'"'):
+            try:
+                rows[match.group(1).decode()] = json.loads(data[match.end():end])
+            except ValueError:
+                pass
+        pos = end + 1
+    return rows
+
+def extract_payloads(html, captured=()):
+    """Every JSON value the page embeds or fetched (captured response bodies), plus the RSC rows for $refs."""
+    text = html.decode('utf-8', errors='replace') if isinstance(html, bytes) else html
+    values = []
+    for raw in SCRIPT_JSON_RE.findall(text):
+        try:
+            values.append(json.loads(raw))
+        except ValueError:
+            continue
+
+    chunks = []
+    for chunk in RSC_CHUNK_RE.findall(text):
+        try:
+            chunks.append(json.loads(chunk))
+        except ValueError:
+            continue
+    rows = _rsc_rows("".join(chunks))
+
+    for body in captured:
+        try:
+            values.append(json.loads(body))
+        except ValueError:
+            # Client-side navigations fetch RSC (text/x-component) rather than JSON
+            rows.update(_rsc_rows(body))
+
+    values.extend(v for v in rows.values() if not isinstance(v, str))
+    return values, rows
+
+def _walk(value):
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            yield item
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            yield item
+            stack.extend(item)
+
+def _text(item, keys, rows):
+    for key in keys:
+        value = item.get(key)
+        if isinstance(value, str) and value.startswith('$') and value[1:] in rows:
+            value = rows[value[1:]]  # Long strings are sent as separate text rows
+        if isinstance(value, dict):
+            value = value.get('url')
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+    return None
+
+def _chapter_number(item):
+    for key in CHAPTER_NUMBER_KEYS:
+        value = item.get(key)
+        if isinstance(value, bool):
+            continue
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, str) and CHAPTER_NUMBER_RE.fullmatch(value.strip()):
+            return _first_number(value)
+    return None
+
+def _has_chapter_link(item):
+    if any(isinstance(item.get(key), str) and '/chapter' in item[key].lower() for key in CHAPTER_LINK_KEYS):
+        return True
+    return isinstance(item.get('slug'), str) and bool(item['slug'].strip())
+
+def _is_chapter_list(value):
+    # React elements are lists too, but their props carry className/children
+    return (isinstance(value, list) and value and
+            all(isinstance(item, dict) and 'className' not in item and _chapter_number(item) is not None
+                and _has_chapter_link(item) for item in value))
+
+def _chapter_url(item, number, series_url, rows):
+    href = _text(item, CHAPTER_LINK_KEYS, rows)
+    if href and '/chapter' in href.lower():
+        return urljoin(series_url, href)
+    label = int(number) if number == int(number) else number
+    return f"{series_url.rstrip('/')}/chapter/{label}"
+
+def parse_series_payload(html, series_url, title_hint=None, captured=()):
+    """Series page from its JSON data (same shape as parse_series_details), or None when nothing matches."""
+    values, rows = extract_payloads(html, captured)
+
+    chapter_list, owner = None, None
+    series_objects = []
+    for value in values:
+        for node in _walk(value):
+            if isinstance(node, list):
+                if _is_chapter_list(node) and (chapter_list is None or len(node) > len(chapter_list)):
+                    chapter_list, owner = node, None
+            elif _text(node, TITLE_KEYS, rows) and (_text(node, DESCRIPTION_KEYS, rows) or
+                                                    any(_is_chapter_list(v) for v in node.values())):
+                series_objects.append(node)
+    if not chapter_list:
+        return None
+
+    # Metadata: the object that holds the chapter list, else the one titled like the homepage card.
+    # Any other series object on the page is likely a related/sidebar card, so without an owner
+    # the DOM parser is the safer source (None makes the caller fall back to it).
+    for node in series_objects:
+        if any(v is chapter_list for v in node.values()):
+            owner = node
+    if owner is None and title_hint:
+        owner = next((n for n in series_objects if _text(n, TITLE_KEYS, rows).lower() == title_hint.lower()), None)
+    if owner is None:
+        return None
+    title = _text(owner, TITLE_KEYS, rows)
+
+    description = _text(owner, DESCRIPTION_KEYS, rows) or ""
+    if '<' in description:
+        description = re.sub(r'<[^>]+>', '\n', description).strip()
+    status = (_text(owner, ('status',), rows) or "").lower()
+
+    chapters = []
+    seen_nums = set()
+    for item in chapter_list:
+        num = _chapter_number(item)
+        if num in seen_nums:
+            continue
+        seen_nums.add(num)
+        chapters.append({"number": num, "url": _chapter_url(item, num, series_url, rows),
+                         "title": _text(item, ('title',), rows) or f"Chapter {num:g}"})
+
+    return {"title": title, "description": description,
+            "cover_url": _text(owner, COVER_KEYS, rows) or "",
+            "status": status if status in STATUSES else "ongoing", "chapters": chapters}
+
+def parse_chapter_images(html):
+    """Reader page: ordered image URLs from the first selector that matches (data-src preferred)."""
+    soup = BeautifulSoup(html, 'html.parser')
+    for selector in READER_IMAGE_SELECTORS:
+        found = []
+        for img in soup.select(selector):
+            src = (img.get('data-src') or img.get('src') or '').strip()
+            if src and src not in found:
+                found.append(src)
+        if found:
+            return {"images": found}
+    return {"images": []}
+
+# --- Pool ---
+
+class ParsePool:
+    """Long-lived worker processes for the parsers above. Send bytes in, get compact dicts back."""
+
+    def __init__(self, workers=PARSE_WORKERS):
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+
+    def submit(self, parser, html, source_url):
+        return self.executor.submit(parser, html, source_url)
+
+    def parse(self, parser, html, source_url):
+        return self.submit(parser, html, source_url).result()
+
+    async def parse_async(self, parser, html, source_url):
+        return await asyncio.wrap_future(self.submit(parser, html, source_url))
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# --- Fixture Benchmark ---
+
+PARSERS = {"universal": parse_universal, "brute": parse_brute, "strict": parse_strict, "listing": parse_listing}
+
+def bench(fixture, parser_name, pages, max_workers):
+    with open(fixture, 'rb') as f:
+        html = f.read()
+    parser = PARSERS[parser_name]
+
+    print(f"Parsing {fixture} ({len(html) / 1024:.0f} KB) x{pages} with '{parser_name}'")
+    baseline = None
+    workers = 1
+    while workers <= max_workers:
+        with ParsePool(workers) as pool:
+            # Warm the workers so process start-up isn't counted
+            list(pool.executor.map(parser, [html] * workers, ["https://asuracomic.net/"] * workers))
+            started = time.perf_counter()
+            futures = [pool.submit(parser, html, "https://asuracomic.net/") for _ in range(pages)]
+            for future in futures:
+                future.result()
+            rate = pages / (time.perf_counter() - started)
+        baseline = baseline or rate
+        print(f"  {workers:>2} workers: {rate:8.1f} pages/sec ({rate / baseline:.2f}x)")
+        workers *= 2
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark parse throughput on a saved page.")
+    parser.add_argument("fixture", nargs="?", default="debug_page.html")
+    parser.add_argument("--parser", choices=sorted(PARSERS), default="universal")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS, help="Highest worker count to try")
+    args = parser.parse_args()
+    bench(args.fixture, args.parser, args.pages, args.workers)
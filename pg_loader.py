@@ -0,0 +1,200 @@
+import argparse
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+import requests
+from dotenv import load_dotenv
+
+from retry_policy import policy
+
+try:
+    import psycopg
+except ImportError:
+    psycopg = None
+
+load_dotenv('.env.local')
+
+SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+SUPABASE_KEY = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+
+HEADERS = {
+    "apikey": SUPABASE_KEY,
+    "Authorization": f"Bearer {SUPABASE_KEY}",
+    "Content-Type": "application/json",
+    "Prefer": "return=representation"
+}
+
+# Direct connection string (Supabase: Project Settings -> Database), or any local Postgres
+# with the series/chapters tables for testing.
+DATABASE_URL = os.getenv("SUPABASE_DB_URL") or os.getenv("DATABASE_URL")
+
+# Rows are COPY'd into temp tables and merged with one statement per table. chapters has no
+# unique (series_id, chapter_number) constraint, so the merge is an anti-join rather than ON CONFLICT.
+# Titles aren't unique either (see dedupe_series.py): each incoming title resolves to one series,
+# picked like LocalMirror.series_by_title (newest updated_at, then lowest id), and the chapters
+# join on that resolution (tmp_resolved) instead of on the title again.
+
+MERGE_SERIES_SQL = """
+with incoming as (
+  select distinct on (title) * from tmp_series order by title
+), canonical as (
+  select distinct on (s.title) s.id, s.title
+  from series s
+  join incoming i on i.title = s.title
+  order by s.title, s.updated_at desc nulls last, s.id
+), updated as (
+  update series s
+  set cover_image_url = i.cover_image_url, status = i.status, updated_at = i.updated_at
+  from canonical c
+  join incoming i on i.title = c.title
+  where s.id = c.id
+  returning s.id, s.title, s.description, false as inserted
+), inserted as (
+  insert into series (title, description, cover_image_url, status, updated_at)
+  select i.title, i.description, i.cover_image_url, i.status, i.updated_at
+  from incoming i
+  where not exists (select 1 from canonical c where c.title = i.title)
+  returning id, title, description, true as inserted
+), resolved as (
+  select * from updated union all select * from inserted
+), saved as (
+  insert into tmp_resolved (id, title) select id, title from resolved
+)
+select * from resolved
+"""
+
+MERGE_CHAPTERS_SQL = """
+insert into chapters (series_id, chapter_number, title, source_url)
+select distinct on (r.id, t.chapter_number) r.id, t.chapter_number, t.title, t.source_url
+from tmp_chapters t
+join tmp_resolved r on r.title = t.series_title
+where not exists (
+  select 1 from chapters c where c.series_id = r.id and c.chapter_number = t.chapter_number
+)
+order by r.id, t.chapter_number
+returning id, series_id, chapter_number, title, source_url
+"""
+
+def connect(dsn=None):
+    if psycopg is None:
+        print("Error: psycopg is not installed (pip install 'psycopg[binary]')")
+        exit(1)
+    dsn = dsn or DATABASE_URL
+    if not dsn:
+        print("Error: Set SUPABASE_DB_URL (or DATABASE_URL) for the COPY backend")
+        exit(1)
+    return psycopg.connect(dsn)
+
+def _copy(cur, table, columns, rows):
+    with cur.copy(f"copy {table} ({', '.join(columns)}) from stdin") as copy:
+        for row in rows:
+            copy.write_row([row.get(c) for c in columns])
+
+def load_rows(conn, series_rows, chapter_rows, refresh=True):
+    """
+    series_rows:  {title, description, cover_image_url, status, updated_at}
+    chapter_rows: {series_title, chapter_number, title, source_url}
+    Returns (series rows touched, chapter rows inserted). Commits on success, rolls back on error.
+    """
+    with conn.transaction(), conn.cursor() as cur:
+        cur.execute("""
+            create temp table tmp_series (title text, description text, cover_image_url text,
+                                          status text, updated_at timestamptz) on commit drop;
+            create temp table tmp_chapters (series_title text, chapter_number numeric, title text,
+                                            source_url text) on commit drop;
+            create temp table tmp_resolved (id uuid, title text) on commit drop;
+        """)
+        _copy(cur, "tmp_series", ["title", "description", "cover_image_url", "status", "updated_at"], series_rows)
+        _copy(cur, "tmp_chapters", ["series_title", "chapter_number", "title", "source_url"], chapter_rows)
+
+        cur.execute(MERGE_SERIES_SQL)
+        series = [dict(zip(["id", "title", "description", "inserted"], r)) for r in cur.fetchall()]
+        cur.execute(MERGE_CHAPTERS_SQL)
+        chapters = [dict(zip(["id", "series_id", "chapter_number", "title", "source_url"], r)) for r in cur.fetchall()]
+
+        touched = list({c['series_id'] for c in chapters} | {s['id'] for s in series if s['inserted']})
+        # Local test databases may not have production_upgrade.sql applied
+        cur.execute("select to_regprocedure('refresh_series_summary(uuid[])') is not null")
+        if refresh and touched and cur.fetchone()[0]:
+            cur.execute("select refresh_series_summary(%s::uuid[])", (touched,))
+
+    for row in series:
+        row['id'] = str(row['id'])
+    for row in chapters:
+        row['id'], row['series_id'], row['chapter_number'] = str(row['id']), str(row['series_id']), float(row['chapter_number'])
+    return series, chapters
+
+# --- Benchmark (COPY vs the REST path the scripts use today) ---
+
+def synthetic_rows(series_count, chapters_per_series, tag):
+    now = datetime.now(timezone.utc).isoformat()
+    series = [{"title": f"{tag} {i}", "description": f"Imported from https://example.invalid/series/{tag}-{i}",
+               "cover_image_url": "", "status": "ongoing", "updated_at": now} for i in range(series_count)]
+    chapters = [{"series_title": s['title'], "chapter_number": n, "title": f"Chapter {n}",
+                 "source_url": f"https://example.invalid/chapter/{i}-{n}"}
+                for i, s in enumerate(series) for n in range(1, chapters_per_series + 1)]
+    return series, chapters
+
+def bench_copy(series_rows, chapter_rows, keep=False):
+    conn = connect()
+    started = time.perf_counter()
+    if keep:
+        load_rows(conn, series_rows, chapter_rows, refresh=False)
+    else:
+        # Same work inside a transaction that is thrown away afterwards
+        with conn.transaction():
+            load_rows(conn, series_rows, chapter_rows, refresh=False)
+            raise psycopg.Rollback()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed
+
+def bench_rest(series_rows, chapter_rows, batch_size):
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        print("Error: Missing Supabase credentials in .env.local")
+        exit(1)
+    started = time.perf_counter()
+    res = policy.request(requests, "POST", f"{SUPABASE_URL}/rest/v1/series", headers=HEADERS, json=series_rows)
+    res.raise_for_status()
+    ids = {row['title']: row['id'] for row in res.json()}
+    rows = [{"series_id": ids[c['series_title']], "chapter_number": c['chapter_number'],
+             "title": c['title'], "source_url": c['source_url']} for c in chapter_rows]
+    headers = HEADERS.copy()
+    headers['Prefer'] = 'return=minimal'
+    for i in range(0, len(rows), batch_size):
+        policy.request(requests, "POST", f"{SUPABASE_URL}/rest/v1/chapters", headers=headers,
+                       json=rows[i:i + batch_size]).raise_for_status()
+    elapsed = time.perf_counter() - started
+
+    # Clean up the synthetic rows
+    id_list = ",".join(ids.values())
+    policy.request(requests, "DELETE", f"{SUPABASE_URL}/rest/v1/chapters?series_id=in.({id_list})", headers=headers)
+    policy.request(requests, "DELETE", f"{SUPABASE_URL}/rest/v1/series?id=in.({id_list})", headers=headers)
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the COPY loader against PostgREST inserts.")
+    parser.add_argument("--series", type=int, default=50)
+    parser.add_argument("--chapters", type=int, default=200, help="Chapters per series")
+    parser.add_argument("--rest-batch", type=int, default=100, help="Rows per REST POST (the scripts use 50-100)")
+    parser.add_argument("--skip-rest", action="store_true", help="Only time COPY (e.g. against a local Postgres)")
+    parser.add_argument("--keep", action="store_true", help="Commit the COPY run instead of rolling it back")
+    args = parser.parse_args()
+
+    tag = f"bench-{uuid.uuid4().hex[:8]}"
+    series_rows, chapter_rows = synthetic_rows(args.series, args.chapters, tag)
+    total = len(series_rows) + len(chapter_rows)
+    print(f"=== Loader Benchmark: {len(series_rows)} series + {len(chapter_rows)} chapters ===")
+
+    elapsed = bench_copy(series_rows, chapter_rows, args.keep)
+    print(f"COPY + merge: {elapsed:6.2f}s  {total / elapsed:10.0f} rows/sec")
+
+    if not args.skip_rest:
+        rest_elapsed = bench_rest(series_rows, chapter_rows, args.rest_batch)
+        print(f"REST x{args.rest_batch}:  {rest_elapsed:6.2f}s  {total / rest_elapsed:10.0f} rows/sec "
+              f"({rest_elapsed / elapsed:.1f}x slower)")
+
+if __name__ == "__main__":
+    main()
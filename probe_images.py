@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import os
+import struct
+
+import httpx
+from dotenv import load_dotenv
+
+from retry_policy import policy
+
+load_dotenv('.env.local')
+
+SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+SUPABASE_KEY = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+
+if not SUPABASE_URL or not SUPABASE_KEY:
+    print("Error: Missing Supabase credentials in .env.local")
+    exit(1)
+
+HEADERS = {
+    "apikey": SUPABASE_KEY,
+    "Authorization": f"Bearer {SUPABASE_KEY}",
+    "Content-Type": "application/json",
+    "Prefer": "return=representation"
+}
+
+# Same headers /api/proxy sends to the image host
+ORIGIN_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0.0.0',
+    'Referer': 'https://asuracomic.net/',
+}
+
+PROBE_BYTES = 4096
+MAX_PROBE_BYTES = 65536  # JPEGs with big EXIF/ICC blocks push the SOF marker further out
+
+# --- Header Parsing ---
+
+def parse_image_header(data):
+    """Returns (format, width, height) from the first bytes of a PNG/JPEG/WebP/GIF, or None."""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR' and len(data) >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return 'png', width, height
+
+    if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        width, height = struct.unpack('<HH', data[6:10])
+        return 'gif', width, height
+
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP' and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b'VP8 ':
+            width, height = struct.unpack('<HH', data[26:30])
+            return 'webp', width & 0x3FFF, height & 0x3FFF
+        if chunk == b'VP8L':
+            b0, b1, b2, b3 = data[21:25]
+            width = 1 + (((b1 & 0x3F) << 8) | b0)
+            height = 1 + (((b3 & 0x0F) << 10) | (b2 << 2) | ((b1 & 0xC0) >> 6))
+            return 'webp', width, height
+        if chunk == b'VP8X':
+            width = 1 + int.from_bytes(data[24:27], 'little')
+            height = 1 + int.from_bytes(data[27:30], 'little')
+            return 'webp', width, height
+        return None
+
+    if data[:2] == b'\xff\xd8':
+        i = 2
+        while i + 9 <= len(data):
+            if data[i] != 0xFF:
+                i += 1
+                continue
+            marker = data[i + 1]
+            if marker == 0xFF:
+                # Fill byte
+                i += 1
+                continue
+            if 0xD0 <= marker <= 0xD9 or marker == 0x01:
+                # Standalone markers carry no length
+                i += 2
+                continue
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack('>HH', data[i + 5:i + 9])
+                return 'jpeg', width, height
+            i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+        return None
+
+    return None
+
+# --- Probing ---
+
+class _HeadReader:
+    """
+    Stands in for the client in policy.arequest: streams the response and keeps only its first
+    `size` bytes (response.head), so a host that ignores Range still costs us only that much.
+    """
+
+    def __init__(self, client, size):
+        self.client = client
+        self.size = size
+
+    async def request(self, method, url, **kwargs):
+        async with self.client.stream(method, url, **kwargs) as response:
+            data = b''
+            if response.is_success:
+                async for chunk in response.aiter_bytes():
+                    data += chunk
+                    if len(data) >= self.size:
+                        break
+            response.head = data[:self.size]
+            return response
+
+async def fetch_head_bytes(client, url, size):
+    headers = {**ORIGIN_HEADERS, 'Range': f'bytes=0-{size - 1}'}
+    response = await policy.arequest(_HeadReader(client, size), 'GET', url, headers=headers, follow_redirects=True)
+    response.raise_for_status()
+    return response.head
+
+async def probe_image(client, url):
+    size = PROBE_BYTES
+    while True:
+        data = await fetch_head_bytes(client, url, size)
+        parsed = parse_image_header(data)
+        if parsed:
+            fmt, width, height = parsed
+            return {"width": width, "height": height, "format": fmt}
+        # Only JPEG can need more bytes; anything else is unknown
+        if data[:2] != b'\xff\xd8' or len(data) < size or size >= MAX_PROBE_BYTES:
+            return None
+        size *= 4
+
+async def probe_images(client, urls, concurrency=8):
+    """Probes every URL concurrently over one client. Results line up with `urls` (None where unknown)."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def probe(url):
+        async with semaphore:
+            try:
+                return await probe_image(client, url)
+            except Exception as e:
+                print(f"  [PROBE] Failed {url}: {e}")
+                return None
+
+    return await asyncio.gather(*(probe(u) for u in urls))
+
+# --- Database Helpers ---
+
+async def get_unprobed_manifests(client, limit):
+    url = (f"{SUPABASE_URL}/rest/v1/chapter_pages?select=chapter_id,image_urls"
+           f"&dimensions=is.null&order=resolved_at.desc&limit={limit}")
+    response = await policy.arequest(client, 'GET', url, headers=HEADERS)
+    response.raise_for_status()
+    return response.json()
+
+async def save_dimensions(client, chapter_id, dimensions):
+    url = f"{SUPABASE_URL}/rest/v1/chapter_pages?chapter_id=eq.{chapter_id}"
+    headers = HEADERS.copy()
+    headers['Prefer'] = 'return=minimal'
+    response = await policy.arequest(client, 'PATCH', url, headers=headers, json={"dimensions": dimensions},
+                                     idempotent=True)
+    response.raise_for_status()
+
+async def main():
+    parser = argparse.ArgumentParser(description="Probe chapter image sizes from their first few KB.")
+    parser.add_argument("--chapters", type=int, default=200, help="Manifests to probe this run")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent probes per chapter")
+    args = parser.parse_args()
+
+    print("=== Chapter Image Dimension Probe ===")
+
+    async with httpx.AsyncClient(timeout=15) as client:
+        manifests = await get_unprobed_manifests(client, args.chapters)
+        print(f"Found {len(manifests)} chapters without dimensions.")
+
+        for manifest in manifests:
+            dimensions = await probe_images(client, manifest['image_urls'], args.concurrency)
+            known = sum(1 for d in dimensions if d)
+            try:
+                await save_dimensions(client, manifest['chapter_id'], dimensions)
+                print(f"  [SUCCESS] Chapter {manifest['chapter_id']}: {known}/{len(dimensions)} sized")
+            except Exception as e:
+                print(f"  [ERROR] Chapter {manifest['chapter_id']}: {e}")
+
+    print("Probe complete.")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -41,3 +41,267 @@ create policy "Users can insert their own bookmarks" on bookmarks
 
 create policy "Users can delete their own bookmarks" on bookmarks
   for delete using (auth.uid() = user_id);
+
+-- Phase 3: Chapter Image Manifests
+
+-- 6. Ordered image URLs per chapter, resolved once by chapter_manifest.py
+create table if not exists chapter_pages (
+  chapter_id uuid primary key references chapters(id) on delete cascade,
+  image_urls jsonb not null default '[]'::jsonb,
+  page_count integer not null default 0,
+  resolved_at timestamp with time zone default now()
+);
+
+-- 7. Responsive WebP/AVIF tiles per page, written by transcode_images.py.
+-- The tiles themselves live in a public storage bucket (uploaded with the service key).
+alter table chapter_pages add column if not exists variants jsonb;
+
+insert into storage.buckets (id, name, public) values ('variants', 'variants', true)
+on conflict (id) do nothing;
+
+-- 8. Per-page width/height/format from header-only probes (probe_images.py)
+alter table chapter_pages add column if not exists dimensions jsonb;
+
+-- Phase 4: Series Card Assets
+
+-- 9. Cover thumbnails (in the public covers bucket) + inline placeholder (cover_thumbnails.py).
+-- cover_source_url is the cover_image_url they were made from; a mismatch means re-process.
+alter table series add column if not exists cover_thumbs jsonb;
+alter table series add column if not exists cover_placeholder text;
+alter table series add column if not exists cover_source_url text;
+
+insert into storage.buckets (id, name, public) values ('covers', 'covers', true)
+on conflict (id) do nothing;
+
+-- Phase 5: Denormalized Chapter Summary
+
+-- 10. Newest chapter + count on the series row, so listing pages don't embed every chapter
+alter table series add column if not exists latest_chapter_number numeric;
+alter table series add column if not exists latest_chapter_at timestamp with time zone;
+alter table series add column if not exists chapter_count integer not null default 0;
+
+create index if not exists chapters_series_number_idx on chapters (series_id, chapter_number);
+
+-- 11. Called by the sync/repair scripts after they write chapters (null = rebuild everything)
+create or replace function refresh_series_summary(series_ids uuid[] default null)
+returns integer
+language sql
+as $$
+  with stats as (
+    select s.id,
+           max(c.chapter_number) as latest_number,
+           max(c.release_date) as latest_at,
+           count(c.id) as total
+    from series s
+    left join chapters c on c.series_id = s.id
+    where series_ids is null or s.id = any(series_ids)
+    group by s.id
+  ), updated as (
+    update series s
+    set latest_chapter_number = stats.latest_number,
+        latest_chapter_at = stats.latest_at,
+        chapter_count = stats.total
+    from stats
+    where s.id = stats.id
+    returning 1
+  )
+  select count(*)::integer from updated;
+$$;
+
+-- Phase 6: Chapter Navigation Links
+
+-- 12. Dense per-series ordinal and neighbour pointers, so the reader never scans the chapter list
+alter table chapters add column if not exists ordinal integer;
+alter table chapters add column if not exists prev_chapter_id uuid;
+alter table chapters add column if not exists next_chapter_id uuid;
+
+create or replace function refresh_chapter_links(series_ids uuid[] default null)
+returns integer
+language sql
+as $$
+  with ordered as (
+    select id,
+           row_number() over w as ordinal,
+           lag(id) over w as prev_id,
+           lead(id) over w as next_id
+    from chapters
+    where series_ids is null or series_id = any(series_ids)
+    window w as (partition by series_id order by chapter_number)
+  ), updated as (
+    update chapters c
+    set ordinal = o.ordinal,
+        prev_chapter_id = o.prev_id,
+        next_chapter_id = o.next_id
+    from ordered o
+    where c.id = o.id
+      and (c.ordinal is distinct from o.ordinal
+           or c.prev_chapter_id is distinct from o.prev_id
+           or c.next_chapter_id is distinct from o.next_id)
+    returning 1
+  )
+  select count(*)::integer from updated;
+$$;
+
+-- 13. The sync scripts already call refresh_series_summary after chapter writes,
+-- so it now rebuilds the navigation links of those series first
+create or replace function refresh_series_summary(series_ids uuid[] default null)
+returns integer
+language sql
+as $$
+  select refresh_chapter_links(series_ids);
+
+  with stats as (
+    select s.id,
+           max(c.chapter_number) as latest_number,
+           max(c.release_date) as latest_at,
+           count(c.id) as total
+    from series s
+    left join chapters c on c.series_id = s.id
+    where series_ids is null or s.id = any(series_ids)
+    group by s.id
+  ), updated as (
+    update series s
+    set latest_chapter_number = stats.latest_number,
+        latest_chapter_at = stats.latest_at,
+        chapter_count = stats.total
+    from stats
+    where s.id = stats.id
+    returning 1
+  )
+  select count(*)::integer from updated;
+$$;
+
+-- Phase 7: Title Search Index
+
+-- 14. Normalized titles + alternates with trigram postings (search_index.py keeps it fresh)
+create extension if not exists pg_trgm;
+
+create table if not exists series_search (
+  series_id uuid primary key references series(id) on delete cascade,
+  search_text text not null,
+  popularity real not null default 0,
+  updated_at timestamp with time zone default now()
+);
+
+create index if not exists series_search_trgm_idx on series_search using gin (search_text gin_trgm_ops);
+
+-- 15. Fuzzy substring search, best match first and popular series breaking ties
+create or replace function search_series(query text, max_results integer default 50)
+returns setof series
+language sql
+stable
+as $$
+  with q as (
+    select trim(regexp_replace(regexp_replace(lower(query), '[''’]', '', 'g'), '[^0-9a-z]+', ' ', 'g')) as term
+  )
+  select s.*
+  from q, series_search ss
+  join series s on s.id = ss.series_id
+  where q.term <> ''
+    and (ss.search_text like '%' || q.term || '%' or q.term <% ss.search_text)
+  order by word_similarity(q.term, ss.search_text) desc, ss.popularity desc
+  limit max_results;
+$$;
+
+-- Phase 8: Sync Watermarks
+
+-- 16. Row modification time for incremental mirrors (local_mirror.py).
+-- Separate from series.updated_at, which orders the "Latest Updates" shelf.
+alter table series add column if not exists modified_at timestamp with time zone not null default now();
+alter table chapters add column if not exists modified_at timestamp with time zone not null default now();
+
+create index if not exists series_modified_at_idx on series (modified_at);
+create index if not exists chapters_modified_at_idx on chapters (modified_at);
+
+create or replace function touch_modified_at()
+returns trigger
+language plpgsql
+as $$
+begin
+  new.modified_at = now();
+  return new;
+end;
+$$;
+
+drop trigger if exists series_touch_modified_at on series;
+create trigger series_touch_modified_at before update on series
+  for each row execute function touch_modified_at();
+
+drop trigger if exists chapters_touch_modified_at on chapters;
+create trigger chapters_touch_modified_at before update on chapters
+  for each row execute function touch_modified_at();
+
+-- Phase 9: Duplicate Series Merges
+
+-- 17. Folds duplicate series into the one being kept (dedupe_series.py).
+-- merges: [{"keep": <uuid>, "drop": <uuid>}, ...]. Chapters move over unless the kept series already
+-- has that number (then the copy with an image manifest wins); reading history and bookmarks follow.
+-- security definer: history/bookmarks are RLS-protected, and deleting the dropped series would
+-- otherwise cascade away rows the caller can't see to move. That also lets it delete any series,
+-- so only the service role may call it (the anon key ships to every browser).
+create or replace function merge_series(merges jsonb)
+returns integer
+language plpgsql
+security definer
+set search_path = public, pg_temp
+as $$
+declare
+  moved integer;
+  keep_ids uuid[];
+begin
+  drop table if exists merge_pairs, merge_members;
+  create temporary table merge_pairs on commit drop as
+    select distinct (m->>'keep')::uuid as keep_id, (m->>'drop')::uuid as drop_id
+    from jsonb_array_elements(merges) m
+    where m->>'keep' <> m->>'drop';
+
+  create temporary table merge_members on commit drop as
+    select keep_id, keep_id as series_id from merge_pairs
+    union
+    select keep_id, drop_id from merge_pairs;
+
+  -- One chapter per number: the kept series' own row first, then one that already has its pages
+  with ranked as (
+    select c.id,
+           row_number() over (partition by m.keep_id, c.chapter_number
+                              order by (c.series_id = m.keep_id) desc, (cp.chapter_id is not null) desc, c.id) as rank
+    from merge_members m
+    join chapters c on c.series_id = m.series_id
+    left join chapter_pages cp on cp.chapter_id = c.id
+  )
+  delete from chapters c using ranked r where c.id = r.id and r.rank > 1;
+
+  update chapters c set series_id = p.keep_id from merge_pairs p where c.series_id = p.drop_id;
+  get diagnostics moved = row_count;
+
+  with ranked as (
+    select h.id,
+           row_number() over (partition by h.user_id, m.keep_id, h.chapter_number
+                              order by (h.series_id = m.keep_id) desc, h.read_at desc nulls last, h.id) as rank
+    from merge_members m
+    join history h on h.series_id = m.series_id
+  )
+  delete from history h using ranked r where h.id = r.id and r.rank > 1;
+  update history h set series_id = p.keep_id from merge_pairs p where h.series_id = p.drop_id;
+
+  with ranked as (
+    select b.id,
+           row_number() over (partition by b.user_id, m.keep_id order by (b.series_id = m.keep_id) desc, b.id) as rank
+    from merge_members m
+    join bookmarks b on b.series_id = m.series_id
+  )
+  delete from bookmarks b using ranked r where b.id = r.id and r.rank > 1;
+  update bookmarks b set series_id = p.keep_id from merge_pairs p where b.series_id = p.drop_id;
+
+  delete from series s using merge_pairs p where s.id = p.drop_id;
+
+  select array_agg(distinct keep_id) into keep_ids from merge_pairs;
+  if keep_ids is not null then
+    perform refresh_series_summary(keep_ids);
+  end if;
+  return moved;
+end;
+$$;
+
+revoke execute on function merge_series(jsonb) from public, anon, authenticated;
+grant execute on function merge_series(jsonb) to service_role;
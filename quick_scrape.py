@@ -1,83 +1,149 @@
 import sys
 import os
+import argparse
 import asyncio
-from playwright.async_api import async_playwright
+import json
+import time
+from urllib.parse import urlparse
 
-async def main():
-    if len(sys.argv) < 2:
-        print("Usage: python quick_scrape.py <url>")
+from browser_manager import BrowserManager
+from page_parsers import READER_IMAGE_SELECTORS
+from run_metrics import metrics
+
+# Output profiles: "html" prints the rendered document (the original behaviour); the others run
+# their extraction inside the page and print compact JSON, so callers don't re-parse megabytes of HTML.
+SERIES_WAIT = 'a[href*="/chapter/"]'
+
+async def load_page(page, url, wait_for="#readerarea"):
+    # Go to URL
+    try:
+        await page.goto(url, wait_until="domcontentloaded", timeout=60000)
+    except:
+        pass # Timeout is fine if DOM loaded
+
+    # CF Check Loop: Wait for "Just a moment..." to disappear
+    challenge_started = time.perf_counter()
+    for _ in range(30):
+        title = await page.title()
+        if "Just a moment" not in title and "Cloudflare" not in title:
+            if _ > 0:
+                metrics.count("cloudflare_challenges", host=urlparse(url).netloc)
+                metrics.observe("cloudflare_wait", time.perf_counter() - challenge_started, host=urlparse(url).netloc)
+            break
+        # Helper: Random mouse movements to prove humanity during check
+        try:
+             await page.mouse.move(100 + _*10, 100 + _*10)
+        except: pass
+        await asyncio.sleep(1)
+
+    # Try to wait for the element the caller needs (the reader area by default)
+    if not wait_for:
         return
+    try:
+        await page.wait_for_selector(wait_for, state="attached", timeout=15000)
+    except:
+        pass # Proceed anyway
+
+async def extract_chapter_images(page):
+    # Runs inside the page so only the ordered URL list crosses the wire
+    return await page.evaluate("""(selectors) => {
+        for (const sel of selectors) {
+            const found = [];
+            for (const el of document.querySelectorAll(sel)) {
+                // Prefer data-src for lazy loading sites (often contains HD)
+                const src = (el.getAttribute('data-src') || el.getAttribute('src') || '').trim();
+                if (src && !found.includes(src)) found.push(src);
+            }
+            if (found.length > 0) return found;
+        }
+        return [];
+    }""", READER_IMAGE_SELECTORS)
+
+async def extract_series(page):
+    # Same fields as page_parsers.parse_series_details, read from the live DOM
+    return await page.evaluate("""() => {
+        const withClasses = (tag, classes) => [...document.getElementsByTagName(tag)]
+            .find(el => classes.every(c => el.classList.contains(c)));
+        const firstNumber = (text) => {
+            const match = (text || '').match(/(\\d+(\\.\\d+)?)/);
+            return match ? parseFloat(match[1]) : 0;
+        };
+
+        const titleEl = withClasses('span', ['text-xl', 'font-bold']);
+        const title = titleEl ? titleEl.textContent.trim() : null;
+        const descEl = withClasses('span', ['font-medium', 'text-sm', 'text-[#A2A2A2]']);
+        const coverEl = withClasses('img', ['rounded', 'mx-auto']) || document.querySelector('.grid img');
 
-    url = sys.argv[1]
-    
-    # Use absolute path for profile to avoid CWD issues
-    # This creates a folder 'chrome_profile' in the project root to store cookies
-    user_data_dir = os.path.join(os.getcwd(), 'chrome_profile')
-    
+        const chapters = [];
+        const seen = new Set();
+        for (const link of document.querySelectorAll('a[href*="/chapter/"]')) {
+            const text = link.innerText.trim();
+            let number = firstNumber(text);
+            if (number === 0 && !text.toLowerCase().includes('prologue')) number = firstNumber(link.getAttribute('href'));
+            if (seen.has(number)) continue;
+            seen.add(number);
+            chapters.push({ number, url: link.href, title: text });
+        }
+        return {
+            title,
+            description: descEl ? descEl.innerText.trim() : '',
+            cover_url: coverEl ? coverEl.getAttribute('src') || '' : '',
+            chapters,
+        };
+    }""")
+
+async def chapter_images_profile(page):
+    return {"images": await extract_chapter_images(page)}
+
+# profile -> (element to wait for, in-page extractor or None for raw HTML)
+PROFILES = {
+    "html": ("#readerarea", None),
+    "chapter-images": ("#readerarea", chapter_images_profile),
+    "series": (SERIES_WAIT, extract_series),
+}
+
+async def main():
+    parser = argparse.ArgumentParser(description="Render one page in the shared browser and print it.")
+    parser.add_argument("url")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="html",
+                        help="html: the rendered document; chapter-images / series: compact JSON")
+    args = parser.parse_args()
+
+    url = args.url
+    wait_for, extract = PROFILES[args.profile]
+    # Called per API request, so run reports are opt-in rather than one file per page view
+    if os.getenv("QUICK_SCRAPE_METRICS") == "1":
+        metrics.start("quick_scrape")
+
+    # Same browser setup as the sync scripts; cookies carry over through the shared storage state
+    browser = BrowserManager()
     try:
-        async with async_playwright() as p:
-            # Launch PERSISTENT context to save Cloudflare cookies
-            # Note: launch_persistent_context returns a BrowserContext, not a Browser
-            context = await p.chromium.launch_persistent_context(
-                user_data_dir,
-                headless=True,
-                args=[
-                    "--disable-blink-features=AutomationControlled",
-                    "--no-sandbox",
-                    "--disable-setuid-sandbox",
-                    "--disable-infobars",
-                    "--window-position=0,0",
-                    "--ignore-certificate-errors",
-                    "--ignore-certificate-errors-spki-list",
-                    "--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-                ],
-                viewport={'width': 1920, 'height': 1080}
-            )
-            
-            # In persistent context, pages are already there or we use the first one
-            page = context.pages[0] if context.pages else await context.new_page()
-            
-            # STEALTH: Remove webdriver property
-            await page.add_init_script("""
-                Object.defineProperty(navigator, 'webdriver', {
-                    get: () => undefined
-                });
-            """)
-
-            # Go to URL
-            try:
-                await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-            except:
-                pass # Timeout is fine if DOM loaded
-
-            # CF Check Loop: Wait for "Just a moment..." to disappear
-            for _ in range(30):
-                title = await page.title()
-                if "Just a moment" not in title and "Cloudflare" not in title:
-                    break
-                # Helper: Random mouse movements to prove humanity during check
-                try:
-                     await page.mouse.move(100 + _*10, 100 + _*10)
-                except: pass
-                await asyncio.sleep(1)
-
-            # Try to wait for the specific reader element
-            try:
-                await page.wait_for_selector("#readerarea", state="attached", timeout=15000)
-            except:
-                pass # Proceed anyway
-            
-            content = await page.content()
-            
-            # Print content to stdout strictly using utf-8
-            sys.stdout.buffer.write(content.encode('utf-8'))
-            
-            # Close context (saves cookies to user_data_dir)
-            await context.close()
-            
+        async with browser.page() as page:
+            with metrics.timer("page_load", host=urlparse(url).netloc):
+                await load_page(page, url, wait_for)
+
+            if extract is None:
+                content = await page.content()
+                metrics.count("fetch_bytes", len(content.encode('utf-8')), tier="browser", host=urlparse(url).netloc)
+            else:
+                with metrics.timer("extract", profile=args.profile):
+                    data = await extract(page)
+                content = json.dumps({"url": url, **data}, ensure_ascii=False, separators=(',', ':'))
+        output = content.encode('utf-8')
+        metrics.count("output_bytes", len(output), profile=args.profile)
+
+        # Print content to stdout strictly using utf-8
+        sys.stdout.buffer.write(output)
+
     except Exception as e:
         print(f"ERROR: {e}", file=sys.stderr)
+        metrics.finish("error", echo=False)
         sys.exit(1)
+    finally:
+        # Saves cookies for the next call
+        await browser.close()
+
+    metrics.finish(echo=False)
 
 if __name__ == "__main__":
     asyncio.run(main())
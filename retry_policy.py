@@ -0,0 +1,199 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import httpx
+import requests
+import urllib3
+
+from run_metrics import metrics
+
+# One retry policy for source pages and Supabase alike:
+#   - transient failures (connection errors, timeouts, 429/5xx/Cloudflare 52x) are retried with
+#     exponential backoff and full jitter, or after Retry-After when the server says how long
+#   - each host has a circuit breaker: after BREAKER_THRESHOLD consecutive failures every caller
+#     waits out a cooldown (doubling while the host stays down) instead of hammering it
+# Anything else (404, 400, 409 ...) is returned to the caller on the first attempt.
+# POST/PATCH may already have been applied when a timeout or 5xx comes back, and chapters has no
+# unique key to absorb a second insert. So they are only resent when the request provably never
+# arrived (connect failure) or the server says "not now" (429/503 with Retry-After), unless the
+# caller passes idempotent=True (upserts with on_conflict, RPCs that recompute, absolute PATCHes).
+
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504, 520, 521, 522, 523, 524}
+REFUSED_STATUS = {429, 503}  # With Retry-After: the request was not processed
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+MAX_ATTEMPTS = 5
+BASE_DELAY = 0.5
+MAX_DELAY = 30
+MAX_RETRY_AFTER = 60  # Per attempt; a longer hint is treated as this long
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 15
+BREAKER_MAX_COOLDOWN = 300
+
+def retry_after(response):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def not_sent(error):
+    """True when the error happened before the request reached the server."""
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, requests.ConnectTimeout)):
+        return True
+    # requests wraps urllib3's MaxRetryError; its reason says whether a connection was ever made
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError))
+
+class CircuitBreaker:
+    def __init__(self, host, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.host = host
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    def wait_time(self):
+        return max(0.0, self.open_until - time.monotonic())
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures < self.threshold or self.wait_time() > 0:
+                return
+            self.open_until = time.monotonic() + self.cooldown
+            print(f"  [CIRCUIT] {self.host} failed {self.failures}x in a row; pausing it for {self.cooldown:.0f}s")
+            metrics.count("circuit_open", host=self.host)
+            # Half-open afterwards: the next failure trips it again straight away, for twice as long
+            self.failures = self.threshold - 1
+            self.cooldown = min(BREAKER_MAX_COOLDOWN, self.cooldown * 2)
+
+class RetryPolicy:
+    def __init__(self, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY, retry_status=RETRY_STATUS):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_status = retry_status
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def breaker(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(host)
+            return self.breakers[host]
+
+    def delay(self, attempt, response=None):
+        hinted = retry_after(response)
+        if hinted is not None:
+            return min(hinted, MAX_RETRY_AFTER)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _outcome(self, breaker, attempt, response=None, error=None, idempotent=True):
+        """Seconds to wait before the next attempt, or None when this result is final."""
+        transient = error is not None or response.status_code in self.retry_status
+        if not transient:
+            breaker.success()
+            return None
+        breaker.failure()
+        if attempt + 1 >= self.max_attempts:
+            return None
+        if not idempotent:
+            if error is not None and not not_sent(error):
+                return None
+            if response is not None and not (response.status_code in REFUSED_STATUS and retry_after(response) is not None):
+                return None
+        reason = type(error).__name__ if error is not None else response.status_code
+        metrics.count("retries", host=breaker.host, reason=reason)
+        return self.delay(attempt, response)
+
+    def request(self, session, method, url, idempotent=None, **kwargs):
+        """
+        session: requests / a requests.Session / cloudscraper. Returns the last response or raises the last error.
+        idempotent: safe to resend after an unclear failure (default: by method).
+        """
+        kwargs.setdefault("timeout", 30)
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        breaker = self.breaker(url)
+        for attempt in range(self.max_attempts):
+            time.sleep(breaker.wait_time())
+            response, error = None, None
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            wait = self._outcome(breaker, attempt, response, error, idempotent)
+            if wait is None:
+                if response is None:
+                    raise error
+                return response
+            time.sleep(wait)
+
+    async def arequest(self, client, method, url, idempotent=None, **kwargs):
+        """Same for an httpx.AsyncClient."""
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        breaker = self.breaker(url)
+        for attempt in range(self.max_attempts):
+            await asyncio.sleep(breaker.wait_time())
+            response, error = None, None
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                error = e
+            wait = self._outcome(breaker, attempt, response, error, idempotent)
+            if wait is None:
+                if response is None:
+                    raise error
+                return response
+            await asyncio.sleep(wait)
+
+    def summary(self):
+        paused = [b.host for b in self.breakers.values() if b.wait_time() > 0]
+        return f"[RETRY] {len(self.breakers)} hosts seen" + (f", paused: {', '.join(paused)}" if paused else ".")
+
+policy = RetryPolicy()
+
+class RetryingSession:
+    """Wraps a requests-style session (cloudscraper) so get/post/... go through the policy."""
+
+    def __init__(self, session, retry=policy):
+        self.session = session
+        self.retry = retry
+
+    def request(self, method, url, **kwargs):
+        return self.retry.request(self.session, method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def pause(self, seconds):
+        time.sleep(seconds)
@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Per-run timers and counters for the sync scripts. Shared modules record into the module-level
+# `metrics`; the script that owns the run calls metrics.start(job) / metrics.finish(), which writes
+#   reports/<job>-<timestamp>.json   full report (kept per run, for comparing runs)
+#   reports/inkflow_<job>.prom       Prometheus textfile (node_exporter textfile collector format)
+# Recording without start() is harmless; finish() is what writes anything.
+
+REPORT_DIR = os.getenv("RUN_REPORT_DIR", os.path.join(os.getcwd(), 'reports'))
+PROM_DIR = os.getenv("METRICS_TEXTFILE_DIR", REPORT_DIR)
+
+# Seconds; covers everything from a cached DB lookup to a Cloudflare wait
+BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+def _key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+    def to_dict(self):
+        return {"count": self.count, "sum": round(self.sum, 4), "max": round(self.max, 4),
+                "avg": round(self.sum / self.count, 4) if self.count else 0,
+                "buckets": dict(zip([str(b) for b in BUCKETS], self.buckets))}
+
+class RunMetrics:
+    def __init__(self):
+        # BatchWriter's pool threads and asyncio.to_thread callers record concurrently; every update
+        # and every snapshot holds this, so a report never disagrees with itself (buckets vs count)
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.job = None
+        self.started = time.time()
+        self.timers = defaultdict(Histogram)  # (stage, labels) -> Histogram
+        self.counters = defaultdict(float)    # (name, labels) -> total
+
+    def start(self, job):
+        with self.lock:
+            self._reset()
+            self.job = job
+
+    # --- Recording ---
+
+    def observe(self, stage, seconds, **labels):
+        with self.lock:
+            self.timers[(stage, _key(labels))].observe(seconds)
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        """`with metrics.timer("db.insert"):` -- works around awaits too (wall time)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, **labels)
+
+    def count(self, name, n=1, **labels):
+        with self.lock:
+            self.counters[(name, _key(labels))] += n
+
+    # --- Output ---
+
+    def report(self, status="ok"):
+        with self.lock:
+            return {
+                "job": self.job,
+                "status": status,
+                "started_at": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+                "duration_seconds": round(time.time() - self.started, 3),
+                "timers": [{"stage": stage, **dict(labels), **hist.to_dict()}
+                           for (stage, labels), hist in sorted(self.timers.items())],
+                "counters": [{"name": name, **dict(labels), "value": value}
+                             for (name, labels), value in sorted(self.counters.items())],
+            }
+
+    def prometheus(self, status="ok"):
+        def fmt(labels):
+            return ",".join(f'{k}="{v}"' for k, v in (("script", self.job),) + labels)
+
+        with self.lock:
+            lines = ["# TYPE inkflow_stage_seconds histogram"]
+            for (stage, labels), hist in sorted(self.timers.items()):
+                base = (("stage", stage),) + labels
+                for bound, n in zip(BUCKETS, hist.buckets):
+                    lines.append(f"inkflow_stage_seconds_bucket{{{fmt(base + (('le', str(bound)),))}}} {n}")
+                lines.append(f"inkflow_stage_seconds_bucket{{{fmt(base + (('le', '+Inf'),))}}} {hist.count}")
+                lines.append(f"inkflow_stage_seconds_sum{{{fmt(base)}}} {hist.sum:.6f}")
+                lines.append(f"inkflow_stage_seconds_count{{{fmt(base)}}} {hist.count}")
+
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                lines.append(f"# TYPE inkflow_{name}_total counter")
+                for (n, labels), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f"inkflow_{name}_total{{{fmt(labels)}}} {value:g}")
+
+            lines.append("# TYPE inkflow_run_duration_seconds gauge")
+            lines.append(f"inkflow_run_duration_seconds{{{fmt(())}}} {time.time() - self.started:.3f}")
+            lines.append("# TYPE inkflow_run_success gauge")
+            lines.append(f"inkflow_run_success{{{fmt(())}}} {int(status == 'ok')}")
+            lines.append("# TYPE inkflow_run_finished_timestamp_seconds gauge")
+            lines.append(f"inkflow_run_finished_timestamp_seconds{{{fmt(())}}} {time.time():.0f}")
+            return "\n".join(lines) + "\n"
+
+    def summary(self):
+        # Slowest stages by total time, for the end of the log
+        with self.lock:
+            totals = defaultdict(lambda: [0, 0.0])
+            for (stage, _), hist in self.timers.items():
+                totals[stage][0] += hist.count
+                totals[stage][1] += hist.sum
+            parts = [f"{stage} {n}x {total:.1f}s" for stage, (n, total) in sorted(totals.items(), key=lambda t: -t[1][1])]
+            return "[METRICS] " + (", ".join(parts) if parts else "no stages recorded")
+
+    def finish(self, status="ok", echo=True):
+        if self.job is None:
+            return None
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        report_path = os.path.join(REPORT_DIR, f"{self.job}-{stamp}.json")
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(status), f, indent=2)
+
+        self.write_textfile(status)
+
+        # echo=False for scripts whose stdout is data and stderr is errors only (quick_scrape)
+        if echo:
+            print(self.summary())
+        return report_path
+
+    def write_textfile(self, status="ok"):
+        """Also called mid-run by long-lived processes (scraper --watch)."""
+        if self.job is None:
+            return
+        os.makedirs(PROM_DIR, exist_ok=True)
+        # Write-then-rename so the collector never reads a half-written file
+        prom_path = os.path.join(PROM_DIR, f"inkflow_{self.job}.prom")
+        with open(prom_path + ".tmp", 'w', encoding='utf-8') as f:
+            f.write(self.prometheus(status))
+        os.replace(prom_path + ".tmp", prom_path)
+
+metrics = RunMetrics()
@@ -1,13 +1,23 @@
+import argparse
 import asyncio
+import hashlib
+import json
 import os
-import re
+import random
 from datetime import datetime, timezone
-from urllib.parse import urljoin
 
 import httpx
-from playwright.async_api import async_playwright
 from dotenv import load_dotenv
 
+from chapter_manifest import resolve_chapters
+from series_summary import refresh_series_summary_async
+from search_index import index_series_async
+from page_parsers import parse_homepage, parse_series_details, parse_series_payload
+from batch_writer import BatchWriter
+from retry_policy import policy
+from run_metrics import metrics
+from tiered_fetch import TieredFetcher, HOMEPAGE_MARKERS, HOMEPAGE_WAIT, SERIES_MARKERS, SERIES_WAIT
+
 load_dotenv('.env.local')
 
 SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
@@ -24,12 +34,24 @@ HEADERS = {
     "Prefer": "return=representation"
 }
 
+HOMEPAGE_URL = "https://asuracomic.net/"
+
+# "payload": read series pages from the JSON the frontend ships/fetches, selectors only as fallback
+# "dom":     selectors only (the pre-payload behaviour)
+EXTRACT_MODE = os.getenv("EXTRACT_MODE", "payload")
+
+# Large back-catalogues go out as several parallel, byte-sized batches instead of one payload.
+# chapters has no unique (series_id, chapter_number) key, so callers only pass numbers not stored yet.
+chapter_writer = BatchWriter("chapters", "return=representation")
+PAGE_SIZE = 1000
+
 # --- Database Helpers ---
 
 async def get_series_by_title(client, title):
-    url = f"{SUPABASE_URL}/rest/v1/series?title=eq.{title}&select=id,title"
+    url = f"{SUPABASE_URL}/rest/v1/series?title=eq.{title}&select=id,title,latest_chapter_number"
     try:
-        response = await client.get(url, headers=HEADERS)
+        with metrics.timer("db.lookup", table="series"):
+            response = await policy.arequest(client, "GET", url, headers=HEADERS)
         response.raise_for_status()
         data = response.json()
         return data[0] if data else None
@@ -40,7 +62,8 @@ async def get_series_by_title(client, title):
 async def get_latest_chapter(client, series_id):
     url = f"{SUPABASE_URL}/rest/v1/chapters?series_id=eq.{series_id}&select=chapter_number&order=chapter_number.desc&limit=1"
     try:
-        response = await client.get(url, headers=HEADERS)
+        with metrics.timer("db.lookup", table="chapters"):
+            response = await policy.arequest(client, "GET", url, headers=HEADERS)
         response.raise_for_status()
         data = response.json()
         return data[0]['chapter_number'] if data else 0
@@ -48,6 +71,26 @@ async def get_latest_chapter(client, series_id):
         print(f"Error fetching latest chapter: {e}")
         return 0
 
+async def get_chapter_numbers(client, series_id):
+    """Chapter numbers already stored for a series, or None when they can't be read."""
+    numbers = set()
+    offset = 0
+    try:
+        while True:
+            url = (f"{SUPABASE_URL}/rest/v1/chapters?series_id=eq.{series_id}&select=chapter_number"
+                   f"&order=chapter_number&limit={PAGE_SIZE}&offset={offset}")
+            with metrics.timer("db.lookup", table="chapters"):
+                response = await policy.arequest(client, "GET", url, headers=HEADERS)
+            response.raise_for_status()
+            page = response.json()
+            numbers.update(float(r['chapter_number']) for r in page)
+            if len(page) < PAGE_SIZE:
+                return numbers
+            offset += PAGE_SIZE
+    except Exception as e:
+        print(f"Error fetching stored chapters: {e}")
+        return None
+
 async def upsert_series(client, title, description, cover_url, status="ongoing"):
     url = f"{SUPABASE_URL}/rest/v1/series"
     payload = {
@@ -63,25 +106,28 @@ async def upsert_series(client, title, description, cover_url, status="ongoing")
     try:
         if existing:
             patch_url = f"{SUPABASE_URL}/rest/v1/series?id=eq.{existing['id']}"
-            response = await client.patch(patch_url, headers=HEADERS, json=payload)
+            with metrics.timer("db.write", table="series"):
+                # Sets absolute values, so resending is harmless
+                response = await policy.arequest(client, "PATCH", patch_url, headers=HEADERS, json=payload, idempotent=True)
             response.raise_for_status()
             print(f"Updated series: {title}")
-            return existing['id']
+            series_id = existing['id']
         else:
-            response = await client.post(url, headers=HEADERS, json=payload)
+            with metrics.timer("db.write", table="series"):
+                response = await policy.arequest(client, "POST", url, headers=HEADERS, json=payload)
             response.raise_for_status()
             data = response.json()
             print(f"Inserted new series: {title}")
-            return data[0]['id']
+            series_id = data[0]['id']
+        metrics.count("rows_written", table="series")
+
+        await index_series_async(client, [{"id": series_id, "title": title, "description": description}])
+        return series_id
     except Exception as e:
         print(f"Error upserting series {title}: {e}")
         return None
 
 async def insert_chapters(client, series_id, chapters):
-    url = f"{SUPABASE_URL}/rest/v1/chapters"
-    headers = HEADERS.copy()
-    headers['Prefer'] = 'resolution=ignore-duplicates'
-    
     payloads = []
     for ch in chapters:
         payloads.append({
@@ -93,175 +139,200 @@ async def insert_chapters(client, series_id, chapters):
         })
         
     if not payloads:
-        return
+        return []
 
     try:
-        response = await client.post(url, headers=headers, json=payloads)
-        response.raise_for_status()
-        # print(f"Inserted/Ignored {len(payloads)} chapters for Series ID {series_id}")
+        return await asyncio.to_thread(chapter_writer.write, payloads)
     except Exception as e:
         print(f"Error batch inserting chapters: {e}")
+        metrics.count("db_errors", table="chapters")
+        return []
 
 
 # --- Scraper Logic ---
 
-async def parse_number(text):
-    match = re.search(r'(\d+(\.\d+)?)', text)
-    if match:
-        return float(match.group(1))
-    return 0.0
-
-async def scrape_series_details_and_chapters(page, series_url, title_hint=None):
+async def scrape_series_details_and_chapters(fetcher, series_url, title_hint=None):
     print(f"Visiting series page: {series_url}")
-    await page.goto(series_url, wait_until="domcontentloaded")
-    
-    # Metadata
-    # Title: Found as span.text-xl.font-bold
-    title_el = await page.query_selector('span.text-xl.font-bold')
-    title = await title_el.inner_text() if title_el else (title_hint or "Unknown")
-    
-    # Description
-    description = ""
-    # Strategy 2: Specific class found in debug
-    desc_el = await page.query_selector(r'span.font-medium.text-sm.text-\[\#A2A2A2\]')
-    if desc_el:
-        description = await desc_el.inner_text()
-        
-    # Cover Image
-    cover_el = await page.query_selector('img.rounded.mx-auto')
-    if not cover_el:
-        cover_el = await page.query_selector('img[alt="' + title + '"]')
-        
-    cover_url = await cover_el.get_attribute('src') if cover_el else ""
-    
-    if not cover_url:
-         # Fallback
-         cover_el = await page.query_selector('.grid img') 
-         if cover_el:
-            cover_url = await cover_el.get_attribute('src')
+    payload_mode = EXTRACT_MODE == "payload"
+    result = await fetcher.fetch(series_url, SERIES_MARKERS, SERIES_WAIT, capture=payload_mode)
 
-    status = "ongoing"
+    data = None
+    if payload_mode:
+        with metrics.timer("parse", page="series", mode="payload"):
+            data = parse_series_payload(result.content, series_url, title_hint, result.captured)
+    mode = "payload"
+    if data is None:
+        # No embedded/captured data matched (layout change, older page): walk the DOM as before
+        mode = "dom"
+        with metrics.timer("parse", page="series", mode="dom"):
+            data = parse_series_details(result.content, series_url, title_hint)
+    metrics.count("extract", mode=mode)
+    print(f"Scraped {len(data['chapters'])} chapters for {data['title']} (via {result.tier}, {mode})")
+    return data
 
-    # Chapters
-    chapter_links = await page.query_selector_all('a[href*="/chapter/"]')
-    
-    chapters = []
-    seen_nums = set()
-    
-    for link in chapter_links:
-        href = await link.get_attribute('href')
-        text = await link.inner_text()
-        num = await parse_number(text)
-        if num == 0 and "prologue" not in text.lower():
-             num = await parse_number(href)
-             
-        if num not in seen_nums:
-            seen_nums.add(num)
-            chapters.append({
-                "number": num,
-                "url": href,
-                "title": text.strip()
-            })
-            
-    print(f"Scraped {len(chapters)} chapters for {title}")
-    return {
-        "title": title,
-        "description": description,
-        "cover_url": cover_url,
-        "status": status,
-        "chapters": chapters
-    }
+async def process_candidate(client, fetcher, candidate):
+    """Syncs one homepage card. Returns False only when it failed (so watch mode retries it)."""
+    url = candidate['url']
+    title = candidate['title']
+    home_latest_chapter = candidate['latest_chapter']
+
+    print(f"Processing: {title} (Latest: {home_latest_chapter})")
+
+    try:
+        # Smart Logic Check
+        existing = await get_series_by_title(client, title)
+
+        if existing:
+            # Denormalized by refresh_series_summary; only query chapters if it was never built
+            db_latest = existing.get('latest_chapter_number')
+            if db_latest is None:
+                db_latest = await get_latest_chapter(client, existing['id'])
+            if home_latest_chapter <= db_latest and home_latest_chapter > 0:
+                print(f"  [SKIP] Up to date (DB: {db_latest}, Web: {home_latest_chapter})")
+                metrics.count("series", outcome="skipped")
+                return True
+            else:
+                print(f"  [UPDATE] Checking for new chapters (DB: {db_latest}, Web: {home_latest_chapter})")
+        else:
+            print("  [NEW] Series detected.")
+
+        # If not skipped, scrape detailed page
+        data = await scrape_series_details_and_chapters(fetcher, url, title_hint=title)
+
+        if not data['title'] or data['title'] == "Unknown":
+            print("  [ERROR] Missing title after scrape.")
+            metrics.count("series", outcome="failed")
+            return False
+
+        series_id = existing['id'] if existing else None
+        if not existing:
+            series_id = await upsert_series(client, data['title'], data['description'], data['cover_url'], data['status'])
+
+        # Only chapters the DB doesn't have yet: nothing would stop a duplicate insert
+        chapters = data['chapters']
+        if existing:
+            stored = await get_chapter_numbers(client, existing['id'])
+            if stored is None:
+                chapters = [ch for ch in chapters if ch['number'] > db_latest]
+            else:
+                chapters = [ch for ch in chapters if float(ch['number']) not in stored]
+            metrics.count("rows_ignored", len(data['chapters']) - len(chapters), table="chapters")
+
+        if series_id:
+            new_chapters = await insert_chapters(client, series_id, chapters)
+            if new_chapters:
+                await refresh_series_summary_async(client, [series_id])
+            print(f"  [SUCCESS] Synced {title}")
+            metrics.count("series", outcome="updated" if existing else "new")
+
+            # Resolve image manifests for the new chapters through the same fetcher
+            if new_chapters:
+                await resolve_chapters(client, fetcher, new_chapters)
+        return bool(series_id)
+
+    except Exception as e:
+        print(f"  [ERROR] Failed to process {title}: {e}")
+        metrics.count("series", outcome="failed")
+        return False
+
+async def fetch_homepage(fetcher):
+    home = await fetcher.fetch(HOMEPAGE_URL, HOMEPAGE_MARKERS, HOMEPAGE_WAIT)
+    with metrics.timer("parse", page="homepage"):
+        return parse_homepage(home.content, HOMEPAGE_URL)
+
+def card_list_hash(candidates):
+    # Only what the sync decision depends on; order included since the feed is sorted by update time
+    key = [(c['url'], c['latest_chapter']) for c in candidates]
+    return hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
 
 async def main():
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
-        
-        # 1. Go to Homepage
-        print("Scraper Started. Navigating to https://asuracomic.net/ ...")
-        await page.goto("https://asuracomic.net/", wait_until="domcontentloaded")
-        
-        # 2. Extract Data from Homepage Grid
-        # Selector for series card: div.w-full.p-1.border-b-\[1px\].border-b-\[\#312f40\]
-        cards = await page.query_selector_all(r'div.w-full.p-1.border-b-\[1px\].border-b-\[\#312f40\]')
-        print(f"Found {len(cards)} series cards on homepage.")
-        
-        series_candidates = []
-        for card in cards:
-            try:
-                # Title & Link Selector: span.text-\[15px\].font-medium a
-                title_link_el = await card.query_selector(r'span.text-\[15px\].font-medium a')
-                if title_link_el:
-                     title = await title_link_el.inner_text()
-                     href = await title_link_el.get_attribute('href')
-                     full_url = urljoin("https://asuracomic.net/", href)
-                     
-                     # Latest Chapter Selector: div.flex.flex-col.gap-y-1.5 a p
-                     # Finding the chapter text is slightly nested
-                     latest_ch_text = "0"
-                     ch_el = await card.query_selector(r'div.flex.flex-col.gap-y-1.5 a')
-                     if ch_el:
-                         latest_ch_text = await ch_el.inner_text()
-                     
-                     latest_ch_num = await parse_number(latest_ch_text)
-                     
-                     series_candidates.append({
-                         "title": title.strip(),
-                         "url": full_url,
-                         "latest_chapter": latest_ch_num
-                     })
-            except Exception as e:
-                print(f"Error parsing card: {e}")
-                continue
-
-        print(f"Successfully parsed {len(series_candidates)} candidates.")
-        
-        async with httpx.AsyncClient() as client:
+    metrics.start("scraper")
+    async with httpx.AsyncClient() as client:
+        # Plain HTTP first; Chromium only starts if a page turns out to need rendering
+        fetcher = TieredFetcher(client)
+        try:
+            # 1. Go to Homepage
+            print(f"Scraper Started. Fetching {HOMEPAGE_URL} ...")
+
+            # 2. Extract Data from Homepage Grid (see page_parsers.parse_homepage)
+            listing = await fetch_homepage(fetcher)
+            print(f"Found {listing['cards']} series cards on homepage.")
+            series_candidates = listing['series']
+            print(f"Successfully parsed {len(series_candidates)} candidates.")
+
             for candidate in series_candidates:
-                url = candidate['url']
-                title = candidate['title']
-                home_latest_chapter = candidate['latest_chapter']
-                
-                print(f"Processing: {title} (Latest: {home_latest_chapter})")
+                await process_candidate(client, fetcher, candidate)
+                print("-" * 20)
+            print("Auto-discovery complete.")
+        finally:
+            await fetcher.close()
+            print(fetcher.summary())
+            print(chapter_writer.summary())
+            metrics.finish()
 
-                try:
-                    # Smart Logic Check
-                    existing = await get_series_by_title(client, title)
-                    
-                    if existing:
-                        db_latest = await get_latest_chapter(client, existing['id'])
-                        if home_latest_chapter <= db_latest and home_latest_chapter > 0:
-                            print(f"  [SKIP] Up to date (DB: {db_latest}, Web: {home_latest_chapter})")
-                            continue
-                        else:
-                            print(f"  [UPDATE] Checking for new chapters (DB: {db_latest}, Web: {home_latest_chapter})")
-                    else:
-                        print("  [NEW] Series detected.")
-
-                    # If not skipped, scrape detailed page
-                    data = await scrape_series_details_and_chapters(page, url, title_hint=title)
-                    
-                    if not data['title'] or data['title'] == "Unknown":
-                        print("  [ERROR] Missing title after scrape.")
-                        continue
-                        
-                    series_id = existing['id'] if existing else None
-                    if not existing:
-                        series_id = await upsert_series(client, data['title'], data['description'], data['cover_url'], data['status'])
-                    
-                    # Insert all chapters (duplicates ignored by DB)
-                    if series_id:
-                        await insert_chapters(client, series_id, data['chapters'])
-                        print(f"  [SUCCESS] Synced {title}")
+# --- Watch Mode ---
+# One long-lived process instead of the 3-hourly cron: the DB client, the fetcher's tier memory
+# and (if ever needed) the browser stay warm, and a poll costs one homepage request.
+
+async def watch(interval=45, max_backoff=600):
+    print(f"=== Scraper Watch Mode (polling {HOMEPAGE_URL} every ~{interval}s) ===")
+    metrics.start("scraper_watch")
+    last_hash = None
+    last_seen = {}  # series URL -> latest chapter number we have synced
+    failures = 0
 
+    async with httpx.AsyncClient() as client:
+        fetcher = TieredFetcher(client)
+        try:
+            while True:
+                try:
+                    candidates = (await fetch_homepage(fetcher))['series']
+                    failures = 0
                 except Exception as e:
-                    print(f"  [ERROR] Failed to process {title}: {e}")
+                    failures += 1
+                    delay = min(interval * 2 ** failures, max_backoff)
+                    print(f"[WATCH] Homepage fetch failed ({e}); retrying in {delay:.0f}s")
+                    await asyncio.sleep(delay)
                     continue
-                
-                print("-" * 20)
 
-        await browser.close()
-        print("Auto-discovery complete.")
+                metrics.count("polls")
+                current_hash = card_list_hash(candidates)
+                if current_hash != last_hash and candidates:
+                    changed = [c for c in candidates if last_seen.get(c['url']) != c['latest_chapter']]
+                    print(f"[WATCH] Feed changed: {len(changed)} of {len(candidates)} series to check.")
+                    retry = False
+                    for candidate in changed:
+                        if await process_candidate(client, fetcher, candidate):
+                            last_seen[candidate['url']] = candidate['latest_chapter']
+                        else:
+                            retry = True
+                    # A failed series keeps the old hash so the next poll picks it up again
+                    last_hash = None if retry else current_hash
+                    fetcher.save()
+                else:
+                    metrics.count("polls_unchanged")
+                metrics.write_textfile()
+
+                await asyncio.sleep(interval * random.uniform(0.8, 1.2))
+        finally:
+            await fetcher.close()
+            print(fetcher.summary())
+            print(chapter_writer.summary())
+            metrics.finish()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Sync new series/chapters from the homepage feed.")
+    parser.add_argument("--watch", action="store_true", help="Keep running and poll the homepage")
+    parser.add_argument("--interval", type=float, default=45, help="Seconds between homepage polls in watch mode")
+    parser.add_argument("--extract", choices=["payload", "dom"], default=EXTRACT_MODE,
+                        help="Series pages: embedded/captured JSON with selector fallback, or selectors only")
+    args = parser.parse_args()
+    EXTRACT_MODE = args.extract
+
+    if args.watch:
+        try:
+            asyncio.run(watch(args.interval))
+        except KeyboardInterrupt:
+            print("Watch mode stopped.")
+    else:
+        asyncio.run(main())
@@ -0,0 +1,122 @@
+import argparse
+import math
+import os
+import re
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import requests
+from dotenv import load_dotenv
+
+from retry_policy import policy
+
+load_dotenv('.env.local')
+
+SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+SUPABASE_KEY = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+
+if not SUPABASE_URL or not SUPABASE_KEY:
+    print("Error: Missing Supabase credentials in .env.local")
+    exit(1)
+
+HEADERS = {
+    "apikey": SUPABASE_KEY,
+    "Authorization": f"Bearer {SUPABASE_KEY}",
+    "Content-Type": "application/json",
+    "Prefer": "return=representation"
+}
+
+INDEX_URL = f"{SUPABASE_URL}/rest/v1/series_search"
+PAGE_SIZE = 1000
+BATCH_SIZE = 500
+
+# --- Index Entries ---
+
+def normalize(text):
+    # Must stay in line with the query normalization in search_series() (production_upgrade.sql)
+    # Apostrophes are dropped so "Berserker's" and "berserkers" index the same
+    text = re.sub(r"['\u2019]", '', (text or '').lower())
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ', text).split())
+
+def slug_title(url):
+    # "series/the-berserkers-second-playthrough-8a65d632" -> "the berserkers second playthrough"
+    slug = urlparse(url).path.rstrip('/').rsplit('/', 1)[-1]
+    slug = re.sub(r'-[0-9a-f]{8}$', '', slug)
+    return normalize(slug.replace('-', ' '))
+
+def build_entry(series):
+    terms = [normalize(series['title'])]
+
+    # The source slug is a free alternate title (different punctuation, romanization)
+    match = re.search(r'https?://[^\s]+', series.get('description') or '')
+    if match:
+        terms.append(slug_title(match.group(0)))
+
+    popularity = (series.get('rating') or 0) + math.log1p(series.get('chapter_count') or 0)
+    return {
+        "series_id": series['id'],
+        "search_text": " | ".join(t for t in dict.fromkeys(terms) if t),
+        "popularity": round(popularity, 3),
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+
+def _batches(series_rows):
+    entries = [build_entry(s) for s in series_rows if s.get('title')]
+    for i in range(0, len(entries), BATCH_SIZE):
+        yield entries[i:i + BATCH_SIZE]
+
+def _index_headers():
+    headers = HEADERS.copy()
+    headers['Prefer'] = 'resolution=merge-duplicates,return=minimal'
+    return headers
+
+def index_series(series_rows):
+    """Upserts search entries for the given series rows (id, title, description[, rating, chapter_count])."""
+    for batch in _batches(series_rows):
+        try:
+            res = policy.request(requests, "POST", INDEX_URL, headers=_index_headers(), json=batch, idempotent=True)
+            if res.status_code >= 300:
+                print(f"  [WARN] Search index update failed: {res.text}")
+        except Exception as e:
+            print(f"  [WARN] Search index update failed: {e}")
+
+async def index_series_async(client, series_rows):
+    for batch in _batches(series_rows):
+        try:
+            res = await policy.arequest(client, "POST", INDEX_URL, headers=_index_headers(), json=batch,
+                                           idempotent=True)
+            res.raise_for_status()
+        except Exception as e:
+            print(f"  [WARN] Search index update failed: {e}")
+
+# --- Rebuild Job ---
+
+def get_series(since=None):
+    rows = []
+    offset = 0
+    while True:
+        url = (f"{SUPABASE_URL}/rest/v1/series?select=id,title,description,rating,chapter_count"
+               f"&order=id&limit={PAGE_SIZE}&offset={offset}")
+        if since:
+            url += f"&updated_at=gte.{since}"
+        response = policy.request(requests, "GET", url, headers=HEADERS)
+        response.raise_for_status()
+        page = response.json()
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        offset += PAGE_SIZE
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the trigram search index for series titles.")
+    parser.add_argument("--since", help="Only re-index series updated at or after this ISO timestamp")
+    args = parser.parse_args()
+
+    print("=== Series Search Index Builder ===")
+    series_rows = get_series(args.since)
+    print(f"Indexing {len(series_rows)} series...")
+    index_series(series_rows)
+    print("Search index build complete.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+
+import requests
+from dotenv import load_dotenv
+
+from retry_policy import policy
+
+load_dotenv('.env.local')
+
+SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+SUPABASE_KEY = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+
+if not SUPABASE_URL or not SUPABASE_KEY:
+    print("Error: Missing Supabase credentials in .env.local")
+    exit(1)
+
+HEADERS = {
+    "apikey": SUPABASE_KEY,
+    "Authorization": f"Bearer {SUPABASE_KEY}",
+    "Content-Type": "application/json",
+    "Prefer": "return=representation"
+}
+
+# Recomputes series.latest_chapter_number / latest_chapter_at / chapter_count and the
+# chapters' ordinal / prev / next links (see production_upgrade.sql). None means every series.
+RPC_URL = f"{SUPABASE_URL}/rest/v1/rpc/refresh_series_summary"
+
+def refresh_series_summary(series_ids=None):
+    payload = {"series_ids": list(series_ids) if series_ids is not None else None}
+    try:
+        response = policy.request(requests, "POST", RPC_URL, headers=HEADERS, json=payload, idempotent=True)
+        if response.status_code < 300:
+            return response.json()
+        print(f"  [WARN] Summary refresh failed: {response.text}")
+    except Exception as e:
+        print(f"  [WARN] Summary refresh failed: {e}")
+    return 0
+
+async def refresh_series_summary_async(client, series_ids=None):
+    payload = {"series_ids": list(series_ids) if series_ids is not None else None}
+    try:
+        response = await policy.arequest(client, "POST", RPC_URL, headers=HEADERS, json=payload, idempotent=True)
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        print(f"  [WARN] Summary refresh failed: {e}")
+        return 0
+
+if __name__ == "__main__":
+    # One-shot rebuild for every series
+    print("=== Rebuilding Series Chapter Summaries & Navigation ===")
+    updated = refresh_series_summary()
+    print(f"Rebuilt summaries for {updated} series.")
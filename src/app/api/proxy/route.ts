@@ -6,6 +6,35 @@ export async function GET(request: NextRequest) {
 
     if (!targetUrl) return new NextResponse('No URL', { status: 400 });
 
+    // Prefer the local content-addressed cache (image_cache.py serve) when configured
+    const cacheUrl = process.env.IMAGE_CACHE_URL;
+    if (cacheUrl) {
+        try {
+            const forwarded: Record<string, string> = {};
+            for (const name of ['Range', 'If-None-Match']) {
+                const value = request.headers.get(name);
+                if (value) forwarded[name] = value;
+            }
+
+            const cached = await fetch(`${cacheUrl}/image?url=${encodeURIComponent(targetUrl)}`, { headers: forwarded });
+            if (cached.status < 500) {
+                const headers: Record<string, string> = {
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Allow-Methods': 'GET, OPTIONS, HEAD',
+                    'Access-Control-Allow-Headers': 'Content-Type, Referer, User-Agent, Range',
+                };
+                for (const name of ['Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges', 'ETag', 'Cache-Control']) {
+                    const value = cached.headers.get(name);
+                    if (value) headers[name] = value;
+                }
+                return new NextResponse(cached.status === 304 ? null : cached.body, { status: cached.status, headers });
+            }
+        } catch (e) {
+            // Cache service down: fall through to the origin
+            console.warn('Image cache unavailable:', e);
+        }
+    }
+
     try {
         // 15s Timeout for Source Fetch
         const controller = new AbortController();
@@ -1,15 +1,21 @@
 import { NextRequest, NextResponse } from 'next/server';
-import { exec } from 'child_process';
+import { execFile } from 'child_process';
 import { promisify } from 'util';
 import path from 'path';
 
-const execAsync = promisify(exec);
+const execFileAsync = promisify(execFile);
+
+// quick_scrape.py --profile: 'html' returns the rendered page, the others compact JSON extracted in the browser
+const PROFILES = ['html', 'chapter-images', 'series'];
 
 export async function GET(request: NextRequest) {
     const { searchParams } = new URL(request.url);
     const targetUrl = searchParams.get('url');
+    const profile = searchParams.get('profile') ?? 'html';
 
     if (!targetUrl) return new NextResponse('No URL', { status: 400 });
+    if (!PROFILES.includes(profile)) return new NextResponse(`Unknown profile: ${profile}`, { status: 400 });
+    const isHtml = profile === 'html';
 
     try {
         // Resolve path to the python script
@@ -18,8 +24,9 @@ export async function GET(request: NextRequest) {
 
         // Execute Python script
         // NOTE: 'python' command must be in system PATH and have playwright installed
-        const { stdout, stderr } = await execAsync(`python "${scriptPath}" "${targetUrl}"`, {
-            maxBuffer: 1024 * 1024 * 10 // 10MB buffer
+        const { stdout, stderr } = await execFileAsync('python', [scriptPath, targetUrl, '--profile', profile], {
+            // A full document can be megabytes; the JSON profiles are a few KB
+            maxBuffer: 1024 * 1024 * (isHtml ? 10 : 1)
         });
 
         if (stderr) {
@@ -34,7 +41,7 @@ export async function GET(request: NextRequest) {
 
         return new NextResponse(stdout, {
             headers: {
-                'Content-Type': 'text/html',
+                'Content-Type': isHtml ? 'text/html' : 'application/json',
                 'Cache-Control': 'no-store, max-age=0',
             },
         });
@@ -17,7 +17,7 @@ export default async function LibraryPage({ searchParams }: LibraryPageProps) {
 
     const { data: seriesList, error, count } = await supabase
         .from('series')
-        .select('*, chapters(chapter_number)', { count: 'exact' })
+        .select('*', { count: 'exact' })
         .order('updated_at', { ascending: false })
         .range(from, to)
 
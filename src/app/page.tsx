@@ -26,11 +26,7 @@ interface Series {
 
   updated_at: string
 
-  chapters: {
-
-    chapter_number: number
-
-  }[]
+  latest_chapter_number: number | null
 
 }
 
@@ -42,7 +38,7 @@ async function getLatestManhwa() {
 
     .from('series')
 
-    .select('*, chapters(chapter_number)')
+    .select('*')
 
     .order('updated_at', { ascending: false })
 
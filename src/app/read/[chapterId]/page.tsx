@@ -1,6 +1,7 @@
 import { supabase } from '@/lib/supabaseClient'
 import Link from 'next/link'
 import * as cheerio from 'cheerio'
+import ReaderImage, { PageVariants } from '@/components/ReaderImage'
 
 // Force dynamic rendering since we are scraping live
 export const dynamic = 'force-dynamic'
@@ -12,10 +13,10 @@ interface ReaderPageProps {
 export default async function ReaderPage({ params }: ReaderPageProps) {
     const { chapterId } = await params
 
-    // 1. Fetch Chapter Info from Supabase
+    // 1. Fetch Chapter Info (and its precomputed image manifest) from Supabase
     const { data: chapter, error } = await supabase
         .from('chapters')
-        .select('*, series(*)')
+        .select('*, series(*), chapter_pages(image_urls, dimensions, variants)')
         .eq('id', chapterId)
         .single()
 
@@ -30,25 +31,34 @@ export default async function ReaderPage({ params }: ReaderPageProps) {
         )
     }
 
-    // 2. Fetch Adjacent Chapters for Navigation
-    const { data: adjacentChapters } = await supabase
-        .from('chapters')
-        .select('id, chapter_number')
-        .eq('series_id', chapter.series_id)
-        .order('chapter_number', { ascending: true })
-
-    // Find current index
-    const currentIndex = adjacentChapters?.findIndex(c => c.id === chapter.id) ?? -1
-    const prevChapter = currentIndex > 0 ? adjacentChapters?.[currentIndex - 1] : null
-    const nextChapter = currentIndex !== -1 && adjacentChapters && currentIndex < adjacentChapters.length - 1 ? adjacentChapters[currentIndex + 1] : null
+    // 2. Adjacent Chapters for Navigation (precomputed by refresh_chapter_links at sync time)
+    let prevChapter: { id: string } | null = chapter.prev_chapter_id ? { id: chapter.prev_chapter_id } : null
+    let nextChapter: { id: string } | null = chapter.next_chapter_id ? { id: chapter.next_chapter_id } : null
+
+    if (chapter.ordinal == null) {
+        // Links not built yet for this series: scan its chapter list
+        const { data: adjacentChapters } = await supabase
+            .from('chapters')
+            .select('id, chapter_number')
+            .eq('series_id', chapter.series_id)
+            .order('chapter_number', { ascending: true })
+
+        const currentIndex = adjacentChapters?.findIndex(c => c.id === chapter.id) ?? -1
+        prevChapter = currentIndex > 0 ? adjacentChapters?.[currentIndex - 1] ?? null : null
+        nextChapter = currentIndex !== -1 && adjacentChapters && currentIndex < adjacentChapters.length - 1 ? adjacentChapters[currentIndex + 1] : null
+    }
 
-    // 3. Live Scrape Logic
-    let images: string[] = []
+    // 3. Manifest written by chapter_manifest.py; live scrape only when it is missing
+    let images: string[] = chapter.chapter_pages?.image_urls ?? []
+    // Probed sizes line up with the manifest's image_urls (null where unknown)
+    const dimensions: ({ width: number, height: number } | null)[] = chapter.chapter_pages?.dimensions ?? []
+    // Storage-hosted tiles from transcode_images.py, also in image_urls order (null until transcoded)
+    const variants: (PageVariants | null)[] = chapter.chapter_pages?.variants ?? []
 
     try {
         // Attempt to fetch source page
         const sourceUrl = chapter.source_url
-        if (sourceUrl) {
+        if (sourceUrl && images.length === 0) {
             const response = await fetch(sourceUrl, {
                 headers: {
                     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -120,13 +130,16 @@ export default async function ReaderPage({ params }: ReaderPageProps) {
                 {hasImages ? (
                     <div className="flex flex-col space-y-0">
                         {images.map((src, idx) => (
-                            <img
+                            <ReaderImage
                                 key={idx}
+                                src={src}
                                 // Use LOCAL PROXY to bypass hotlink protection & keep quality
-                                src={`/api/proxy?url=${encodeURIComponent(src)}`}
+                                proxyUrl={`/api/proxy?url=${encodeURIComponent(src)}`}
                                 alt={`Page ${idx + 1}`}
-                                className="w-full h-auto block"
-                                loading="lazy"
+                                width={dimensions[idx]?.width}
+                                height={dimensions[idx]?.height}
+                                variants={variants[idx]}
+                                priority={idx === 0}
                             />
                         ))}
                     </div>
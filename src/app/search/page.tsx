@@ -21,11 +21,9 @@ export default async function SearchPage({ searchParams }: SearchPageProps) {
         )
     }
 
+    // Trigram index over normalized titles (search_index.py), not a sequential ilike scan
     const { data: results, error } = await supabase
-        .from('series')
-        .select('*, chapters(chapter_number)')
-        .ilike('title', `%${query}%`)
-        .limit(50)
+        .rpc('search_series', { query, max_results: 50 })
 
     if (error) {
         console.error('Search error:', error)
@@ -1,21 +1,74 @@
 'use client'
 
 import { useState } from 'react'
-import Image from 'next/image'
+
+// Written by transcode_images.py: one entry per format/width, each cut into the same tiles
+export interface PageVariants {
+    width: number
+    height: number
+    variants: {
+        format: string
+        width: number
+        height: number
+        tiles: { src: string, height: number }[]
+    }[]
+}
 
 interface ReaderImageProps {
     src: string
     proxyUrl: string
     alt: string
     priority?: boolean
+    width?: number
+    height?: number
+    variants?: PageVariants | null
 }
 
-export default function ReaderImage({ src, proxyUrl, alt, priority = false }: ReaderImageProps) {
+// The reader column is max-w-3xl (768px)
+const SIZES = '(min-width: 768px) 768px, 100vw'
+
+function tileSrcSet(variants: PageVariants['variants'], format: string, index: number) {
+    return variants
+        .filter(v => v.format === format && v.tiles[index])
+        .map(v => `${v.tiles[index].src} ${v.width}w`)
+        .join(', ')
+}
+
+export default function ReaderImage({ src, proxyUrl, alt, priority = false, width, height, variants }: ReaderImageProps) {
     const [isLoading, setIsLoading] = useState(true)
     const [hasError, setHasError] = useState(false)
+    // Any tile failing (missing object, bucket down) drops back to the original through the proxy
+    const [useOriginal, setUseOriginal] = useState(false)
 
     if (hasError) return null
 
+    const webp = variants?.variants.filter(v => v.format === 'webp') ?? []
+    if (!useOriginal && webp.length > 0) {
+        const widest = webp.reduce((a, b) => (b.width > a.width ? b : a))
+        const hasAvif = variants!.variants.some(v => v.format === 'avif')
+
+        return (
+            <div className="w-full">
+                {widest.tiles.map((tile, index) => (
+                    <picture key={index}>
+                        {hasAvif && <source type="image/avif" srcSet={tileSrcSet(variants!.variants, 'avif', index)} sizes={SIZES} />}
+                        <img
+                            src={tile.src}
+                            srcSet={tileSrcSet(variants!.variants, 'webp', index)}
+                            sizes={SIZES}
+                            alt={index === 0 ? alt : ''}
+                            width={widest.width}
+                            height={tile.height}
+                            className="w-full h-auto block"
+                            loading={priority && index === 0 ? "eager" : "lazy"}
+                            onError={() => setUseOriginal(true)}
+                        />
+                    </picture>
+                ))}
+            </div>
+        )
+    }
+
     return (
         <div className="relative min-h-[200px] w-full bg-gray-900/50">
             {isLoading && (
@@ -26,6 +79,8 @@ export default function ReaderImage({ src, proxyUrl, alt, priority = false }: Re
             <img
                 src={proxyUrl}
                 alt={alt}
+                width={width}
+                height={height}
                 className={`w-full h-auto block transition-opacity duration-300 ${isLoading ? 'opacity-0' : 'opacity-100'}`}
                 loading={priority ? "eager" : "lazy"}
                 referrerPolicy="no-referrer"
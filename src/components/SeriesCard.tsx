@@ -1,11 +1,18 @@
+'use client'
+
+import { useState } from 'react'
 import Link from 'next/link'
 
 interface Series {
     id: string
     title: string
     cover_image_url: string
+    // Written by cover_thumbnails.py, keyed by width
+    cover_thumbs?: Record<string, string> | null
+    cover_placeholder?: string | null
     rating?: number
-    chapters?: { chapter_number: number }[]
+    // Maintained on the series row by refresh_series_summary
+    latest_chapter_number?: number | null
 }
 
 interface SeriesCardProps {
@@ -13,17 +20,29 @@ interface SeriesCardProps {
 }
 
 export default function SeriesCard({ series }: SeriesCardProps) {
-    const latestChapter = series.chapters && series.chapters.length > 0
-        ? Math.max(...series.chapters.map(c => c.chapter_number))
-        : 0;
+    const latestChapter = series.latest_chapter_number ?? 0;
+
+    // A thumbnail that fails to load (deleted object, storage outage) falls back to the original cover
+    const [thumbFailed, setThumbFailed] = useState(false)
+    const thumbs = thumbFailed ? null : series.cover_thumbs
+    const coverSrc = thumbs?.['320']
+        ?? (series.cover_image_url ? `https://wsrv.nl/?url=${series.cover_image_url}` : 'https://via.placeholder.com/300x450')
+    const coverSrcSet = thumbs ? Object.entries(thumbs).map(([width, url]) => `${url} ${width}w`).join(', ') : undefined
 
     return (
         <Link href={`/series/${series.id}`} className="group relative overflow-hidden rounded-xl bg-gray-900 border border-white/5 transition-transform duration-300 hover:scale-105 hover:shadow-2xl hover:shadow-purple-500/20 flex flex-col cursor-pointer h-full">
-            <div className="aspect-[2/3] w-full overflow-hidden relative">
+            <div
+                className="aspect-[2/3] w-full overflow-hidden relative bg-cover bg-center"
+                style={series.cover_placeholder ? { backgroundImage: `url('${series.cover_placeholder}')` } : undefined}
+            >
                 {/* Use img for external URLs */}
                 <img
-                    src={series.cover_image_url ? `https://wsrv.nl/?url=${series.cover_image_url}` : 'https://via.placeholder.com/300x450'}
+                    src={coverSrc}
+                    srcSet={coverSrcSet}
+                    sizes="(min-width: 1280px) 16vw, (min-width: 768px) 25vw, 50vw"
+                    loading="lazy"
                     alt={series.title}
+                    onError={thumbs ? () => setThumbFailed(true) : undefined}
                     className="absolute inset-0 w-full h-full object-cover transition-transform duration-500 group-hover:scale-110"
                 />
                 {/* Subtle gradient so title is always readable */}
@@ -0,0 +1,360 @@
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import cloudscraper
+import requests
+from dotenv import load_dotenv
+
+import pg_loader
+from local_mirror import LocalMirror
+from page_parsers import ParsePool, PARSE_WORKERS, parse_listing, parse_universal
+from retry_policy import policy
+from search_index import index_series
+from series_summary import refresh_series_summary
+
+load_dotenv('.env.local')
+
+SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+SUPABASE_KEY = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+
+if not SUPABASE_URL or not SUPABASE_KEY:
+    print("Error: Missing Supabase credentials in .env.local")
+    exit(1)
+
+HEADERS = {
+    "apikey": SUPABASE_KEY,
+    "Authorization": f"Bearer {SUPABASE_KEY}",
+    "Content-Type": "application/json",
+    "Prefer": "return=representation"
+}
+
+# Two phases, each retryable on its own:
+#   crawl: source site -> staging/<run>/part-*.jsonl.gz (never touches Supabase)
+#   load:  staging/<run> -> dedupe across the whole run -> batched, parallel Supabase writes
+# Loading is idempotent (merge/ignore-duplicates), so a run can be replayed as often as needed.
+
+STAGING_DIR = os.getenv("STAGING_DIR", os.path.join(os.getcwd(), 'staging'))
+DEFAULT_LISTING_URL = "https://asuracomic.net/series?page="
+RECORDS_PER_PART = 5000
+BATCH_BYTES = 256 * 1024  # Request body budget per insert
+BATCH_ROWS = 1000
+MAX_FAILED_PAGES = 3  # Consecutive listing pages that still fail after retries before giving up
+DONE = object()
+
+# --- Staging Files ---
+
+class StagingWriter:
+    """Appends records to gzip JSONL parts; a part only gets its final name once it is complete."""
+
+    def __init__(self, run_dir):
+        os.makedirs(run_dir, exist_ok=True)
+        self.run_dir = run_dir
+        # Re-crawling into an existing run appends new parts after the old ones
+        self.part = len([f for f in os.listdir(run_dir) if f.endswith(".jsonl.gz")])
+        self.count = 0
+        self.file = None
+
+    def _path(self):
+        return os.path.join(self.run_dir, f"part-{self.part:05d}.jsonl.gz")
+
+    def write(self, record):
+        if self.file is None:
+            self.file = gzip.open(self._path() + ".tmp", 'wt', encoding='utf-8')
+        self.file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+        self.count += 1
+        if self.count >= RECORDS_PER_PART:
+            self.flush()
+
+    def flush(self):
+        if self.file is None:
+            return
+        self.file.close()
+        os.replace(self._path() + ".tmp", self._path())
+        self.file = None
+        self.count = 0
+        self.part += 1
+
+def read_run(run_dir):
+    for filename in sorted(os.listdir(run_dir)):
+        if not filename.endswith(".jsonl.gz"):
+            continue  # .tmp parts are from a crawl that died mid-write
+        with gzip.open(os.path.join(run_dir, filename), 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def resolve_run(run):
+    if run != "latest":
+        return run if os.path.isdir(run) else os.path.join(STAGING_DIR, run)
+    runs = sorted(d for d in os.listdir(STAGING_DIR) if os.path.isdir(os.path.join(STAGING_DIR, d)))
+    if not runs:
+        print(f"Error: No staged runs in {STAGING_DIR}")
+        exit(1)
+    return os.path.join(STAGING_DIR, runs[-1])
+
+# --- Phase 1: Crawl ---
+
+async def crawl(base_url, run_dir, with_chapters=True, source_concurrency=2, max_pages=None,
+                delay=(1, 3), parse_workers=PARSE_WORKERS):
+    print(f"=== Crawl -> {run_dir} ===")
+    writer = StagingWriter(run_dir)
+    pool = ParsePool(parse_workers)
+    host_limits = defaultdict(lambda: asyncio.Semaphore(source_concurrency))
+    series_queue = asyncio.Queue(maxsize=64)
+    stats = {"series": 0, "chapters": 0, "failed": 0}
+    fetchers = max(source_concurrency * 2, 1)
+
+    async def fetch(scraper, url):
+        async with host_limits[urlparse(url).netloc]:
+            response = await asyncio.to_thread(policy.request, scraper, "GET", url, timeout=30)
+            await asyncio.sleep(random.uniform(*delay))
+        if response.status_code != 200:
+            raise RuntimeError(f"Status {response.status_code}")
+        return response.content
+
+    async def crawl_listing():
+        scraper = cloudscraper.create_scraper()
+        page = 1
+        failed_pages = 0
+        while max_pages is None or page <= max_pages:
+            target_url = f"{base_url}{page}"
+            try:
+                entries = (await pool.parse_async(parse_listing, await fetch(scraper, target_url), target_url))["series"]
+            except Exception as e:
+                # A page that fails even after retries is skipped, not taken as the end of the library
+                failed_pages += 1
+                print(f"[PAGE {page}] [ERROR] {e} ({failed_pages}/{MAX_FAILED_PAGES} in a row)")
+                if failed_pages >= MAX_FAILED_PAGES:
+                    break
+                page += 1
+                continue
+            failed_pages = 0
+            if not entries:
+                print(f"[PAGE {page}] Found 0 series. Assuming end of library.")
+                break
+            print(f"[PAGE {page}] Found {len(entries)} series.")
+            for entry in entries:
+                writer.write({"type": "series", **entry})
+                stats["series"] += 1
+                if with_chapters:
+                    await series_queue.put(entry)
+            page += 1
+        for _ in range(fetchers):
+            await series_queue.put(DONE)
+
+    async def crawl_series():
+        scraper = cloudscraper.create_scraper()
+        while True:
+            entry = await series_queue.get()
+            if entry is DONE:
+                return
+            try:
+                html = await fetch(scraper, entry['source_url'])
+                chapters = (await pool.parse_async(parse_universal, html, entry['source_url']))["chapters"]
+            except Exception as e:
+                print(f"  [ERROR] {entry['title']}: {e}")
+                stats["failed"] += 1
+                continue
+            for chapter_number, url in chapters:
+                writer.write({"type": "chapter", "series_url": entry['source_url'],
+                              "chapter_number": chapter_number, "source_url": url})
+            stats["chapters"] += len(chapters)
+
+    started = time.perf_counter()
+    await asyncio.gather(crawl_listing(), *[crawl_series() for _ in range(fetchers)])
+    writer.flush()
+    pool.close()
+
+    print(f"Staged {stats['series']} series and {stats['chapters']} chapters in {writer.part} parts "
+          f"({stats['failed']} series pages failed) in {time.perf_counter() - started:.0f}s.")
+
+# --- Phase 2: Load ---
+
+def dedupe(records):
+    # Later records win, so a re-crawl appended to the same run overrides older data
+    series = {}
+    chapters = {}
+    for record in records:
+        if record['type'] == 'series':
+            series[record['source_url']] = record
+        elif record['type'] == 'chapter':
+            chapters[(record['series_url'], float(record['chapter_number']))] = record
+    return series, chapters
+
+def batches(rows):
+    """Splits rows so each request body stays under BATCH_BYTES (and BATCH_ROWS)."""
+    batch, size = [], 0
+    for row in rows:
+        row_size = len(json.dumps(row)) + 1
+        if batch and (size + row_size > BATCH_BYTES or len(batch) >= BATCH_ROWS):
+            yield batch
+            batch, size = [], 0
+        batch.append(row)
+        size += row_size
+    if batch:
+        yield batch
+
+def post_batch(path, prefer, batch):
+    headers = HEADERS.copy()
+    headers['Prefer'] = prefer
+    # Upserts against a unique key can be resent; plain inserts only when they never arrived
+    response = policy.request(requests, "POST", f"{SUPABASE_URL}/rest/v1/{path}", headers=headers, json=batch, timeout=60,
+                              idempotent="on_conflict=" in path)
+    response.raise_for_status()
+    return response.json() if response.content else []
+
+def write_all(executor, path, prefer, rows):
+    jobs = [executor.submit(post_batch, path, prefer, batch) for batch in batches(rows)]
+    written, failed = [], 0
+    for job in jobs:
+        try:
+            written.extend(job.result())
+        except Exception as e:
+            print(f"  [ERROR] {path} batch failed: {e}")
+            failed += 1
+    return written, failed
+
+def load(run_dir, workers=4, dry_run=False, backend="rest"):
+    print(f"=== Load <- {run_dir} ({backend}) ===")
+    series, chapters = dedupe(read_run(run_dir))
+    print(f"Staged run holds {len(series)} series and {len(chapters)} chapters after dedupe.")
+    if dry_run:
+        return
+
+    mirror = LocalMirror()
+    mirror.sync()
+    now = datetime.now(timezone.utc).isoformat()
+
+    if backend == "copy":
+        load_copy(mirror, series, chapters, now)
+        return
+
+    # Title is the series key everywhere else (bulk_import / scraper), so match on it here too.
+    # Staged records are keyed by URL, and one series can be crawled under several URL forms:
+    # group them by title so each title is written once (the last staged record wins, as in dedupe)
+    # and resolves to one series id, the same one pg_loader's merge picks (see series_by_title).
+    by_title = {}
+    for url, record in series.items():
+        by_title[record['title']] = (url, record)
+
+    existing, new = [], []
+    ids_by_title = {}
+    for title, (url, record) in by_title.items():
+        known = mirror.series_by_title(title)
+        if known:
+            ids_by_title[title] = known['id']
+            # Existing rows keep their (possibly repaired) description
+            existing.append({"id": known['id'], "title": title, "cover_image_url": record['cover_image_url'],
+                             "status": "ongoing", "updated_at": now})
+        else:
+            new.append({"title": title, "description": f"Imported from {url}",
+                        "cover_image_url": record['cover_image_url'], "status": "ongoing", "updated_at": now})
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        updated, f1 = write_all(executor, "series?on_conflict=id", "resolution=merge-duplicates,return=representation", existing)
+        inserted, f2 = write_all(executor, "series", "return=representation", new)
+        failed += f1 + f2
+        mirror.record_series(*updated, *inserted)
+        for row in inserted:
+            ids_by_title[row['title']] = row['id']
+        print(f"Series: updated {len(updated)}, inserted {len(inserted)}.")
+
+        rows = []
+        known_numbers = {}
+        for (series_url, chapter_number), record in chapters.items():
+            if series_url not in series:
+                continue
+            series_id = ids_by_title.get(series[series_url]['title'])
+            if not series_id:
+                continue
+            if series_id not in known_numbers:
+                known_numbers[series_id] = mirror.chapter_numbers(series_id)
+            if chapter_number in known_numbers[series_id]:
+                continue
+            # The same chapter staged under two URL forms of one series goes in once
+            known_numbers[series_id].add(chapter_number)
+            rows.append({"series_id": series_id, "title": f"Chapter {chapter_number:g}",
+                         "chapter_number": chapter_number, "source_url": record['source_url']})
+
+        added, f3 = write_all(executor, "chapters", "resolution=ignore-duplicates,return=representation", rows)
+        failed += f3
+        mirror.record_chapters(added)
+        print(f"Chapters: {len(rows)} missing, inserted {len(added)}.")
+
+    touched = {row['series_id'] for row in added} | {row['id'] for row in inserted}
+    if touched:
+        refresh_series_summary(touched)
+    index_series(updated + inserted)
+
+    if failed:
+        print(f"[WARN] {failed} batches failed; replay with: python staged_import.py load {os.path.basename(run_dir)}")
+        exit(1)
+    print("Load complete.")
+
+def load_copy(mirror, series, chapters, now):
+    """Same merge as the REST path, but COPY'd straight into Postgres in one transaction (pg_loader.py)."""
+    series_rows = [{"title": record['title'], "description": f"Imported from {url}",
+                    "cover_image_url": record['cover_image_url'], "status": "ongoing", "updated_at": now}
+                   for url, record in series.items()]
+    chapter_rows = [{"series_title": series[series_url]['title'], "chapter_number": chapter_number,
+                     "title": f"Chapter {chapter_number:g}", "source_url": record['source_url']}
+                    for (series_url, chapter_number), record in chapters.items() if series_url in series]
+
+    conn = pg_loader.connect()
+    started = time.perf_counter()
+    touched, added = pg_loader.load_rows(conn, series_rows, chapter_rows)
+    elapsed = time.perf_counter() - started
+    conn.close()
+
+    # The merge returns the stored description, so repaired series keep theirs in the mirror too
+    mirror.record_series(*[{k: row[k] for k in ("id", "title", "description")} for row in touched])
+    mirror.record_chapters(added)
+    index_series(touched)
+    inserted = sum(1 for row in touched if row['inserted'])
+    print(f"Series: updated {len(touched) - inserted}, inserted {inserted}. Chapters: inserted {len(added)}. "
+          f"({(len(series_rows) + len(chapter_rows)) / max(elapsed, 1e-9):.0f} rows/sec)")
+    print("Load complete.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl to staging files, then bulk-load them into Supabase.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    crawl_parser = sub.add_parser("crawl", help="Fetch and parse pages into a new staged run")
+    crawl_parser.add_argument("--url", default=DEFAULT_LISTING_URL, help="Listing URL, page number is appended")
+    crawl_parser.add_argument("--run", help="Run name (default: UTC timestamp)")
+    crawl_parser.add_argument("--max-pages", type=int)
+    crawl_parser.add_argument("--no-chapters", action="store_true", help="Only stage the listing pages")
+    crawl_parser.add_argument("--source-concurrency", type=int, default=2, help="Parallel fetches per source host")
+    crawl_parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS)
+    crawl_parser.add_argument("--load", action="store_true", help="Load the run right after crawling")
+
+    load_parser = sub.add_parser("load", help="Write a staged run to Supabase (safe to repeat)")
+    load_parser.add_argument("run", nargs="?", default="latest", help="Run name or directory")
+    load_parser.add_argument("--workers", type=int, default=4, help="Parallel insert requests")
+    load_parser.add_argument("--dry-run", action="store_true", help="Only report what the run contains")
+    load_parser.add_argument("--backend", choices=["rest", "copy"], default="rest",
+                             help="copy = direct Postgres COPY + set-based merge (needs SUPABASE_DB_URL)")
+
+    args = parser.parse_args()
+
+    if args.command == "crawl":
+        run_dir = os.path.join(STAGING_DIR, args.run or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"))
+        asyncio.run(crawl(args.url, run_dir, not args.no_chapters, args.source_concurrency, args.max_pages,
+                          parse_workers=args.parse_workers))
+        if args.load:
+            load(run_dir)
+    else:
+        load(resolve_run(args.run), args.workers, args.dry_run, args.backend)
+
+if __name__ == "__main__":
+    main()
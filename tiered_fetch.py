@@ -0,0 +1,224 @@
+import asyncio
+import json
+import os
+import re
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+import httpx
+
+from retry_policy import policy
+from run_metrics import metrics
+
+# One fetch path for every scraper:
+#   1. plain HTTP (pooled client) -> done if the page already has the content markers
+#   2. shared headless browser    -> only when the markers are missing (JS-rendered / challenge page)
+# Which tier worked is remembered per URL pattern, so e.g. every series page after the first
+# goes straight to the right tier. Browser-only patterns re-probe HTTP now and then.
+
+TIER_MEMORY_PATH = os.getenv("FETCH_TIERS_PATH", os.path.join(os.getcwd(), 'fetch_tiers.json'))
+REPROBE_EVERY = 25
+
+SOURCE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+# Regexes over the raw HTML; a page "has content" when any of them matches
+HOMEPAGE_MARKERS = [r'border-b-\[#312f40\]']
+SERIES_MARKERS = [r'href="[^"]*/chapter/']
+READER_MARKERS = [r'id="readerarea"', r'class="[^"]*reading-content', r'wp-manga-chapter-img']
+
+# Element the browser tier waits for before taking the DOM
+HOMEPAGE_WAIT = r'div.border-b-\[\#312f40\]'
+SERIES_WAIT = 'a[href*="/chapter/"]'
+READER_WAIT = '#readerarea'
+
+# Response bodies worth keeping when a caller asks for captured data
+CAPTURE_TYPES = re.compile(r'json|x-component')
+
+class FetchResult:
+    def __init__(self, url, status, content, tier, captured=None, content_type=None):
+        self.url = url
+        self.status = status
+        self.content = content
+        self.tier = tier
+        self.captured = captured or []  # JSON / RSC response bodies the browser saw while loading
+        self.content_type = content_type or "text/html; charset=utf-8"
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    @property
+    def status_code(self):
+        return self.status  # So it reads like a requests response in the sync scripts
+
+def url_pattern(url):
+    """asuracomic.net/series/foo-8a65/chapter/12 -> asuracomic.net/series/*/chapter/*"""
+    parsed = urlparse(url)
+    parts = [p for p in parsed.path.split('/') if p]
+    pattern = [p if i % 2 == 0 and not any(ch.isdigit() for ch in p) else '*' for i, p in enumerate(parts)]
+    return "/".join([parsed.netloc] + pattern)
+
+def has_markers(content, markers):
+    text = content.decode('utf-8', errors='replace') if isinstance(content, bytes) else content
+    return any(re.search(marker, text) for marker in markers)
+
+class TieredFetcher:
+    """
+    client:  pooled httpx.AsyncClient for the HTTP tier
+    browser: BrowserManager for the browser tier (one is started on first need if None)
+    session: optional blocking requests-style session (e.g. cloudscraper) to use for the HTTP tier instead
+    archive: optional PageArchive; only results that have the markers go in, whichever tier they came
+             from, so a replay never gets the empty HTTP page of a JS-rendered series
+    """
+
+    def __init__(self, client, browser=None, session=None, memory_path=TIER_MEMORY_PATH, archive=None):
+        self.client = client
+        self.browser = browser
+        self.session = session
+        self.archive = archive
+        self.memory_path = memory_path
+        self.memory = self._load_memory()
+        self.counts = Counter()
+        self._own_browser = browser is None
+
+    def _load_memory(self):
+        try:
+            with open(self.memory_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save(self):
+        tmp_path = self.memory_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.memory, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.memory_path)
+
+    # --- Tiers ---
+
+    async def _http(self, url):
+        host = urlparse(url).netloc
+        with metrics.timer("fetch", tier="http", host=host):
+            # Transient errors are retried here; only a page that loads without the markers escalates
+            if self.session is not None:
+                response = await asyncio.to_thread(policy.request, self.session, "GET", url, timeout=30)
+            else:
+                response = await policy.arequest(self.client, "GET", url, headers=SOURCE_HEADERS, timeout=30,
+                                                 follow_redirects=True)
+        metrics.count("fetch_bytes", len(response.content), tier="http", host=host)
+        metrics.count("fetch_status", tier="http", host=host, status=response.status_code)
+        return FetchResult(url, response.status_code, response.content, "http",
+                           content_type=response.headers.get("Content-Type"))
+
+    async def _browser(self, url, wait_for, capture=False):
+        from quick_scrape import load_page
+        if self.browser is None:
+            # Chromium itself only starts when the first page is requested
+            from browser_manager import BrowserManager
+            self.browser = BrowserManager()
+        host = urlparse(url).netloc
+        responses = []
+        async with self.browser.page() as page:
+            if capture:
+                page.on("response", lambda response: responses.append(response)
+                        if CAPTURE_TYPES.search(response.headers.get("content-type", "")) else None)
+            with metrics.timer("fetch", tier="browser", host=host):
+                await load_page(page, url, wait_for)
+                content = (await page.content()).encode('utf-8')
+                captured = []
+                for response in responses:
+                    try:
+                        captured.append(await response.text())
+                    except Exception:
+                        continue  # Redirects and aborted requests have no body
+        metrics.count("fetch_bytes", len(content), tier="browser", host=host)
+        return FetchResult(url, 200, content, "browser", captured)
+
+    # --- Public ---
+
+    async def fetch(self, url, markers, wait_for=None, capture=False):
+        """
+        Cheapest tier whose response contains the markers; the last attempt's result otherwise.
+        capture: keep the JSON/RSC responses the browser tier receives (result.captured).
+        """
+        pattern = url_pattern(url)
+        entry = self.memory.setdefault(pattern, {"tier": "http", "since_probe": 0})
+
+        try_http = entry["tier"] == "http" or entry["since_probe"] >= REPROBE_EVERY
+        result = None
+        if try_http:
+            try:
+                result = await self._http(url)
+                if result.status == 200 and has_markers(result.content, markers):
+                    entry.update(tier="http", since_probe=0)
+                    self.counts["http"] += 1
+                    self._archive(result)
+                    return result
+            except Exception as e:
+                print(f"  [FETCH] HTTP failed for {url}: {e}")
+            entry["since_probe"] = 0
+        else:
+            entry["since_probe"] += 1
+
+        result = await self._browser(url, wait_for, capture)
+        if has_markers(result.content, markers):
+            entry["tier"] = "browser"
+            self._archive(result)
+        self.counts["browser"] += 1
+        self.counts["escalated"] += try_http
+        if try_http:
+            metrics.count("fetch_escalations", host=urlparse(url).netloc)
+        return result
+
+    def _archive(self, result):
+        if self.archive is None:
+            return
+        try:
+            self.archive.put(result.url, result.status, result.content, result.content_type)
+        except Exception as e:
+            print(f"  [WARN] Archive write failed for {result.url}: {e}")
+
+    def summary(self):
+        total = self.counts["http"] + self.counts["browser"]
+        line = (f"[FETCH] {total} pages: {self.counts['http']} via HTTP, {self.counts['browser']} via browser "
+                f"({self.counts['escalated']} escalated).")
+        if self.browser is not None:
+            line += "\n" + self.browser.summary()
+        return line
+
+    async def close(self):
+        self.save()
+        if self._own_browser and self.browser is not None:
+            await self.browser.close()
+
+class BlockingFetcher:
+    """
+    TieredFetcher for the synchronous scripts: get() stands in for scraper.get() and returns the
+    FetchResult of the cheapest tier whose page has the markers (series pages by default).
+    session: blocking requests-style session for the HTTP tier (cloudscraper)
+    archive: optional PageArchive for the results that have the markers (see TieredFetcher)
+    """
+
+    def __init__(self, session, markers=SERIES_MARKERS, wait_for=SERIES_WAIT, archive=None):
+        self.loop = asyncio.new_event_loop()
+        self.fetcher = TieredFetcher(None, session=session, archive=archive)
+        self.markers = markers
+        self.wait_for = wait_for
+
+    def get(self, url, markers=None, wait_for=None, **kwargs):
+        return self.loop.run_until_complete(self.fetcher.fetch(url, markers or self.markers, wait_for or self.wait_for))
+
+    def pause(self, seconds):
+        time.sleep(seconds)
+
+    def summary(self):
+        return self.fetcher.summary()
+
+    def close(self):
+        self.loop.run_until_complete(self.fetcher.close())
+        self.loop.close()
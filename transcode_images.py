@@ -0,0 +1,142 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import requests
+from PIL import Image, features
+
+from image_cache import ImageCache, fetch_into_cache, SUPABASE_URL, HEADERS
+import object_storage
+from retry_policy import policy
+
+# Local staging only: tiles are uploaded to storage and served from there (Next serves just
+# what was in public/ at build time, so files written next to a running app never show up)
+VARIANTS_DIR = os.getenv("IMAGE_VARIANTS_DIR", os.path.join(os.getcwd(), 'variants'))
+VARIANTS_BUCKET = os.getenv("IMAGE_VARIANTS_BUCKET", "variants")
+
+WIDTHS = [360, 720, 1080]
+TILE_HEIGHT = 2048  # Long strips are cut into tiles no taller than this (in output pixels)
+WEBP_QUALITY = 80
+AVIF_QUALITY = 60
+
+# --- Worker (runs in the process pool) ---
+
+def transcode(src_path, digest, formats, widths=WIDTHS, tile_height=TILE_HEIGHT):
+    """Decodes one source image once and writes every width/format/tile variant of it."""
+    out_dir = os.path.join(VARIANTS_DIR, digest[:2], digest)
+    os.makedirs(out_dir, exist_ok=True)
+
+    with Image.open(src_path) as img:
+        source_format = img.format
+        img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    src_width, src_height = img.size
+    # Never upscale; the source width stands in for any larger target
+    targets = sorted({min(w, src_width) for w in widths})
+
+    # Cut every width at the same relative positions (tile_height apart at the widest), so tile N
+    # covers the same strip at each width and the reader can offer them as one srcset
+    widest = round(src_height * targets[-1] / src_width)
+    cuts = [top / widest for top in range(0, widest, tile_height)] + [1.0]
+
+    variants = []
+    for width in targets:
+        height = round(src_height * width / src_width)
+        resized = img if width == src_width else img.resize((width, height), Image.LANCZOS)
+        bounds = [round(cut * height) for cut in cuts]
+
+        for fmt in formats:
+            tiles = []
+            for index, (top, bottom) in enumerate(zip(bounds, bounds[1:])):
+                name = f"w{width}_{index}.{fmt}"
+                tile = resized.crop((0, top, width, bottom))
+                if fmt == 'avif':
+                    tile.save(os.path.join(out_dir, name), 'AVIF', quality=AVIF_QUALITY)
+                else:
+                    tile.save(os.path.join(out_dir, name), 'WEBP', quality=WEBP_QUALITY, method=4)
+                tiles.append({
+                    "key": f"{digest[:2]}/{digest}/{name}",
+                    "height": bottom - top
+                })
+            variants.append({"format": fmt, "width": width, "height": height, "tiles": tiles})
+
+    return {
+        "width": src_width,
+        "height": src_height,
+        "format": (source_format or "").lower(),
+        "variants": variants
+    }
+
+# --- Database Helpers ---
+
+def get_pending_manifests(limit):
+    url = (f"{SUPABASE_URL}/rest/v1/chapter_pages?select=chapter_id,image_urls"
+           f"&variants=is.null&order=resolved_at.desc&limit={limit}")
+    response = policy.request(requests, 'GET', url, headers=HEADERS)
+    response.raise_for_status()
+    return response.json()
+
+def save_variants(chapter_id, variants):
+    url = f"{SUPABASE_URL}/rest/v1/chapter_pages?chapter_id=eq.{chapter_id}"
+    headers = HEADERS.copy()
+    headers['Prefer'] = 'return=minimal'
+    response = policy.request(requests, 'PATCH', url, headers=headers, json={"variants": variants}, idempotent=True)
+    response.raise_for_status()
+
+# --- Pipeline ---
+
+def upload_tile(tile):
+    key = tile.pop("key")
+    tile["src"] = object_storage.upload_file(VARIANTS_BUCKET, key, os.path.join(VARIANTS_DIR, key))
+    os.remove(os.path.join(VARIANTS_DIR, key))
+
+def transcode_chapter(cache, pool, fetchers, manifest, formats):
+    # Downloads, uploads (or cache hits) overlap on threads; CPU work goes to the process pool
+    sources = list(fetchers.map(lambda u: fetch_into_cache(cache, u), manifest['image_urls']))
+    jobs = [pool.submit(transcode, path, digest, formats) for path, digest, _, _ in sources]
+    pages = [job.result() for job in jobs]
+    tiles = [tile for page in pages for variant in page['variants'] for tile in variant['tiles']]
+    list(fetchers.map(upload_tile, tiles))
+    return pages
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcode chapter images into responsive WebP/AVIF tiles.")
+    parser.add_argument("--chapters", type=int, default=50, help="Manifests to process this run")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Transcoding processes")
+    parser.add_argument("--avif", action="store_true", help="Also emit AVIF when Pillow supports it")
+    args = parser.parse_args()
+    object_storage.require_service_key()
+
+    formats = ['webp']
+    if args.avif:
+        if features.check('avif'):
+            formats.append('avif')
+        else:
+            print("[WARN] This Pillow build has no AVIF support, emitting WebP only.")
+
+    print("=== Chapter Image Transcoder ===")
+    manifests = get_pending_manifests(args.chapters)
+    print(f"Found {len(manifests)} chapters without variants. Using {args.workers} workers.")
+
+    cache = ImageCache()
+    images_done = 0
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool, ThreadPoolExecutor(max_workers=8) as fetchers:
+        for manifest in manifests:
+            try:
+                variants = transcode_chapter(cache, pool, fetchers, manifest, formats)
+                save_variants(manifest['chapter_id'], variants)
+                images_done += len(variants)
+                print(f"  [SUCCESS] Chapter {manifest['chapter_id']}: {len(variants)} images")
+            except Exception as e:
+                print(f"  [ERROR] Chapter {manifest['chapter_id']}: {e}")
+
+    elapsed = time.perf_counter() - started
+    rate = images_done / elapsed if elapsed else 0
+    print(f"Transcoded {images_done} images in {elapsed:.1f}s "
+          f"({rate:.2f} images/sec, {rate / args.workers:.2f} images/sec/core).")
+
+if __name__ == "__main__":
+    main()